@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BrainboxConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'brainbox'
+
+    def ready(self):
+        from brainbox import signals, tasks  # noqa: F401
@@ -0,0 +1,98 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from rest_framework import mixins
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from brainbox import metrics
+from brainbox.caching import get_response_cache
+
+
+class AsyncReadEndpoint(View):
+    """
+    Async, GET-only twin of a cached DRF read endpoint (`endpoint`) for
+    ASGI servers, so one process can hold many slow clients without a
+    thread each.
+
+    It reuses the endpoint's queryset, serializer, pagination, validators
+    and response cache. Keyset pages are fetched with the async ORM. The
+    synchronous parts run in worker threads, so the event loop never
+    blocks on them:
+    - the validator query
+    - page number counts
+    - detail prefetches
+    - serialization
+    - rendering
+
+    Responses are always JSON.
+    """
+    endpoint = None
+    renderer_class = JSONRenderer
+
+    async def get(self, request, *args, **kwargs):
+        view = self.endpoint()
+        view.args, view.kwargs, view.format_kwarg = args, kwargs, None
+        view.headers = view.default_response_headers
+        view.request = drf_request = view.initialize_request(request, *args, **kwargs)
+        try:
+            # Authentication, permissions and throttling may hit the database.
+            await sync_to_async(view.initial)(drf_request, *args, **kwargs)
+            drf_request.accepted_renderer = self.renderer_class()
+            drf_request.accepted_media_type = drf_request.accepted_renderer.media_type
+            response = await self.respond(view, drf_request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+
+        response = view.finalize_response(drf_request, response, *args, **kwargs)
+        if isinstance(response, Response):
+            await sync_to_async(response.render, thread_sensitive=False)()
+        return response
+
+    async def respond(self, view, request):
+        version, last_modified = await sync_to_async(view.get_data_version)()
+        if version is None:
+            raise Http404
+        key, etag = view.get_etag(request, version)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            metrics.observe_cache(request, 'not_modified')
+            return not_modified
+
+        cache = get_response_cache()
+        entry = await cache.aget(key)
+        metrics.observe_cache(request, 'miss' if entry is None else 'hit')
+        if entry is None:
+            if issubclass(self.endpoint, mixins.ListModelMixin):
+                data = await self.list(view)
+            else:
+                data = await self.retrieve(view)
+            renderer = request.accepted_renderer
+            content = await sync_to_async(renderer.render, thread_sensitive=False)(
+                data, request.accepted_media_type, view.get_renderer_context()
+            )
+            entry = (content, renderer.media_type, last_modified or int(time.time()))
+            await cache.aset(key, entry, timeout=getattr(settings, 'BRAINBOX_RESPONSE_CACHE_TTL', 300))
+
+        content, content_type, last_modified = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+    async def list(self, view):
+        queryset = view.filter_queryset(view.get_queryset())
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+        return await sync_to_async(
+            lambda: view.get_paginated_response(view.get_serializer(page, many=True).data).data
+        )()
+
+    async def retrieve(self, view):
+        # Detail querysets prefetch their collections, which the async ORM
+        # cannot do yet.
+        return await sync_to_async(lambda: view.get_serializer(view.get_object()).data)()
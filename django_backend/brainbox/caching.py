@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[getattr(settings, 'BRAINBOX_CACHE', 'default')]
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'BRAINBOX_RESPONSE_CACHE', getattr(settings, 'BRAINBOX_CACHE', 'default'))]
+
+
+def _version_key(model):
+    return f'brainbox:version:{model._meta.label_lower}'
+
+
+def model_version(model):
+    """
+    Generation number of `model`, bumped whenever rows are saved or
+    deleted. Cache keys embed it so stale entries are simply never read
+    again instead of having to be found and deleted.
+    """
+    cache = get_cache()
+    version = cache.get(_version_key(model))
+    if version is None:
+        cache.add(_version_key(model), 1, timeout=None)
+        version = cache.get(_version_key(model), 1)
+    return version
+
+
+def bump_model_version(model):
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.add(_version_key(model), 2, timeout=None)
+
+
+def model_versions(models):
+    """
+    Versions of several models, read in one cache round trip.
+    """
+    keys = [_version_key(model) for model in models]
+    found = get_cache().get_many(keys)
+    return [found[key] if key in found else model_version(model) for key, model in zip(keys, models)]
+
+
+def version_since(name, version, floor=None):
+    """
+    Timestamp from which the object `name` has been at `version`: when it
+    was first seen at it (no earlier than `floor`). Anything that changes
+    the version, deletions included, moves it forward, also when the
+    version goes back to an earlier one.
+    """
+    cache = get_cache()
+    key = f'brainbox:since:{name}'
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    since = max(int(time.time()), floor or 0)
+    cache.set(key, (version, since), timeout=None)
+    return since
+
+
+def response_cache_key(request, version, variant=''):
+    """
+    Key for the response to `request`: its path and query parameters
+    (sorted, so their order does not matter) plus `variant`, prefixed by the
+    `version` of the data it is rendered from (see `models_version`).
+    """
+    params = '&'.join(f'{key}={value}' for key, values in sorted(request.GET.lists()) for value in values)
+    digest = hashlib.md5(f'{request.path}?{params}#{variant}'.encode('utf-8')).hexdigest()
+    return f'brainbox:response:{version}:{digest}'
+
+
+def models_version(models):
+    return '.'.join(str(version) for version in model_versions(models))
@@ -0,0 +1,44 @@
+import hashlib
+from datetime import datetime
+
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+
+
+def latest(related_model, fk, field='updated_at'):
+    """
+    Latest `field` among the `related_model` rows pointing at the outer row
+    through `fk`, as a subquery.
+    """
+    return Subquery(
+        related_model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(latest=Max(field)).values('latest')
+    )
+
+
+def checksum(related_model, fk, field):
+    """
+    Sum of `field`, weighted by primary key, over the `related_model` rows
+    pointing at the outer row through `fk`, as a subquery: it changes with
+    the values of `field`, including when some moves from one row to
+    another.
+    """
+    return Subquery(
+        related_model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+            checksum=Sum(F('pk') * F(field))
+        ).values('checksum')
+    )
+
+
+def validator_version(values):
+    """
+    Version string of a row of validator values: any change to one of them
+    changes the version.
+    """
+    return hashlib.md5(repr(tuple(values)).encode('utf-8')).hexdigest()
+
+
+def validator_last_modified(values):
+    """
+    Latest of the datetimes among `values`, as a timestamp.
+    """
+    datetimes = [value for value in values if isinstance(value, datetime)]
+    return int(max(datetimes).timestamp()) if datetimes else None
@@ -0,0 +1,59 @@
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from brainbox.caching import bump_model_version
+from brainbox.models import User, Folder, File, SharedFile
+
+# (model, counter field, counted model, foreign key on the counted model)
+COUNTERS = (
+    (User, 'num_personal_files', File, 'user'),
+    (Folder, 'num_files', File, 'folder'),
+    (File, 'num_shared_users', SharedFile, 'file'),
+)
+
+
+def adjust_counter(model, field, pk, delta):
+    if pk is not None and delta:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def adjust_counters(model, field, deltas):
+    """
+    Apply `{pk: delta}` to `field` of many `model` rows in one UPDATE.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas).update(**{field: F(field) + Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+        default=Value(0), output_field=IntegerField()
+    )})
+
+
+def actual_count(counted_model, fk):
+    return Coalesce(Subquery(
+        counted_model.objects.filter(**{fk: OuterRef('pk')}).values(fk).annotate(count=Count('id')).values('count')
+    ), 0)
+
+
+def counter_drift(model, field, counted_model, fk, using=None):
+    """
+    Rows of `model` whose `field` disagrees with the number of
+    `counted_model` rows pointing at them.
+    """
+    return model.objects.db_manager(using).annotate(actual=actual_count(counted_model, fk)).exclude(**{field: F('actual')})
+
+
+def check_counters(repair=False, using=None):
+    """
+    Return `{'<model>.<field>': number of drifted rows}` for every counter,
+    rewriting the drifted rows with the actual counts when `repair` is set.
+    """
+    report = {}
+    for model, field, counted_model, fk in COUNTERS:
+        drifted = counter_drift(model, field, counted_model, fk, using).values('pk')
+        report[f'{model.__name__}.{field}'] = drifted.count()
+        if repair and report[f'{model.__name__}.{field}']:
+            model.objects.db_manager(using).filter(pk__in=drifted).update(**{field: actual_count(counted_model, fk)})
+            bump_model_version(model)
+    return report
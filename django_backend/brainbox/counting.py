@@ -0,0 +1,64 @@
+import hashlib
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from brainbox.caching import get_cache, models_version
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATE = 'estimate'
+STRATEGIES = (EXACT, CACHED, ESTIMATE)
+
+
+def count_cache_key(name, queryset, params, models=()):
+    """
+    Key for the count of `queryset` as listed by the endpoint `name` with the
+    given filter `params`. It embeds the versions of the queryset's model
+    and of `models`, the other models its filters may join, so saving or
+    deleting a row of any of them makes the cached count unreachable.
+    """
+    normalized = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    digest = hashlib.md5(normalized.encode('utf-8')).hexdigest()
+    models = dict.fromkeys((queryset.model, *models))
+    return f'brainbox:count:{name}:{models_version(models)}:{digest}'
+
+
+def exact_count(queryset):
+    return queryset.count()
+
+
+def cached_count(name, queryset, params, models=()):
+    cache = get_cache()
+    key = count_cache_key(name, queryset, params, models)
+    count = cache.get(key)
+    if count is None:
+        count = exact_count(queryset)
+        cache.set(key, count, timeout=getattr(settings, 'BRAINBOX_COUNT_CACHE_TTL', 300))
+    return count
+
+
+def estimated_count(queryset):
+    """
+    Row count of the model's table read from the planner statistics
+    (`sqlite_stat1` after ANALYZE, `pg_class.reltuples` on PostgreSQL).
+    Returns None when the queryset is filtered or no statistics exist yet.
+    """
+    if queryset.query.where:
+        return None
+
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    try:
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                return int(row[0].split()[0]) if row else None
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                return int(row[0]) if row and row[0] >= 0 else None
+    except DatabaseError:
+        return None
+    return None
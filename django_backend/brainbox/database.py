@@ -0,0 +1,33 @@
+from django.conf import settings
+
+
+def sqlite_pragmas():
+    """
+    `{pragma: value}` applied to every new SQLite connection, from the
+    BRAINBOX_SQLITE_PRAGMAS setting.
+    """
+    return getattr(settings, 'BRAINBOX_SQLITE_PRAGMAS', {})
+
+
+def production_sqlite_pragmas():
+    """
+    `{pragma: value}` of the production profile, from the
+    BRAINBOX_SQLITE_PRODUCTION_PRAGMAS setting, whether or not it is on.
+    """
+    return getattr(settings, 'BRAINBOX_SQLITE_PRODUCTION_PRAGMAS', {})
+
+
+def apply_pragmas(cursor, pragmas):
+    """
+    Run `PRAGMA name = value` for each of `pragmas` on a DB-API cursor.
+    `journal_mode` goes first: WAL is what lets readers and the writer
+    proceed concurrently, and it is persistent in the database file.
+    """
+    for name in sorted(pragmas, key=lambda name: name != 'journal_mode'):
+        cursor.execute(f'PRAGMA {name} = {pragmas[name]}')
+
+
+def configure_connection(connection):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, sqlite_pragmas())
@@ -0,0 +1,165 @@
+import time
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from brainbox.caching import bump_model_version
+from brainbox.counters import adjust_counters
+from brainbox.models import User, Folder, File, SharedFile, FolderClosure, UserStatistics, FolderStatistics
+
+DELETE_BATCH_SIZE = 1000
+
+
+def _raw_delete(queryset):
+    """
+    DELETE the rows of `queryset` in one statement, without loading them or
+    sending signals: the callers below apply the side effects themselves.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def _removed(queryset, key, aggregate):
+    """
+    Counter deltas for removing the rows of `queryset`: minus `aggregate`
+    for every value of `key`.
+    """
+    return {row[key]: -row['total'] for row in queryset.order_by().values(key).annotate(total=aggregate)}
+
+
+def _batches(queryset, batch_size):
+    """
+    Primary keys of `queryset`, `batch_size` at a time, re-querying after
+    each batch is consumed (and deleted).
+    """
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+def delete_shares(ids):
+    """
+    Delete the SharedFile rows `ids`, keeping the shared files' counters and
+    their folders' rollups in step.
+    """
+    shares = SharedFile.objects.filter(pk__in=ids)
+    adjust_counters(File, 'num_shared_users', _removed(shares, 'file_id', Count('id')))
+    adjust_counters(FolderStatistics, 'num_shared_users', _removed(shares, 'file__folder_id', Count('id')))
+    return _raw_delete(shares)
+
+
+def delete_files(ids):
+    """
+    Delete the files `ids` and their shares, keeping the owners' counters
+    and rollups and the folders' counters and rollups in step.
+    """
+    files = File.objects.filter(pk__in=ids)
+    shares = SharedFile.objects.filter(file_id__in=ids)
+    adjust_counters(FolderStatistics, 'num_shared_users', _removed(shares, 'file__folder_id', Count('id')))
+    adjust_counters(User, 'num_personal_files', _removed(files, 'user_id', Count('id')))
+    adjust_counters(UserStatistics, 'written_chars', _removed(files, 'user_id', Sum('content_length')))
+    adjust_counters(Folder, 'num_files', _removed(files, 'folder_id', Count('id')))
+    _raw_delete(shares)
+    return _raw_delete(files)
+
+
+def delete_empty_folders(ids):
+    """
+    Delete the folders `ids`, which must hold no files or subfolders.
+    """
+    _raw_delete(FolderStatistics.objects.filter(folder_id__in=ids))
+    _raw_delete(FolderClosure.objects.filter(Q(ancestor_id__in=ids) | Q(descendant_id__in=ids)))
+    return _raw_delete(Folder.objects.filter(pk__in=ids))
+
+
+class Deletion:
+    """
+    Set-based replacement for Django's cascade collector: deletes rows in
+    batches of `batch_size`, each batch in its own transaction together
+    with its counter and rollup adjustments, so the counters are right
+    between batches and an interrupted deletion can simply be run again.
+    `progress(step, rows, seconds)` is called after every batch with the
+    totals of the step so far.
+    """
+    models = (User, Folder, File, SharedFile, FolderClosure, UserStatistics, FolderStatistics)
+
+    def __init__(self, batch_size=DELETE_BATCH_SIZE, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.report = {}
+        self.started = {}
+
+    def run(self, step, batches, delete):
+        tic = self.started.setdefault(step, time.perf_counter())
+        for ids in batches:
+            with transaction.atomic():
+                self.report[step] = self.report.get(step, 0) + delete(ids)
+            for model in self.models:
+                bump_model_version(model)
+            if self.progress:
+                self.progress(step, self.report[step], time.perf_counter() - tic)
+
+    def files(self, files):
+        self.run('files', _batches(files, self.batch_size), delete_files)
+
+    def folders(self, folders):
+        """
+        Delete `folders`, a set closed under subfolders, leaves first.
+        """
+        while folders.exists():
+            leaves = folders.filter(~Exists(Folder.objects.filter(parent_folder=OuterRef('pk'))))
+            ids = list(leaves.values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                # Only parent cycles are left, which older versions let
+                # through: detach the subfolders of what remains.
+                Folder.objects.filter(parent_folder__in=folders).update(parent_folder=None)
+                continue
+            self.files(File.objects.filter(folder_id__in=ids))
+            self.run('folders', [ids], delete_empty_folders)
+
+    def delete_file(self, file):
+        self.files(File.objects.filter(pk=file.pk))
+        return self.report
+
+    def delete_folder(self, folder):
+        self.folders(Folder.objects.filter(
+            pk__in=FolderClosure.objects.filter(ancestor=folder).values('descendant_id')
+        ))
+        return self.report
+
+    def delete_user(self, user):
+        self.run('shares', _batches(SharedFile.objects.filter(user=user), self.batch_size), delete_shares)
+        self.folders(Folder.objects.filter(
+            pk__in=FolderClosure.objects.filter(ancestor__user=user).values('descendant_id')
+        ))
+        self.files(File.objects.filter(user=user))
+        with transaction.atomic():
+            _raw_delete(UserStatistics.objects.filter(user=user))
+            self.report['users'] = _raw_delete(User.objects.filter(pk=user.pk))
+        for model in self.models:
+            bump_model_version(model)
+        return self.report
+
+
+def delete_file(file, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """
+    Delete `file` with its shares. Returns `{step: rows deleted}`.
+    """
+    return Deletion(batch_size, progress).delete_file(file)
+
+
+def delete_folder(folder, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """
+    Delete `folder` with its subfolders, files and shares. Returns
+    `{step: rows deleted}`.
+    """
+    return Deletion(batch_size, progress).delete_folder(folder)
+
+
+def delete_user(user, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """
+    Delete `user` with their shares, folders and files. Returns
+    `{step: rows deleted}`.
+    """
+    return Deletion(batch_size, progress).delete_user(user)
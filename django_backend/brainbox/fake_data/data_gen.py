@@ -1,252 +1,338 @@
-import time
+"""
+Streaming generator for the brainbox seed dataset.
+
+Every table is produced in fixed-size chunks. Chunk `k` of each table draws
+its owners from the `k`-th slice of user ids, so the folders a file may go
+into (or a folder's possible parents) are always found in the same chunk:
+memory stays bounded by the chunk size and any chunk can be generated on
+its own, by any process, from `(seed, table, k)` alone.
+
+Counter columns are filled in exactly; the statistics rollups are not
+generated, run `manage.py rebuild_statistics` after loading.
+
+    python data_gen.py --users 1000000 --folders 1000000 --files 1000000 \
+        --shares-per-file 10 --workers 8 --seed 42 --output-dir out
+
+`--format csv` writes each chunk as a gzipped CSV part next to a
+`manifest.json`, which `manage.py load_bulk --manifest` imports. Keep the
+directory around to reload the same dataset without regenerating it.
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import multiprocessing
+import os
 import random
+import shutil
+import time
+from collections import Counter
 
 from faker import Faker
-from mdgen import MarkdownPostProvider
-
-fake = Faker()
-fake.add_provider(MarkdownPostProvider)
-fake.seed_instance(random.random())
-unique_number = 0
-
-
-# FOR ALL
-def generate_date_times(num_entities: int, created_dates: list, updated_dates: list):
-    for i in range(num_entities):
-        created_at = fake.date_time_between()
-        updated_at = fake.date_time_between(start_date=created_at)
-        created_dates.append(created_at)
-        updated_dates.append(updated_at)
-
-
-# USER
-def generate_user_usernames(num_entities, usernames: set):
-    global unique_number
-    for i in range(num_entities):
-        username = fake.user_name()
-        if username in usernames:
-            username = username + str(unique_number)
-            unique_number += 1
-        usernames.add(username)
-
-
-def generate_user_emails(num_entities: int, emails: set):
-    global unique_number
-    for i in range(num_entities):
-        email = fake.free_email()
-        if email in emails:
-            email = email.split('@')[0] + str(unique_number) + '@' + email.split('@')[1]
-            unique_number += 1
-        emails.add(email)
-
-
-def generate_user_passwords(num_entities: int, passwords: list):
-    for i in range(num_entities):
-        password = fake.password(length=random.randint(8, 12))
-        passwords.append(password)
-
-
-def generate_user(num_entities: int, batch_size: int):
-    print("Generating users...")
-
-    usernames = set()
-    emails = set()
-    passwords = list()
-    created_dates = list()
-    updated_dates = list()
-
-    tic = time.perf_counter()
-
-    generate_user_usernames(num_entities, usernames)
-    generate_user_emails(num_entities, emails)
-    generate_user_passwords(num_entities, passwords)
-    generate_date_times(num_entities, created_dates, updated_dates)
-
-    print(len(usernames))
-    print(len(emails))
-    print(len(passwords))
-    print(len(created_dates))
-    print(len(updated_dates))
-
-    with open('user_data.sql', 'w') as f:
-        for index, user in enumerate(zip(usernames, emails, passwords, created_dates, updated_dates)):
-            username, email, password, created_at, updated_at = user
-            if index % batch_size == 0:
-                f.write(f"INSERT INTO brainbox_user (username, email, password, created_at, updated_at) VALUES\n")
-            f.write(f"('{username}', '{email}', '{password}', '{created_at}', '{updated_at}'){';' if (index + 1) % batch_size == 0 else ','}\n")
-
-    toc = time.perf_counter()
-    print(f"Generated users in {toc - tic:0.4f} seconds")
-
-
-# FOLDER
-def generate_folder_name(num_entities: int, names: list):
-    names.extend(fake.words(nb=num_entities))
-
-
-def generate_folder_user(num_entities: int, users: list, user_folders: dict):
-    for i in range(num_entities):
-        user = random.randint(0, num_entities - 1)
-        users.append(user)
-        if user in user_folders:
-            user_folders[user].append(i)
-        else:
-            user_folders[user] = [i]
-
 
-def generate_folder_parent_folder(num_entities: int, parent_folders: list, users: list, user_folders: dict):
-    for i in range(num_entities):
-        user = users[i]
-        parent_folder = None
-        prob = random.uniform(0, 1)  # probability to have a parent folder
-        if prob > 0.3:
-            if user in user_folders and len(user_folders[user]) > 1:
-                folders = user_folders[user][:]
-                folders.remove(i)
-                parent_folder = random.choice(folders)
-        parent_folders.append(parent_folder)
+TABLES = ('user', 'folder', 'file', 'sharedfile')
 
+COLUMNS = {
+    'user': ('id', 'username', 'email', 'password', 'num_personal_files', 'created_at', 'updated_at'),
+    'folder': ('id', 'name', 'user_id', 'parent_folder_id', 'num_files', 'created_at', 'updated_at'),
+    'file': ('id', 'name', 'content', 'content_length', 'content_hash', 'user_id', 'folder_id', 'num_shared_users', 'created_at', 'updated_at'),
+    'sharedfile': ('id', 'user_id', 'file_id', 'permission', 'updated_at'),
+}
 
-def generate_folder(num_entities: int, batch_size: int, user_folders: dict):
-    print("Generating folders...")
+MANIFEST = 'manifest.json'
 
-    names = list()
-    users = list()
-    parent_folders = list()
-    created_dates = list()
-    updated_dates = list()
+# Marker for NULL in CSV output, as used by PostgreSQL's COPY.
+CSV_NULL = r'\N'
 
-    tic = time.perf_counter()
-
-    generate_folder_name(num_entities, names)
-    generate_folder_user(num_entities, users, user_folders)
-    generate_folder_parent_folder(num_entities, parent_folders, users, user_folders)
-    generate_date_times(num_entities, created_dates, updated_dates)
-
-    print(len(names))
-    print(len(users))
-    print(len(parent_folders))
-    print(len(created_dates))
-    print(len(updated_dates))
-
-    with open('folder_data.sql', 'w') as f:
-        for index, folder in enumerate(zip(names, users, parent_folders, created_dates, updated_dates)):
-            name, user, parent_folder, created_at, updated_at = folder
-            if index % batch_size == 0:
-                f.write(f"INSERT INTO brainbox_folder (name, user_id, parent_folder_id, created_at, updated_at) VALUES\n")
-            f.write(f"('{name}', {user + 1}, {'null' if parent_folder is None else parent_folder + 1}, '{created_at}', '{updated_at}'){';' if (index + 1) % batch_size == 0 else ','}\n")
-
-    toc = time.perf_counter()
-    print(f"Generated folders in {toc - tic:0.4f} seconds")
-
-
-# FILE
-def generate_file_name(num_entities: int, names: list):
-    for i in range(num_entities):
-        name = fake.file_name(extension='')[:-1]
-        names.append(name)
-
-
-def generate_file_content(num_entities: int, contents: list):
-    for i in range(num_entities):
-        # content_length = random.choice(['small', 'medium'])
-        # content = fake.post(size=content_length)
-        content = fake.text()
-        contents.append(content)
-
-
-def generate_file_user(num_entities: int, users: list, file_user: dict):
-    for i in range(num_entities):
-        user = random.randint(0, num_entities - 1)
-        users.append(user)
-        file_user[i] = user
-
-
-def generate_file_folder(num_entities: int, folders: list, users: list, user_folders: dict):
-    for i in range(num_entities):
-        user = users[i]
-        folder = None
-        prob = random.uniform(0, 1)  # probability to have a parent folder
-        if prob > 0.3:
-            if user in user_folders:
-                folder = random.choice(user_folders[user][:])
-        folders.append(folder)
+DATE_START = datetime.datetime(2013, 1, 1)
+DATE_END = datetime.datetime(2023, 5, 1)
 
+fake = Faker()
 
-def generate_file(num_entities: int, batch_size: int, user_folders: dict, file_user: dict):
-    print("Generating files...")
-
-    names = list()
-    contents = list()
-    users = list()
-    folders = list()
-    created_dates = list()
-    updated_dates = list()
 
+class Dataset:
+    def __init__(self, num_users, num_folders, num_files, shares_per_file, chunk_size=10000, seed=0):
+        if shares_per_file >= num_users:
+            raise ValueError('shares_per_file must be lower than the number of users.')
+        self.num_users = num_users
+        self.num_folders = num_folders
+        self.num_files = num_files
+        self.shares_per_file = shares_per_file
+        self.chunk_size = chunk_size
+        self.seed = seed
+        # Every chunk needs users to own its folders and files: with fewer
+        # users than chunks, the chunks grow past chunk_size instead.
+        self.num_chunks = max(1, min(num_users, math.ceil(max(num_users, num_folders, num_files) / chunk_size)))
+
+    def count(self, table):
+        return {
+            'user': self.num_users,
+            'folder': self.num_folders,
+            'file': self.num_files,
+            'sharedfile': self.num_files * self.shares_per_file,
+        }[table]
+
+    def id_range(self, total, chunk):
+        """
+        1-based ids of the `chunk`-th slice of a table with `total` rows.
+        """
+        return range(chunk * total // self.num_chunks + 1, (chunk + 1) * total // self.num_chunks + 1)
+
+    def rng(self, purpose, chunk):
+        return random.Random(f'{self.seed}:{purpose}:{chunk}')
+
+    def folder_owners(self, chunk):
+        rng = self.rng('folder-owner', chunk)
+        users = self.id_range(self.num_users, chunk)
+        return [(folder_id, rng.choice(users)) for folder_id in self.id_range(self.num_folders, chunk)]
+
+    def file_owners(self, chunk):
+        rng = self.rng('file-owner', chunk)
+        users = self.id_range(self.num_users, chunk)
+        return [(file_id, rng.choice(users)) for file_id in self.id_range(self.num_files, chunk)]
+
+    def file_placements(self, chunk):
+        """
+        (file_id, user_id, folder_id) of every file in the chunk; files land
+        in one of their owner's folders or at the root.
+        """
+        rng = self.rng('file-placement', chunk)
+        user_folders = {}
+        for folder_id, user_id in self.folder_owners(chunk):
+            user_folders.setdefault(user_id, []).append(folder_id)
+        for file_id, user_id in self.file_owners(chunk):
+            folders = user_folders.get(user_id)
+            yield file_id, user_id, rng.choice(folders) if folders and rng.random() > 0.3 else None
+
+    def rows(self, table, chunk):
+        return getattr(self, f'{table}_rows')(chunk)
+
+    def user_rows(self, chunk):
+        fake.seed_instance(f'{self.seed}:user:{chunk}')
+        rng = self.rng('user', chunk)
+        num_personal_files = Counter(user_id for _, user_id in self.file_owners(chunk))
+        for user_id in self.id_range(self.num_users, chunk):
+            # The id suffix keeps usernames and emails unique without
+            # remembering the ones already generated.
+            username = f'{fake.user_name()}{user_id}'
+            local, domain = fake.free_email().split('@')
+            created_at, updated_at = date_times()
+            yield (user_id, username, f'{local}{user_id}@{domain}', fake.password(length=rng.randint(8, 12)),
+                   num_personal_files[user_id], created_at, updated_at)
+
+    def folder_rows(self, chunk):
+        fake.seed_instance(f'{self.seed}:folder:{chunk}')
+        rng = self.rng('folder', chunk)
+        num_files = Counter(folder_id for _, _, folder_id in self.file_placements(chunk))
+        user_folders = {}
+        for folder_id, user_id in self.folder_owners(chunk):
+            # Parents are only picked among the user's earlier folders, so
+            # the hierarchy never contains cycles.
+            earlier = user_folders.setdefault(user_id, [])
+            parent_folder_id = rng.choice(earlier) if earlier and rng.random() > 0.3 else None
+            earlier.append(folder_id)
+            created_at, updated_at = date_times()
+            yield folder_id, fake.word(), user_id, parent_folder_id, num_files[folder_id], created_at, updated_at
+
+    def file_rows(self, chunk):
+        fake.seed_instance(f'{self.seed}:file:{chunk}')
+        for file_id, user_id, folder_id in self.file_placements(chunk):
+            name = fake.file_name(extension='')[:-1]
+            content = fake.text()
+            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            created_at, updated_at = date_times()
+            yield file_id, name, content, len(content), content_hash, user_id, folder_id, self.shares_per_file, created_at, updated_at
+
+    def sharedfile_rows(self, chunk):
+        rng = self.rng('sharedfile', chunk)
+        users = range(1, self.num_users + 1)
+        for file_id, owner_id in self.file_owners(chunk):
+            user_ids = [user_id for user_id in rng.sample(users, self.shares_per_file + 1) if user_id != owner_id]
+            for index, user_id in enumerate(user_ids[:self.shares_per_file]):
+                share_id = (file_id - 1) * self.shares_per_file + index + 1
+                updated_at = DATE_START + (DATE_END - DATE_START) * rng.random()
+                yield share_id, user_id, file_id, rng.choice(('R', 'RW')), updated_at.replace(microsecond=0)
+
+
+def date_times():
+    created_at = fake.date_time_between_dates(DATE_START, DATE_END)
+    updated_at = fake.date_time_between_dates(created_at, DATE_END)
+    return created_at, updated_at
+
+
+# Output formats
+
+def sql_literal(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def write_sql(table, rows, f, batch_size):
+    insert = f"INSERT INTO brainbox_{table} ({', '.join(COLUMNS[table])}) VALUES\n"
+    count = 0
+    pending = None
+    for row in rows:
+        if pending is not None:
+            f.write(pending + (';\n' if count % batch_size == 0 else ',\n'))
+        if count % batch_size == 0:
+            f.write(insert)
+        pending = '(' + ', '.join(sql_literal(value) for value in row) + ')'
+        count += 1
+    if pending is not None:
+        f.write(pending + ';\n')
+    return count
+
+
+def write_csv(rows, f):
+    """
+    Headerless CSV, the column names being recorded in the manifest.
+    """
+    writer = csv.writer(f)
+    count = 0
+    for row in rows:
+        writer.writerow([CSV_NULL if value is None else value for value in row])
+        count += 1
+    return count
+
+
+# Parallel generation
+
+def chunk_rows(args):
+    dataset, table, chunk = args
+    return list(dataset.rows(table, chunk))
+
+
+def iter_rows(dataset, table, workers=None):
+    """
+    Yield every row of `table` in id order, generating the chunks across
+    `workers` processes (in this process when `workers` is 1).
+    """
+    tasks = [(dataset, table, chunk) for chunk in range(dataset.num_chunks)]
+    if workers == 1:
+        for task in tasks:
+            yield from dataset.rows(*task[1:])
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for rows in pool.imap(chunk_rows, tasks):
+            yield from rows
+
+
+def generate_chunk(args):
+    dataset, table, chunk, path, output_format, batch_size = args
     tic = time.perf_counter()
-
-    generate_file_name(num_entities, names)
-    generate_file_content(num_entities, contents)
-    generate_file_user(num_entities, users, file_user)
-    generate_file_folder(num_entities, folders, users, user_folders)
-    generate_date_times(num_entities, created_dates, updated_dates)
-
-    print(len(names))
-    print(len(contents))
-    print(len(users))
-    print(len(folders))
-    print(len(created_dates))
-    print(len(updated_dates))
-
-    with open('file_data.sql', 'w') as f:
-        for index, file in enumerate(zip(names, contents, users, folders, created_dates, updated_dates)):
-            name, content, user, folder, created_at, updated_at = file
-            if index % batch_size == 0:
-                f.write(f"INSERT INTO brainbox_file (name, content, user_id, folder_id, created_at, updated_at) VALUES\n")
-            f.write(f"('{name}', '{content}', {user + 1}, {'null' if folder is None else folder + 1}, '{created_at}', '{updated_at}'){';' if (index + 1) % batch_size == 0 else ','}\n")
-
-    toc = time.perf_counter()
-    print(f"Generated files in {toc - tic:0.4f} seconds")
-
-
-def generate_shared_file(num_entities: int, num_relations_per_entity: int, batch_size: int, file_user: dict):
-    print("Generating shared files...")
+    if output_format == 'csv':
+        # Level 1 keeps compression well below the generator's cost.
+        with gzip.open(path, 'wt', newline='', compresslevel=1) as f:
+            count = write_csv(dataset.rows(table, chunk), f)
+    else:
+        with open(path, 'w') as f:
+            count = write_sql(table, dataset.rows(table, chunk), f, batch_size)
+    return count, time.perf_counter() - tic
+
+
+def generate_table(dataset, table, output_dir, workers, output_format='sql', batch_size=1000):
+    """
+    Generate every chunk of `table` across `workers` processes, one part
+    file per chunk. SQL parts are concatenated, in order, into
+    `<output_dir>/<table>_all.sql`; CSV parts are kept as
+    `<output_dir>/<table>/part-<chunk>.csv.gz`. Returns (rows, seconds, parts)
+    with `parts` as `[{'path': ..., 'rows': ...}]`, paths relative to
+    `output_dir`.
+    """
+    parts_dir = os.path.join(output_dir, table if output_format == 'csv' else f'{table}_parts')
+    os.makedirs(parts_dir, exist_ok=True)
+    extension = 'csv.gz' if output_format == 'csv' else 'sql'
+    tasks = [
+        (dataset, table, chunk, os.path.join(parts_dir, f'part-{chunk:05d}.{extension}'), output_format, batch_size)
+        for chunk in range(dataset.num_chunks)
+    ]
 
     tic = time.perf_counter()
-
-    with open('shared_file_data.sql', 'w') as f:
-        index = 0
-        for file_id in range(num_entities):
-            user_ids = random.sample(range(num_entities), num_relations_per_entity)
-            for user_id in user_ids:
-                if file_id in file_user:
-                    while user_id == file_user[file_id]:
-                        user_id = random.randint(0, num_entities)
-                if index % batch_size == 0:
-                    f.write(f"INSERT INTO brainbox_sharedfile (user_id, file_id, permission) VALUES\n")
-                f.write(f"({user_id + 1}, {file_id + 1}, '{random.choice(['R', 'RW'])}'){';' if (index + 1) % batch_size == 0 else ','}\n")
-                index += 1
-
-    toc = time.perf_counter()
-    print(f"Generated shared files in {toc - tic:0.4f} seconds")
-
-
-def main():
-    user_folders = dict()
-    file_user = dict()
-    num_entities = 1000000
-    num_relations_per_entity = 10
-    batch_size = 1000
+    parts = []
+    with multiprocessing.Pool(workers) as pool:
+        for task, (count, _) in zip(tasks, pool.imap(generate_chunk, tasks)):
+            parts.append({'path': os.path.relpath(task[3], output_dir), 'rows': count})
+
+    if output_format == 'sql':
+        path = os.path.join(output_dir, f'{table}_all.sql')
+        with open(path, 'w') as merged:
+            for task in tasks:
+                with open(task[3]) as part:
+                    shutil.copyfileobj(part, merged)
+        shutil.rmtree(parts_dir)
+        parts = [{'path': os.path.relpath(path, output_dir), 'rows': sum(part['rows'] for part in parts)}]
+
+    return sum(part['rows'] for part in parts), time.perf_counter() - tic, parts
+
+
+def write_manifest(dataset, output_dir, tables):
+    """
+    Describe a CSV dataset in `<output_dir>/manifest.json`: the generator
+    parameters it was made from, and the columns and ordered parts of every
+    table in `tables` (`{table: parts}`).
+    """
+    manifest = {
+        'format': 'csv.gz',
+        'null': CSV_NULL,
+        'dataset': {
+            'num_users': dataset.num_users,
+            'num_folders': dataset.num_folders,
+            'num_files': dataset.num_files,
+            'shares_per_file': dataset.shares_per_file,
+            'chunk_size': dataset.chunk_size,
+            'seed': dataset.seed,
+        },
+        'tables': {
+            table: {
+                'columns': list(COLUMNS[table]),
+                'rows': sum(part['rows'] for part in parts),
+                'parts': parts,
+            }
+            for table, parts in tables.items()
+        },
+    }
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the brainbox seed dataset.')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--folders', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--shares-per-file', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--format', choices=('sql', 'csv'), default='sql',
+                        help='INSERT statements, or gzipped CSV chunks with a manifest.json for load_bulk --manifest.')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tables', nargs='+', choices=TABLES, default=list(TABLES))
+    parser.add_argument('--output-dir', default='.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dataset = Dataset(args.users, args.folders, args.files, args.shares_per_file, args.chunk_size, args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
 
     tic = time.perf_counter()
-
-    #generate_user(num_entities, batch_size)
-    #print('\n')
-    generate_folder(num_entities, batch_size, user_folders)
-    print('\n')
-    generate_file(num_entities, batch_size, user_folders, file_user)
-    print('\n')
-    generate_shared_file(num_entities, num_relations_per_entity, batch_size, file_user)
+    tables = {}
+    for table in args.tables:
+        print(f"Generating {table}...")
+        rows, seconds, tables[table] = generate_table(
+            dataset, table, args.output_dir, args.workers, args.format, args.batch_size
+        )
+        print(f"Generated {rows} {table} rows in {seconds:0.4f} seconds ({rows / seconds:,.0f} rows/s)")
+    if args.format == 'csv':
+        write_manifest(dataset, args.output_dir, tables)
 
     toc = time.perf_counter()
     print(f"Generated all in {toc - tic:0.4f} seconds")
@@ -0,0 +1,90 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from brainbox.models import Folder, File, FolderClosure
+
+
+def _tables():
+    return {'folder': Folder._meta.db_table, 'closure': FolderClosure._meta.db_table}
+
+
+def add_folder(folder_id, parent_id, using=None):
+    """
+    Link a new folder to itself and to every ancestor of its parent.
+    """
+    using = using or router.db_for_write(FolderClosure)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+            'SELECT %s, %s, 0 '
+            'UNION ALL '
+            'SELECT ancestor_id, %s, depth + 1 FROM {closure} WHERE descendant_id = %s'.format(**_tables()),
+            [folder_id, folder_id, folder_id, parent_id]
+        )
+
+
+def move_folder(folder_id, parent_id, using=None):
+    """
+    Move the subtree rooted at `folder_id` below `parent_id` (None for the
+    top level): unlink it from its former ancestors and link every folder
+    in it to the new ones, with one statement each.
+    """
+    using = using or router.db_for_write(FolderClosure)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {closure} '
+            'WHERE descendant_id IN (SELECT descendant_id FROM {closure} WHERE ancestor_id = %s) '
+            'AND ancestor_id IN (SELECT ancestor_id FROM {closure} WHERE descendant_id = %s AND depth > 0)'.format(**_tables()),
+            [folder_id, folder_id]
+        )
+        if parent_id is not None:
+            cursor.execute(
+                'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+                'SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1 '
+                'FROM {closure} a, {closure} d '
+                'WHERE a.descendant_id = %s AND d.ancestor_id = %s'.format(**_tables()),
+                [parent_id, folder_id]
+            )
+
+
+def rebuild_hierarchy(using=None):
+    """
+    Recompute the closure table from `parent_folder` with one recursive
+    INSERT ... SELECT, for use after bulk loads or to repair drift. Folders
+    on (or below) a parent cycle, which older versions let through, are
+    only linked to themselves.
+    """
+    using = using or router.db_for_write(FolderClosure)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {closure}'.format(**_tables()))
+        cursor.execute(
+            'INSERT INTO {closure} (ancestor_id, descendant_id, depth) '
+            'WITH RECURSIVE tree(id) AS ('
+            'SELECT id FROM {folder} WHERE parent_folder_id IS NULL '
+            'UNION ALL '
+            'SELECT f.id FROM {folder} f JOIN tree t ON f.parent_folder_id = t.id'
+            '), links(ancestor_id, descendant_id, depth) AS ('
+            'SELECT id, id, 0 FROM {folder} '
+            'UNION ALL '
+            'SELECT l.ancestor_id, f.id, l.depth + 1 FROM links l '
+            'JOIN tree t ON t.id = l.descendant_id '
+            'JOIN {folder} f ON f.parent_folder_id = l.descendant_id'
+            ') '
+            'SELECT ancestor_id, descendant_id, depth FROM links'.format(**_tables())
+        )
+
+
+def subtree_totals():
+    """
+    `total_files` and `total_chars` of the files anywhere in each folder's
+    subtree, as annotations.
+    """
+    def total(aggregate):
+        return Coalesce(Subquery(
+            File.objects.filter(folder__ancestor_links__ancestor=OuterRef('pk'))
+            .order_by().values('folder__ancestor_links__ancestor').annotate(total=aggregate).values('total'),
+            output_field=IntegerField()
+        ), 0)
+
+    return {'total_files': total(Count('id')), 'total_chars': total(Sum('content_length'))}
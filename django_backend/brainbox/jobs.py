@@ -0,0 +1,193 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from brainbox.models import Job
+
+# Task name -> function(progress, **arguments), filled by @task.
+TASKS = {}
+
+# Extra time a claimed job's lease runs past its timeout before the job is
+# considered lost (its worker died) and retried.
+LEASE_GRACE = 30
+
+
+def task(name):
+    """
+    Register `function(progress, **arguments)` as the task `name`. It runs
+    in a worker process; `progress(step, rows, seconds)` is stored on the
+    job, and the JSON-serializable return value becomes its `result`.
+    """
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, max_attempts=None, timeout=None, **arguments):
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}.')
+    return Job.objects.create(
+        task=name, arguments=arguments,
+        max_attempts=max_attempts or getattr(settings, 'BRAINBOX_JOB_MAX_ATTEMPTS', 3),
+        timeout=timeout or getattr(settings, 'BRAINBOX_JOB_TIMEOUT', 600),
+    )
+
+
+def claim(worker):
+    """
+    Lease the next due job to `worker`, or return None. The conditional
+    UPDATE lets concurrent workers race for a job without row locks (which
+    SQLite does not have): only one of them changes its status.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    for job in due[:10]:
+        claimed = Job.objects.filter(pk=job.pk, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, worker=worker, attempts=F('attempts') + 1, started_at=now, updated_at=now,
+            locked_until=now + timedelta(seconds=job.timeout + LEASE_GRACE),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def finish(job, result):
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING, worker=job.worker).update(
+        status=Job.Status.SUCCEEDED, result=result, error='', locked_until=None, finished_at=now, updated_at=now,
+    )
+
+
+def fail(job, error):
+    """
+    Record a failed attempt: requeue the job with an exponential backoff
+    while it has attempts left, otherwise mark it failed.
+    """
+    now = timezone.now()
+    running = Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING, worker=job.worker)
+    if job.attempts < job.max_attempts:
+        delay = getattr(settings, 'BRAINBOX_JOB_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+        running.update(
+            status=Job.Status.QUEUED, error=error, locked_until=None, updated_at=now,
+            run_after=now + timedelta(seconds=delay),
+        )
+    else:
+        running.update(status=Job.Status.FAILED, error=error, locked_until=None, finished_at=now, updated_at=now)
+
+
+def expire_leases():
+    """
+    Fail the running jobs whose lease expired: their worker was killed or
+    lost its database connection before recording the outcome.
+    """
+    for job in Job.objects.filter(status=Job.Status.RUNNING, locked_until__lt=timezone.now()):
+        fail(job, f'Lease held by {job.worker} expired.')
+
+
+def execute(job):
+    def progress(step, rows, seconds):
+        Job.objects.filter(pk=job.pk).update(
+            progress={'step': step, 'rows': rows, 'seconds': round(seconds, 3)}, updated_at=timezone.now()
+        )
+
+    try:
+        result = TASKS[job.task](progress, **job.arguments)
+    except Exception:
+        fail(job, traceback.format_exc())
+    else:
+        finish(job, result)
+
+
+def _execute_in_child(job_pk):
+    # Forked from the worker, whose connections were closed beforehand. The
+    # worker's SIGTERM and SIGINT handlers (see run_worker) would otherwise
+    # be inherited, and `terminate()` would not stop an overrunning job.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    execute(Job.objects.get(pk=job_pk))
+    connections.close_all()
+
+
+class Worker:
+    """
+    Runs queued jobs, up to `processes` at a time, each in a forked child
+    process that is killed once it overruns the job's timeout. With
+    `processes=0` jobs run one at a time in this process instead (without
+    timeouts), which is handy for debugging. In `burst` mode the worker
+    returns as soon as the queue is empty.
+    """
+
+    def __init__(self, processes=1, poll_interval=1.0, burst=False, log=None):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.log = log or (lambda message: None)
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.running = {}
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self):
+        context = multiprocessing.get_context('fork')
+        while True:
+            self.reap()
+            started = False
+            if not self.stopping:
+                expire_leases()
+                started = self.start_jobs(context)
+            if not self.running and (self.stopping or (self.burst and not started)):
+                return
+            if not started:
+                time.sleep(self.poll_interval)
+
+    def start_jobs(self, context):
+        started = False
+        while len(self.running) < max(self.processes, 1):
+            job = claim(self.name)
+            if job is None:
+                break
+            started = True
+            self.log(f'Starting {job}, attempt {job.attempts} of {job.max_attempts}.')
+            if not self.processes:
+                execute(job)
+                continue
+            # A forked child must not share the parent's connections.
+            connections.close_all()
+            # Not a daemon: tasks such as load_bulk start processes of their own.
+            process = context.Process(target=_execute_in_child, args=(job.pk,))
+            process.start()
+            self.running[process] = (job, time.monotonic() + job.timeout)
+        return started
+
+    def reap(self):
+        for process, (job, deadline) in list(self.running.items()):
+            if process.is_alive():
+                if time.monotonic() < deadline:
+                    continue
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                fail(job, f'Timed out after {job.timeout} seconds.')
+                self.log(f'{job} timed out.')
+            else:
+                process.join()
+                if process.exitcode != 0:
+                    fail(job, f'Worker process exited with code {process.exitcode}.')
+                job.refresh_from_db()
+                self.log(f'Finished {job}.')
+            del self.running[process]
@@ -0,0 +1,211 @@
+import csv
+import gzip
+import json
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from brainbox import search
+from brainbox.caching import bump_model_version
+from brainbox.counters import check_counters
+from brainbox.fake_data.data_gen import CSV_NULL, MANIFEST
+from brainbox.hierarchy import rebuild_hierarchy
+from brainbox.models import User, Folder, File, SharedFile, FolderClosure, UserStatistics, FolderStatistics
+from brainbox.statistics import rebuild_statistics
+
+# Tables in foreign key order, keyed like the generator's tables.
+MODELS = {
+    'user': User,
+    'folder': Folder,
+    'file': File,
+    'sharedfile': SharedFile,
+}
+
+
+def csv_rows(f):
+    """
+    Return the header and a row iterator for a CSV source whose first line
+    names the columns.
+    """
+    reader = csv.reader(f)
+    columns = next(reader)
+    return columns, ([None if value == CSV_NULL else value for value in row] for row in reader)
+
+
+def manifest_sources(path):
+    """
+    `{table: (columns, rows)}` for a dataset written by `data_gen.py --format
+    csv`, given its manifest or directory. The gzipped parts of each table
+    are streamed one after the other, in order.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)
+    with open(path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(path)
+
+    def rows(parts):
+        for part in parts:
+            with gzip.open(os.path.join(directory, part['path']), 'rt', newline='') as f:
+                for row in csv.reader(f):
+                    yield [None if value == manifest['null'] else value for value in row]
+
+    return {
+        table: (spec['columns'], rows(spec['parts']))
+        for table, spec in manifest['tables'].items() if table in MODELS
+    }
+
+
+def secondary_indexes(connection, tables):
+    """
+    `(name, CREATE INDEX statement)` of the non-unique indexes on `tables`,
+    read back from the catalog so they can be dropped and recreated as is.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                "AND sql NOT LIKE 'CREATE UNIQUE%%' AND tbl_name IN ({})".format(', '.join(['%s'] * len(tables))),
+                tables
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+                "AND indexdef NOT LIKE 'CREATE UNIQUE%%' AND tablename = ANY(%s)",
+                [list(tables)]
+            )
+        else:
+            return []
+        return cursor.fetchall()
+
+
+@contextmanager
+def relaxed_durability(connection):
+    """
+    Skip the fsyncs (and, on SQLite, the rollback journal) for the duration
+    of a load; a crash midway leaves a database to be reloaded anyway.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous = OFF')
+            cursor.execute('PRAGMA journal_mode = MEMORY')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SET synchronous_commit TO off')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+                cursor.execute(f'PRAGMA synchronous = {synchronous}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('RESET synchronous_commit')
+
+
+def insert_rows(connection, table, columns, rows, batch_size=10000, transaction_size=500000):
+    """
+    Insert `rows` into `table` with one parameterized `executemany` per
+    `batch_size` rows, committing every `transaction_size` rows. Returns the
+    number of rows inserted.
+    """
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(table), ', '.join(qn(column) for column in columns), ', '.join(['%s'] * len(columns))
+    )
+    rows = iter(rows)
+    count = 0
+    while True:
+        inserted = 0
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            while inserted < transaction_size:
+                batch = list(islice(rows, min(batch_size, transaction_size - inserted)))
+                if not batch:
+                    break
+                cursor.executemany(sql, batch)
+                inserted += len(batch)
+        count += inserted
+        if inserted < transaction_size:
+            return count
+
+
+def bulk_load(sources, using, truncate=False, batch_size=10000, transaction_size=500000, progress=None):
+    """
+    Load `sources`, a `{table: (columns, rows)}` mapping keyed like `MODELS`,
+    into the `using` database.
+
+    The search indexes and the secondary indexes of the loaded tables are
+    dropped for the load and rebuilt once at the end, durability is relaxed,
+    and foreign keys are checked in one pass afterwards. The folder
+    hierarchy, statistics rollups and counter columns are then recomputed and the model versions
+    bumped. `progress(step, rows, seconds)` is called after every step.
+    """
+    connection = connections[using]
+    models = [MODELS[table] for table in MODELS if table in sources]
+    tables = [model._meta.db_table for model in models]
+
+    def timed(step, function, *args):
+        tic = time.perf_counter()
+        rows = function(*args)
+        if progress:
+            progress(step, rows, time.perf_counter() - tic)
+
+    def drop_indexes():
+        with connection.schema_editor() as schema_editor:
+            search.drop_trigram_indexes(schema_editor)
+            search.drop_file_search_index(schema_editor)
+        with connection.cursor() as cursor:
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+
+    def create_indexes():
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+        with connection.schema_editor() as schema_editor:
+            search.create_trigram_indexes(schema_editor)
+            search.create_file_search_index(schema_editor)
+
+    def flush():
+        statements = connection.ops.sql_flush(
+            no_style(), tables + [FolderClosure._meta.db_table, UserStatistics._meta.db_table, FolderStatistics._meta.db_table]
+        )
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    indexes = secondary_indexes(connection, tables)
+    timed('drop indexes', drop_indexes)
+    try:
+        with relaxed_durability(connection), connection.constraint_checks_disabled():
+            if truncate:
+                timed('truncate', flush)
+            for model in models:
+                columns, rows = sources[model._meta.model_name]
+                timed(model._meta.db_table, insert_rows, connection, model._meta.db_table, columns, rows,
+                      batch_size, transaction_size)
+    finally:
+        timed('create indexes', create_indexes)
+
+    timed('check constraints', connection.check_constraints, tables)
+
+    def finish():
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(statement)
+        rebuild_hierarchy(using)
+        rebuild_statistics(using)
+        check_counters(repair=True, using=using)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    timed('statistics', finish)
+    for model in models + [UserStatistics, FolderStatistics]:
+        bump_model_version(model)
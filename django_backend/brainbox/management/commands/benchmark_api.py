@@ -0,0 +1,341 @@
+import datetime
+import json
+import os
+import subprocess
+import tempfile
+import time
+from io import StringIO
+from urllib.parse import quote
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from brainbox import jobs, profiling
+from brainbox.management.commands.load_test import percentile
+from brainbox.models import File, Folder, Job, SharedFile, User
+from brainbox.pagination import KeysetPagination
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+def parse_scale(scale):
+    """
+    Files in a dataset of `scale`: one of SCALES or a plain number.
+    """
+    try:
+        return SCALES[scale.lower()] if scale.lower() in SCALES else int(scale)
+    except ValueError:
+        raise CommandError(f"Unknown scale {scale!r}: use {', '.join(SCALES)} or a number of files.")
+
+
+def dataset_sizes(files, shares_per_file=2):
+    """
+    Rows per table of a dataset with `files` files: a folder for every two
+    files and a user for every ten.
+    """
+    return {
+        'users': max(files // 10, shares_per_file + 1),
+        'folders': max(files // 2, 1),
+        'files': files,
+        'shares_per_file': shares_per_file,
+    }
+
+
+class Case:
+    """
+    One benchmarked request. `write` requests run in a transaction that is
+    rolled back, so every repetition sees the same dataset.
+    """
+
+    def __init__(self, name, method, path, data=None, headers=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.headers = headers or {}
+
+    @property
+    def write(self):
+        return self.method != 'GET'
+
+
+def cases(sizes, per_page=25):
+    """
+    The requests of every route in brainbox/urls.py worth timing, with ids
+    taken from the middle of the seeded dataset: first and deep pages (page
+    number and cursor) of the listings, the detail and tree views, the
+    statistics and jobs, and the writes: creation (single and bulk), moves,
+    updates, shares and deletions, inline and queued. The schema and async
+    twins are left out.
+    """
+    user = User.objects.get(pk=sizes['users'] // 2 or 1)
+    folder = Folder.objects.get(pk=sizes['folders'] // 2 or 1)
+    file = File.objects.get(pk=sizes['files'] // 2 or 1)
+    shared = SharedFile.objects.filter(file=file).values_list('user_id', flat=True)
+    strangers = list(User.objects.exclude(pk=file.user_id).exclude(pk__in=shared).values_list('pk', flat=True)[:10])
+    share = SharedFile.objects.filter(file=file).first()
+    moved = list(File.objects.filter(user=folder.user_id).exclude(folder=folder).values_list('pk', flat=True)[:100])
+    # A job to read back; queued requests only add theirs inside the
+    # rolled back transaction.
+    job = Job.objects.order_by('pk').first() or jobs.enqueue('rebuild_statistics')
+    queued = {'HTTP_PREFER': 'respond-async'}
+
+    def deep(table_size):
+        # Page number and cursor of a page nine tenths into the listing.
+        page = max(table_size * 9 // 10 // per_page, 1)
+        cursor = KeysetPagination().encode_cursor([table_size * 9 // 10], False)
+        return page, cursor
+
+    result = []
+    for name, size in (('users', sizes['users']), ('folders', sizes['folders']), ('files', sizes['files'])):
+        page, cursor = deep(size)
+        result += [
+            Case(f'{name} first page', 'GET', f'/api/{name}/'),
+            Case(f'{name} deep page', 'GET', f'/api/{name}/?page={page}'),
+            Case(f'{name} first cursor page', 'GET', f'/api/{name}/?pagination=cursor'),
+            Case(f'{name} deep cursor page', 'GET', f'/api/{name}/?cursor={cursor}'),
+            Case(f'{name} agg=1', 'GET', f'/api/{name}/?agg=1'),
+        ]
+    result += [
+        Case('files search', 'GET', f'/api/files/search/?q={quote(file.name.split()[0])}'),
+        Case('user detail', 'GET', f'/api/user/{user.pk}/'),
+        Case('user tree', 'GET', f'/api/user/{user.pk}/tree/?include=files'),
+        Case('folder detail', 'GET', f'/api/folder/{folder.pk}/'),
+        Case('folder tree', 'GET', f'/api/folder/{folder.pk}/tree/?include=files'),
+        Case('file detail', 'GET', f'/api/file/{file.pk}/'),
+        Case('statistics users by chars written', 'GET', '/api/statistics/users-by-chars-written/'),
+        Case('statistics folders by shared users', 'GET', '/api/statistics/folders-by-shared-users/'),
+        Case('job detail', 'GET', f'/api/jobs/{job.pk}/'),
+        Case('statistics rebuild', 'POST', '/api/statistics/rebuild/'),
+        Case('create user', 'POST', '/api/users/', {'username': 'benchmark', 'email': 'benchmark@example.com', 'password': '123'}),
+        Case('create folder', 'POST', '/api/folders/', {'name': 'Benchmark', 'user': folder.user_id, 'parent_folder': folder.pk}),
+        Case('create file', 'POST', '/api/files/', {'name': 'Benchmark', 'content': 'x' * 1000, 'folder': folder.pk, 'user': folder.user_id}),
+        Case('create files in bulk', 'POST', '/api/files/bulk/', [
+            {'name': f'Benchmark {i}', 'content': 'x' * 1000, 'folder': folder.pk, 'user': folder.user_id} for i in range(100)
+        ]),
+        Case('update user', 'PATCH', f'/api/user/{user.pk}/', {'username': 'benchmark'}),
+        Case('replace user', 'PUT', f'/api/user/{user.pk}/', {'username': 'benchmark', 'email': 'benchmark@example.com', 'password': '123'}),
+        Case('update folder', 'PATCH', f'/api/folder/{folder.pk}/', {'name': 'Benchmark'}),
+        Case('replace folder', 'PUT', f'/api/folder/{folder.pk}/', {'name': 'Benchmark', 'parent_folder': folder.parent_folder_id}),
+        Case('update file', 'PATCH', f'/api/file/{file.pk}/', {'name': 'Benchmark'}),
+        Case('replace file', 'PUT', f'/api/file/{file.pk}/', {'name': 'Benchmark', 'content': 'x' * 1000, 'folder': file.folder_id}),
+        Case('delete user', 'DELETE', f'/api/user/{user.pk}/'),
+        Case('delete user queued', 'DELETE', f'/api/user/{user.pk}/', headers=queued),
+        Case('delete folder', 'DELETE', f'/api/folder/{folder.pk}/'),
+        Case('delete folder queued', 'DELETE', f'/api/folder/{folder.pk}/', headers=queued),
+        Case('delete file', 'DELETE', f'/api/file/{file.pk}/'),
+    ]
+    if moved:
+        result.append(Case('move files into folder', 'POST', f'/api/folder/{folder.pk}/files/', [{'id': pk} for pk in moved]))
+    if strangers:
+        result += [
+            Case('share file with user', 'POST', f'/api/file/{file.pk}/shared-users/', {'user': strangers[0], 'permission': 'R'}),
+            Case('share file from user', 'POST', f'/api/user/{strangers[0]}/shared-files/', {'file': file.pk, 'permission': 'R'}),
+            Case('share file in bulk', 'POST', f'/api/file/{file.pk}/shared-users/bulk/',
+                 [{'user': pk, 'permission': 'R'} for pk in strangers]),
+            Case('share file in bulk queued', 'POST', f'/api/file/{file.pk}/shared-users/bulk/',
+                 [{'user': pk, 'permission': 'R'} for pk in strangers], queued),
+        ]
+    if share is not None:
+        result += [
+            Case('update share', 'PATCH', f'/api/file/{file.pk}/shared-user/{share.user_id}/', {'permission': 'RW'}),
+            Case('update shared file', 'PATCH', f'/api/user/{share.user_id}/shared-file/{file.pk}/', {'permission': 'RW'}),
+            Case('delete share', 'DELETE', f'/api/file/{file.pk}/shared-user/{share.user_id}/'),
+        ]
+    return result
+
+
+class APIBenchmark:
+    """
+    Requests every case `requests` times (after `warmup` unmeasured ones)
+    with the test client in this process, so the numbers exclude the HTTP
+    server. With `cold` caches, every cache is cleared before each request,
+    so the response cache serves none of them.
+
+    Reports the status, p50 and p99 latency, mean and maximum queries per
+    request and the throughput of a single client per case.
+    """
+
+    def __init__(self, cases, requests=50, warmup=3, cold=True):
+        self.cases = cases
+        self.requests = requests
+        self.warmup = warmup
+        self.cold = cold
+        self.client = Client()
+
+    def request(self, case):
+        if self.cold:
+            for cache in caches.all():
+                cache.clear()
+        with profiling.Profile().activate() as profile:
+            tic = time.perf_counter()
+            if case.write:
+                with transaction.atomic():
+                    response = self.client.generic(
+                        case.method, case.path, json.dumps(case.data) if case.data is not None else '', 'application/json',
+                        **case.headers
+                    )
+                    transaction.set_rollback(True)
+            else:
+                response = self.client.get(case.path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - tic
+        return response.status_code, elapsed, profile.queries
+
+    def run_case(self, case):
+        for _ in range(self.warmup):
+            self.request(case)
+        statuses, latencies, queries = set(), [], []
+        for _ in range(self.requests):
+            status, elapsed, count = self.request(case)
+            statuses.add(status)
+            latencies.append(elapsed)
+            queries.append(count)
+        latencies.sort()
+        return {
+            'method': case.method,
+            'path': case.path,
+            'status': max(statuses),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'mean_queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'throughput': round(len(latencies) / sum(latencies), 1),
+        }
+
+    def run(self, progress=None):
+        profiling.install()
+        results = {}
+        with override_settings(DEBUG=False):
+            for case in self.cases:
+                results[case.name] = self.run_case(case)
+                if progress is not None:
+                    progress(case.name, results[case.name])
+        return results
+
+
+def compare(baseline, results, tolerance):
+    """
+    `[(case, message)]` of the regressions of `results` against `baseline`:
+    another status, more queries per request, or a p50 more than
+    `tolerance` (a fraction) and a millisecond slower, below which timings
+    are noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['status'] != before['status']:
+            regressions.append((name, f"status {before['status']} -> {result['status']}"))
+        if result['max_queries'] > before['max_queries']:
+            regressions.append((name, f"queries {before['max_queries']} -> {result['max_queries']}"))
+        if result['p50_ms'] > max(before['p50_ms'] * (1 + tolerance), before['p50_ms'] + 1):
+            regressions.append((name, f"p50 {before['p50_ms']:.1f} ms -> {result['p50_ms']:.1f} ms"))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every API route against a seeded dataset in a scratch database: p50/p99 latency, queries '
+            'per request and throughput, saved as JSON (--output) and compared with an earlier run (--compare), '
+            'e.g. of the previous commit. SQLite datasets are kept in --dataset-dir and reused by later runs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='10k', help=f"Files in the dataset: {', '.join(SCALES)} or a number.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per case.')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per case.')
+        parser.add_argument('--warm-cache', action='store_true', help='Keep the caches between requests.')
+        parser.add_argument('--case', action='append', metavar='NAME', help='Only run the cases with NAME in their name.')
+        parser.add_argument('--dataset-dir', default=tempfile.gettempdir(), help='Where SQLite datasets are kept.')
+        parser.add_argument('--rebuild', action='store_true', help='Generate the dataset even if it exists.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Dataset generator processes.')
+        parser.add_argument('--output', metavar='PATH', help='Write the results as JSON.')
+        parser.add_argument('--compare', metavar='PATH', help='Results of an earlier run to compare with.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown before --compare fails.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read {options["compare"]}: {e}')
+        sizes = dataset_sizes(parse_scale(options['scale']))
+
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        if settings_dict['ENGINE'] == 'django.db.backends.sqlite3':
+            os.makedirs(options['dataset_dir'], exist_ok=True)
+            settings_dict['TEST']['NAME'] = os.path.join(
+                options['dataset_dir'], f"brainbox-benchmark-{sizes['files']}-seed{options['seed']}.sqlite3"
+            )
+        setup_test_environment()
+        old_config = setup_databases(self.verbosity, interactive=False, keepdb=True)
+        try:
+            self.load(sizes, options)
+            selected = [
+                case for case in cases(sizes)
+                if not options['case'] or any(name in case.name for name in options['case'])
+            ]
+            results = APIBenchmark(selected, options['requests'], options['warmup'], not options['warm_cache']).run(self.report)
+        finally:
+            teardown_databases(old_config, self.verbosity, keepdb=True)
+            teardown_test_environment()
+
+        report = {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'vendor': connections[DEFAULT_DB_ALIAS].vendor,
+            'dataset': {**sizes, 'seed': options['seed']},
+            'requests': options['requests'],
+            'cache': 'warm' if options['warm_cache'] else 'cold',
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        if baseline is not None:
+            if baseline.get('dataset') != report['dataset']:
+                self.stdout.write(self.style.WARNING(f"The baseline was run on another dataset: {baseline.get('dataset')}."))
+            regressions = compare(baseline['results'], results, options['tolerance'])
+            for name, message in regressions:
+                self.stdout.write(self.style.ERROR(f'{name}: {message}'))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {baseline.get('commit') or options['compare']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline.get('commit') or options['compare']}."))
+
+    def load(self, sizes, options):
+        loaded = (User.objects.count(), Folder.objects.count(), File.objects.count())
+        if not options['rebuild'] and loaded == (sizes['users'], sizes['folders'], sizes['files']):
+            return
+        self.stdout.write(f"Generating {sizes['files']:,} files, {sizes['folders']:,} folders and {sizes['users']:,} users...")
+        call_command(
+            'load_bulk', generate=True, truncate=True, seed=options['seed'], workers=options['workers'],
+            stdout=self.stdout if self.verbosity > 1 else StringIO(), **sizes,
+        )
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<36} {result['status']}  p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+            f"{result['mean_queries']:6.1f} queries  {result['throughput']:8.1f} req/s"
+        )
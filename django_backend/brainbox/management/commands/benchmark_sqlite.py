@@ -0,0 +1,123 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from brainbox.database import apply_pragmas, production_sqlite_pragmas
+
+
+class Workload:
+    """
+    Readers listing pages of files and writers adding files to random users
+    (insert plus counter update, in one transaction) against the SQLite
+    database at `path`, each thread running until `deadline`.
+    """
+
+    def __init__(self, path, pragmas, persistent, rows):
+        self.path = path
+        self.pragmas = pragmas
+        self.persistent = persistent
+        self.rows = rows
+        self.lock = threading.Lock()
+        self.counts = {'reads': 0, 'writes': 0, 'errors': 0}
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(connection.cursor(), self.pragmas)
+        return connection
+
+    def setup(self):
+        connection = self.connect()
+        connection.executescript(
+            'CREATE TABLE user (id INTEGER PRIMARY KEY, num_files INTEGER NOT NULL);'
+            'CREATE TABLE file (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, name TEXT, content TEXT);'
+            'CREATE INDEX file_user ON file (user_id, id);'
+        )
+        connection.execute('BEGIN')
+        connection.executemany('INSERT INTO user VALUES (?, 0)', ((i,) for i in range(1, self.rows + 1)))
+        connection.executemany(
+            'INSERT INTO file (user_id, name, content) VALUES (?, ?, ?)',
+            ((random.randint(1, self.rows), f'file {i}', 'x' * 200) for i in range(self.rows))
+        )
+        connection.execute('COMMIT')
+        connection.close()
+
+    def read(self, connection):
+        connection.execute(
+            'SELECT id, name, substr(content, 1, 50) FROM file WHERE user_id = ? ORDER BY id LIMIT 25',
+            (random.randint(1, self.rows),)
+        ).fetchall()
+        return 'reads'
+
+    def write(self, connection):
+        user_id = random.randint(1, self.rows)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT INTO file (user_id, name, content) VALUES (?, ?, ?)', (user_id, 'new', 'x' * 200))
+            connection.execute('UPDATE user SET num_files = num_files + 1 WHERE id = ?', (user_id,))
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.execute('ROLLBACK')
+            raise
+        return 'writes'
+
+    def worker(self, operation, deadline):
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        connection = self.connect() if self.persistent else None
+        while time.perf_counter() < deadline:
+            # Without persistent connections every request opens its own.
+            current = connection or self.connect()
+            try:
+                counts[operation(current)] += 1
+            except sqlite3.OperationalError:
+                counts['errors'] += 1
+            finally:
+                if current is not connection:
+                    current.close()
+        if connection:
+            connection.close()
+        with self.lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+
+    def run(self, readers, writers, seconds):
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=self.worker, args=(self.read, deadline)) for _ in range(readers)]
+        threads += [threading.Thread(target=self.worker, args=(self.write, deadline)) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {key: value / seconds for key, value in self.counts.items()}
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent read/write throughput of a scratch SQLite database with the default settings '
+            'and connection per request, then with the production profile: BRAINBOX_SQLITE_PRODUCTION_PRAGMAS and '
+            'persistent connections.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--rows', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('default', {}, False),
+            ('tuned', production_sqlite_pragmas(), True),
+        )
+        self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, {options['seconds']} s")
+        for name, pragmas, persistent in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                workload = Workload(os.path.join(directory, 'bench.sqlite3'), pragmas, persistent, options['rows'])
+                workload.setup()
+                rates = workload.run(options['readers'], options['writers'], options['seconds'])
+            self.stdout.write(
+                f"{name:>8}: {rates['reads']:10,.0f} reads/s {rates['writes']:10,.0f} writes/s "
+                f"{rates['errors']:8,.1f} errors/s"
+            )
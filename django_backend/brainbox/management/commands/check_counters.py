@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from brainbox.counters import check_counters
+
+
+class Command(BaseCommand):
+    help = 'Compare the num_personal_files, num_files and num_shared_users counters with the actual counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite drifted counters with the actual counts.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to check.')
+
+    def handle(self, *args, **options):
+        report = check_counters(repair=options['repair'], using=options['database'])
+        for counter, drifted in report.items():
+            style = self.style.SUCCESS if not drifted else self.style.WARNING
+            action = 'repaired' if options['repair'] and drifted else 'drifted'
+            self.stdout.write(style(f'{counter}: {drifted} {action}'))
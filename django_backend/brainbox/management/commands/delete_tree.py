@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from brainbox.deletion import DELETE_BATCH_SIZE, delete_folder, delete_user
+from brainbox.models import User, Folder
+
+
+class Command(BaseCommand):
+    help = 'Delete a user or a folder subtree with batched set-based deletes, reporting progress.'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', type=int, metavar='ID', help='Delete this user with their shares, folders and files.')
+        target.add_argument('--folder', type=int, metavar='ID', help='Delete this folder with its subfolders and files.')
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE, help='Rows per batch (and transaction).')
+
+    def handle(self, *args, **options):
+        if options['user'] is not None:
+            model, function = User, delete_user
+        else:
+            model, function = Folder, delete_folder
+        pk = options['user'] if options['user'] is not None else options['folder']
+        try:
+            instance = model.objects.get(pk=pk)
+        except model.DoesNotExist:
+            raise CommandError(f'{model.__name__} {pk} does not exist.')
+
+        function(instance, options['batch_size'], progress=self.report)
+        self.stdout.write(self.style.SUCCESS('Delete finished.'))
+
+    def report(self, step, rows, seconds):
+        self.stdout.write(f'{step}: {rows} rows in {seconds:0.4f} seconds')
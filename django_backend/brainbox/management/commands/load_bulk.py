@@ -0,0 +1,89 @@
+import os
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from brainbox.fake_data.data_gen import COLUMNS, Dataset, iter_rows
+from brainbox.jobs import enqueue
+from brainbox.loading import MODELS, bulk_load, csv_rows, manifest_sources
+
+# Options a queued load is run with.
+LOAD_OPTIONS = (
+    'generate', 'csv', 'manifest', 'database', 'truncate', 'batch_size', 'transaction_size',
+    'users', 'folders', 'files', 'shares_per_file', 'chunk_size', 'seed', 'workers',
+)
+
+
+class Command(BaseCommand):
+    help = 'Bulk load users, folders, files and shared files, generated on the fly or from CSV files.'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--generate', action='store_true', help='Stream rows from the seed data generator.')
+        source.add_argument('--csv', metavar='DIR', help='Load <table>.csv files (user, folder, file, sharedfile) from DIR.')
+        source.add_argument('--manifest', metavar='PATH', help='Load a dataset written by data_gen.py --format csv.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to load into.')
+        parser.add_argument('--truncate', action='store_true', help='Delete the existing rows first.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per executemany call.')
+        parser.add_argument('--transaction-size', type=int, default=500000, help='Rows per transaction.')
+        parser.add_argument('--background', action='store_true', help='Queue the load for run_worker instead.')
+        parser.add_argument('--timeout', type=int, default=24 * 60 * 60, help='Seconds a queued load may run.')
+
+        generator = parser.add_argument_group('generator')
+        generator.add_argument('--users', type=int, default=1000000)
+        generator.add_argument('--folders', type=int, default=1000000)
+        generator.add_argument('--files', type=int, default=1000000)
+        generator.add_argument('--shares-per-file', type=int, default=10)
+        generator.add_argument('--chunk-size', type=int, default=10000)
+        generator.add_argument('--seed', type=int, default=0)
+        generator.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        if options['background']:
+            # A retry would insert the rows with explicit ids again.
+            job = enqueue('load_bulk', max_attempts=1, timeout=options['timeout'],
+                          **{name: options[name] for name in LOAD_OPTIONS})
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}.'))
+            return
+        self.load(options, self.report)
+        self.stdout.write(self.style.SUCCESS('Load finished.'))
+
+    def load(self, options, progress):
+        with ExitStack() as stack:
+            if options['generate']:
+                try:
+                    dataset = Dataset(
+                        options['users'], options['folders'], options['files'], options['shares_per_file'],
+                        options['chunk_size'], options['seed']
+                    )
+                except ValueError as e:
+                    raise CommandError(e)
+                sources = {
+                    table: (COLUMNS[table], iter_rows(dataset, table, options['workers']))
+                    for table in MODELS
+                }
+            elif options['manifest']:
+                try:
+                    sources = manifest_sources(options['manifest'])
+                except (OSError, ValueError) as e:
+                    raise CommandError(f'Cannot read manifest: {e}')
+            else:
+                sources = {}
+                for table in MODELS:
+                    path = os.path.join(options['csv'], f'{table}.csv')
+                    if os.path.exists(path):
+                        sources[table] = csv_rows(stack.enter_context(open(path, newline='')))
+                if not sources:
+                    raise CommandError(f"No CSV files found in {options['csv']}.")
+
+            bulk_load(
+                sources, options['database'], truncate=options['truncate'], batch_size=options['batch_size'],
+                transaction_size=options['transaction_size'], progress=progress
+            )
+
+    def report(self, step, rows, seconds):
+        if rows is None:
+            self.stdout.write(f'{step}: {seconds:0.4f} seconds')
+        else:
+            self.stdout.write(f'{step}: {rows} rows in {seconds:0.4f} seconds ({rows / max(seconds, 1e-9):,.0f} rows/s)')
@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    'users/?pagination=cursor',
+    'folders/?pagination=cursor',
+    'files/?pagination=cursor',
+    'statistics/users-by-chars-written/?pagination=cursor',
+    'statistics/folders-by-shared-users/?pagination=cursor',
+    'user/1/',
+    'folder/1/',
+    'file/1/',
+)
+
+
+def percentile(values, q):
+    """
+    The `q` (0-100) percentile of the sorted `values`, nearest rank.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response; return `(status, keep_alive)`.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server.')
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = None, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            keep_alive = value != 'close'
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    elif status not in (204, 304):
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
+
+
+class LoadTest:
+    """
+    `concurrency` keep-alive clients requesting `paths` below `base_url` in
+    turn for `seconds`, next to `slow_clients` connections that trickle
+    their request in one byte every `slow_interval` seconds, as clients on
+    slow networks do.
+    """
+
+    def __init__(self, base_url, paths, concurrency, seconds, slow_clients=0, slow_interval=0.5):
+        url = urlsplit(base_url)
+        if url.scheme != 'http' or not url.hostname:
+            raise ValueError(f'Expected an http:// URL, got {base_url!r}.')
+        self.host, self.port = url.hostname, url.port or 80
+        self.paths = [url.path.rstrip('/') + '/' + path.lstrip('/') for path in paths]
+        self.concurrency = concurrency
+        self.seconds = seconds
+        self.slow_clients = slow_clients
+        self.slow_interval = slow_interval
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def request(self, path):
+        return f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nAccept: application/json\r\n\r\n'.encode()
+
+    async def client(self, paths, deadline):
+        connection = None
+        while time.perf_counter() < deadline:
+            path = next(paths)
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection(self.host, self.port)
+                reader, writer = connection
+                tic = time.perf_counter()
+                writer.write(self.request(path))
+                await writer.drain()
+                status, keep_alive = await read_response(reader)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                self.errors += 1
+                keep_alive = False
+            else:
+                self.latencies.append(time.perf_counter() - tic)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not keep_alive and connection is not None:
+                connection[1].close()
+                connection = None
+        if connection is not None:
+            connection[1].close()
+
+    async def slow_client(self, deadline):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            return
+        try:
+            for byte in self.request(self.paths[0]):
+                if time.perf_counter() >= deadline:
+                    break
+                writer.write(bytes([byte]))
+                await writer.drain()
+                await asyncio.sleep(self.slow_interval)
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        deadline = time.perf_counter() + self.seconds
+        slow = [asyncio.create_task(self.slow_client(deadline)) for _ in range(self.slow_clients)]
+        await asyncio.gather(*(
+            self.client(itertools.islice(itertools.cycle(self.paths), i, None), deadline)
+            for i in range(self.concurrency)
+        ))
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'throughput': len(latencies) / self.seconds,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'errors': self.errors + sum(count for status, count in self.statuses.items() if status >= 400),
+        }
+
+
+class Command(BaseCommand):
+    help = ('Load test running servers with concurrent read requests and compare them, e.g. the WSGI and the ASGI '
+            'deployment: --target wsgi=http://127.0.0.1:8000/api/ --target asgi=http://127.0.0.1:8001/api/async/ '
+            '(started with e.g. `gunicorn django_backend.wsgi --workers 4` and '
+            '`uvicorn django_backend.asgi:application --workers 4`).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='Server to test and the URL the --path values are relative to.')
+        parser.add_argument('--path', action='append', metavar='PATH', help='Requested in turn; defaults to the read endpoints.')
+        parser.add_argument('--concurrency', type=int, default=64, help='Simultaneous keep-alive clients.')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--slow-clients', type=int, default=0, help='Extra connections that trickle their request in.')
+        parser.add_argument('--slow-interval', type=float, default=0.5, help='Seconds between the bytes of a slow client.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Expected NAME=URL, got {target!r}.')
+            try:
+                targets.append((name, LoadTest(
+                    url, options['path'] or DEFAULT_PATHS, options['concurrency'], options['seconds'],
+                    options['slow_clients'], options['slow_interval'],
+                )))
+            except ValueError as e:
+                raise CommandError(e)
+
+        self.stdout.write(
+            f"{options['concurrency']} clients, {options['slow_clients']} slow clients, {options['seconds']} s per target"
+        )
+        for name, load_test in targets:
+            result = asyncio.run(load_test.run())
+            if not result['requests']:
+                self.stdout.write(self.style.ERROR(f"{name:>8}: no responses ({result['errors']} errors)"))
+                continue
+            self.stdout.write(
+                f"{name:>8}: {result['throughput']:10,.1f} req/s  p50 {result['p50'] * 1000:8.1f} ms  "
+                f"p99 {result['p99'] * 1000:8.1f} ms  {result['errors']} errors"
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from brainbox.statistics import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Recompute the users-by-chars-written and folders-by-shared-users rollup tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to rebuild.')
+
+    def handle(self, *args, **options):
+        rebuild_statistics(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt.'))
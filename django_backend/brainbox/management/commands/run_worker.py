@@ -0,0 +1,27 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from brainbox.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (bulk shares, deletes, statistics rebuilds, bulk loads).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Jobs run at a time, each in its own process; 0 runs them inline, without timeouts.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls of an empty queue.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['processes'], options['poll_interval'], options['burst'], log=self.stdout.write)
+        # Finish the running jobs, but take no new ones, on SIGTERM or Ctrl-C.
+        handlers = {signum: signal.signal(signum, worker.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.stdout.write(f'Worker {worker.name} started.')
+        try:
+            worker.run()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker.name} stopped.'))
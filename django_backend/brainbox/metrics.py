@@ -0,0 +1,226 @@
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_enabled():
+    return getattr(settings, 'BRAINBOX_METRICS', True)
+
+
+def route_label(request):
+    """
+    The URL pattern the request was routed to, e.g. `/api/user/<int:pk>/`,
+    so metrics do not get a series per object.
+    """
+    match = getattr(request, 'resolver_match', None)
+    return '/' + match.route if match is not None else '<unresolved>'
+
+
+class Metric:
+    """
+    Base of the metric types, which define `add(samples, other)`, adding
+    the `other` samples (of another process) to `samples`, and
+    `exposition(samples)`, the text exposition lines of `samples`.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, key, **extra):
+        labels = [*zip(self.labelnames, key), *extra.items()]
+        if not labels:
+            return ''
+        escape = lambda value: value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.samples[key] = self.samples.get(key, 0) + amount
+
+    def add(self, samples, other):
+        for key, value in other.items():
+            samples[key] = samples.get(key, 0) + value
+
+    def exposition(self, samples):
+        for key, value in sorted(samples.items()):
+            yield f'{self.name}{self.format_labels(key)} {value}'
+
+
+class Histogram(Metric):
+    """
+    Counts of the observations per fixed bucket (not cumulative, the last
+    one being +Inf) followed by their sum.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        sample = self.samples.setdefault(self.key(labels), [0] * (len(self.buckets) + 2))
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        sample[index] += 1
+        sample[-1] += value
+
+    def add(self, samples, other):
+        for key, values in other.items():
+            sample = samples.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, value in enumerate(values):
+                sample[i] += value
+
+    def exposition(self, samples):
+        for key, sample in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), sample):
+                cumulative += count
+                yield f'{self.name}_bucket{self.format_labels(key, le=str(bound))} {cumulative}'
+            yield f'{self.name}_sum{self.format_labels(key)} {sample[-1]}'
+            yield f'{self.name}_count{self.format_labels(key)} {cumulative}'
+
+
+class Registry:
+    """
+    The metrics of this process. With BRAINBOX_METRICS_DIR set, every
+    process (e.g. each gunicorn worker) writes its samples to a file of its
+    own there at most every BRAINBOX_METRICS_FLUSH_INTERVAL seconds, and
+    `collect()` adds up the files of all of them, whichever process serves
+    the scrape. The files of exited processes are kept, so counters never go
+    back; clear the directory when the server (re)starts.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flushed = 0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.samples = {}
+        self.flushed = 0
+
+    def state(self):
+        with self.lock:
+            return {
+                name: [[list(key), value] for key, value in metric.samples.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self, force=False):
+        directory = getattr(settings, 'BRAINBOX_METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or not force and now - self.flushed < getattr(settings, 'BRAINBOX_METRICS_FLUSH_INTERVAL', 1):
+            return
+        self.flushed = now
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """
+        `{name: samples}` of this process, or of all of them.
+        """
+        directory = getattr(settings, 'BRAINBOX_METRICS_DIR', None)
+        if not directory:
+            states = [self.state()]
+        else:
+            self.flush(force=True)
+            states = []
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path) as f:
+                        states.append(json.load(f))
+                except (OSError, ValueError):
+                    # Exited or replaced between the glob and the read.
+                    continue
+
+        collected = {name: {} for name in self.metrics}
+        for state in states:
+            for name, samples in state.items():
+                if name in self.metrics:
+                    self.metrics[name].add(collected[name], {tuple(key): value for key, value in samples})
+        return collected
+
+    def exposition(self):
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.exposition(samples))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+# A forked child starts from scratch rather than counting its parent's
+# requests twice.
+os.register_at_fork(after_in_child=REGISTRY.reset)
+
+REQUESTS = REGISTRY.counter(
+    'brainbox_http_requests_total', 'Requests served.', ('method', 'route', 'status'),
+)
+LATENCY = REGISTRY.histogram(
+    'brainbox_http_request_duration_seconds', 'Time to the response (to its first byte when streamed).',
+    ('method', 'route'), (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = REGISTRY.histogram(
+    'brainbox_http_response_size_bytes', 'Size of the response bodies, streamed ones excepted.',
+    ('method', 'route'), (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+QUERIES = REGISTRY.histogram(
+    'brainbox_db_queries', 'SQL statements run per request.',
+    ('method', 'route'), (0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+RESPONSE_CACHE = REGISTRY.counter(
+    'brainbox_response_cache_requests_total',
+    'GET requests of cached endpoints by result: hit, miss or not_modified (a 304 from the validators).',
+    ('route', 'result'),
+)
+
+
+def observe_request(request, response, elapsed, queries):
+    route, method = route_label(request), request.method
+    with REGISTRY.lock:
+        REQUESTS.inc(method=method, route=route, status=response.status_code)
+        LATENCY.observe(elapsed, method=method, route=route)
+        QUERIES.observe(queries, method=method, route=route)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), method=method, route=route)
+    REGISTRY.flush()
+
+
+def observe_cache(request, result):
+    if not metrics_enabled():
+        return
+    with REGISTRY.lock:
+        RESPONSE_CACHE.inc(route=route_label(request), result=result)
@@ -0,0 +1,148 @@
+import logging
+import time
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from brainbox import metrics, profiling
+from brainbox.routers import routing_scope
+
+logger = logging.getLogger('brainbox.profiling')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keep a client's reads on the primary database while the replicas may
+    not have its writes yet: for the whole of an unsafe request, and for
+    BRAINBOX_REPLICA_LAG seconds after a request that wrote, which is
+    remembered in a cookie.
+
+    Async-capable, so it does not cost ASGI requests a thread of their own.
+    """
+    cookie_name = 'brainbox_pinned'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing_scope(self.is_pinned(request)) as scope:
+            response = self.get_response(request)
+        return self.process_response(response, scope)
+
+    async def __acall__(self, request):
+        with routing_scope(self.is_pinned(request)) as scope:
+            response = await self.get_response(request)
+        return self.process_response(response, scope)
+
+    def is_pinned(self, request):
+        return request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES
+
+    def process_response(self, response, scope):
+        if scope['wrote']:
+            response.set_cookie(self.cookie_name, '1', max_age=getattr(settings, 'BRAINBOX_REPLICA_LAG', 5))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in (BRAINBOX_PROFILING) request profiling: the number and total
+    time of the SQL statements and the time spent serializing, returned in
+    a `Server-Timing` header. Requests slower than BRAINBOX_SLOW_REQUEST_MS
+    are logged to `brainbox.profiling` with their slowest statements, and
+    every request is aggregated into per-route statistics served at
+    /debug/perf/.
+
+    Put it first, so the timings cover the rest of the middleware. The
+    time of a streamed response ends when its first byte is ready.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling.profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.install()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tic = time.perf_counter()
+        with profiling.Profile().activate() as profile:
+            response = self.get_response(request)
+        return self.process_response(request, response, profile, time.perf_counter() - tic)
+
+    async def __acall__(self, request):
+        tic = time.perf_counter()
+        with profiling.Profile().activate() as profile:
+            response = await self.get_response(request)
+        return self.process_response(request, response, profile, time.perf_counter() - tic)
+
+    def process_response(self, request, response, profile, elapsed):
+        response['Server-Timing'] = (
+            f'db;dur={profile.sql_time * 1000:.3f};desc="{profile.queries} queries", '
+            f'serialize;dur={profile.serialize_time * 1000:.3f}, '
+            f'total;dur={elapsed * 1000:.3f}'
+        )
+        profiling.record(request.method, metrics.route_label(request), elapsed * 1000, profile)
+
+        if elapsed * 1000 >= getattr(settings, 'BRAINBOX_SLOW_REQUEST_MS', 500):
+            logger.warning(
+                'Slow request: %s %s %s in %.1f ms, %d queries in %.1f ms, serialization %.1f ms; slowest: %s',
+                request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+                profile.queries, profile.sql_time * 1000, profile.serialize_time * 1000,
+                '; '.join(f'{elapsed * 1000:.1f} ms {sql}' for sql, elapsed in profile.slowest_statements()) or '-',
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Records the rate, latency, response size and query count of the
+    requests per route in `brainbox.metrics.REGISTRY`, served at /metrics.
+    On unless BRAINBOX_METRICS is False. Only the statements are timed, not
+    serialization, which is left to the opt-in ProfilingMiddleware. Put it
+    after ProfilingMiddleware, whose profile it then shares.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.install_execute_wrapper()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.profile() as profile:
+            queries, tic = profile.queries, time.perf_counter()
+            response = self.get_response(request)
+            metrics.observe_request(request, response, time.perf_counter() - tic, profile.queries - queries)
+        return response
+
+    async def __acall__(self, request):
+        with self.profile() as profile:
+            queries, tic = profile.queries, time.perf_counter()
+            response = await self.get_response(request)
+            metrics.observe_request(request, response, time.perf_counter() - tic, profile.queries - queries)
+        return response
+
+    def profile(self):
+        profile = profiling.current()
+        return nullcontext(profile) if profile is not None else profiling.Profile().activate()
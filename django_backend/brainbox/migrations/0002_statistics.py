@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_statistics(apps, schema_editor):
+    tables = {
+        name: apps.get_model('brainbox', name)._meta.db_table
+        for name in ('User', 'Folder', 'File', 'SharedFile', 'UserStatistics', 'FolderStatistics')
+    }
+    schema_editor.execute(
+        'INSERT INTO {UserStatistics} (user_id, written_chars) '
+        'SELECT u.id, COALESCE(SUM(LENGTH(f.content)), 0) '
+        'FROM {User} u LEFT JOIN {File} f ON f.user_id = u.id '
+        'GROUP BY u.id'.format(**tables)
+    )
+    schema_editor.execute(
+        'INSERT INTO {FolderStatistics} (folder_id, num_shared_users) '
+        'SELECT d.id, COUNT(s.id) '
+        'FROM {Folder} d LEFT JOIN {File} f ON f.folder_id = d.id '
+        'LEFT JOIN {SharedFile} s ON s.file_id = f.id '
+        'GROUP BY d.id'.format(**tables)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderStatistics',
+            fields=[
+                ('folder', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='brainbox.folder')),
+                ('num_shared_users', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserStatistics',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='brainbox.user')),
+                ('written_chars', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userstatistics',
+            index=models.Index(fields=['-written_chars', 'user'], name='userstats_written_chars_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folderstatistics',
+            index=models.Index(fields=['-num_shared_users', 'folder'], name='folderstats_shared_users_idx'),
+        ),
+        migrations.RunPython(populate_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    counters = (
+        ('User', 'num_personal_files', 'File', 'user_id'),
+        ('Folder', 'num_files', 'File', 'folder_id'),
+        ('File', 'num_shared_users', 'SharedFile', 'file_id'),
+    )
+    for model, field, counted_model, fk in counters:
+        table = apps.get_model('brainbox', model)._meta.db_table
+        counted_table = apps.get_model('brainbox', counted_model)._meta.db_table
+        schema_editor.execute(
+            f'UPDATE {table} SET {field} = '
+            f'(SELECT COUNT(*) FROM {counted_table} WHERE {counted_table}.{fk} = {table}.id)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0002_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='num_shared_users',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='num_files',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='num_personal_files',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from brainbox.search import create_trigram_indexes, drop_trigram_indexes
+
+
+def create_trigram(apps, schema_editor):
+    create_trigram_indexes(schema_editor)
+
+
+def drop_trigram(apps, schema_editor):
+    drop_trigram_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0003_counter_columns'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='personal_files', to='brainbox.user'),
+        ),
+        migrations.AlterField(
+            model_name='folder',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='folders', to='brainbox.user'),
+        ),
+        migrations.AlterField(
+            model_name='sharedfile',
+            name='file',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='brainbox.file'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['user', 'folder'], name='file_user_folder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['user', 'parent_folder'], name='folder_user_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['file', 'user'], name='sharedfile_file_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='user_created_at_idx'),
+        ),
+        migrations.RunPython(create_trigram, drop_trigram),
+    ]
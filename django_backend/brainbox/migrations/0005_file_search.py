@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from brainbox.search import create_file_search_index, drop_file_search_index
+
+
+def create_search_index(apps, schema_editor):
+    create_file_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    drop_file_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0004_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:44
+
+import hashlib
+
+from django.db import migrations, models
+
+from brainbox.search import create_file_search_index
+
+
+def populate_content_summary(apps, schema_editor):
+    table = apps.get_model('brainbox', 'File')._meta.db_table
+    schema_editor.execute(f'UPDATE {table} SET content_length = LENGTH(content)')
+    with schema_editor.connection.cursor() as read, schema_editor.connection.cursor() as write:
+        read.execute(f'SELECT id, content FROM {table}')
+        while True:
+            rows = read.fetchmany(2000)
+            if not rows:
+                break
+            write.executemany(
+                f'UPDATE {table} SET content_hash = %s WHERE id = %s',
+                [(hashlib.sha256(content.encode('utf-8')).hexdigest(), pk) for pk, content in rows]
+            )
+
+
+def recreate_search_index(apps, schema_editor):
+    # Adding a column with a default rebuilds the table on SQLite, which
+    # drops the triggers keeping the full-text index in sync.
+    create_file_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0005_file_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='content_length',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_content_summary, migrations.RunPython.noop),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+    ]
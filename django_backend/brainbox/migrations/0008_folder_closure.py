@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_hierarchy(apps, schema_editor):
+    # Folders on (or below) a parent cycle are only linked to themselves.
+    tables = {name: apps.get_model('brainbox', name)._meta.db_table for name in ('Folder', 'FolderClosure')}
+    schema_editor.execute(
+        'INSERT INTO {FolderClosure} (ancestor_id, descendant_id, depth) '
+        'WITH RECURSIVE tree(id) AS ('
+        'SELECT id FROM {Folder} WHERE parent_folder_id IS NULL '
+        'UNION ALL '
+        'SELECT f.id FROM {Folder} f JOIN tree t ON f.parent_folder_id = t.id'
+        '), links(ancestor_id, descendant_id, depth) AS ('
+        'SELECT id, id, 0 FROM {Folder} '
+        'UNION ALL '
+        'SELECT l.ancestor_id, f.id, l.depth + 1 FROM links l '
+        'JOIN tree t ON t.id = l.descendant_id '
+        'JOIN {Folder} f ON f.parent_folder_id = l.descendant_id'
+        ') '
+        'SELECT ancestor_id, descendant_id, depth FROM links'.format(**tables)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brainbox', '0007_sharedfile_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='brainbox.folder')),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='brainbox.folder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='folderclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='folderclosure_descendant_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='folderclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_folder_closure'),
+        ),
+        migrations.RunPython(populate_hierarchy, migrations.RunPython.noop),
+    ]
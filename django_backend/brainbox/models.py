@@ -1,40 +1,156 @@
+import hashlib
+
 from django.db import models
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+CONTENT_PREVIEW_LENGTH = 200
+
+
+class CounterCacheModel(models.Model):
+    """
+    Model with denormalized counter columns (`counter_fields`) that are only
+    ever changed through F() updates. Saving an existing instance leaves
+    them out of the UPDATE so a stale in-memory value never overwrites them.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
 
-class User(models.Model):
+class User(CounterCacheModel):
     username = models.CharField(max_length=100, unique=True)
     email = models.EmailField(unique=True)
     password = models.CharField(max_length=100)
+    num_personal_files = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    counter_fields = ('num_personal_files',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='user_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"username: {self.username}"
 
 
-class Folder(models.Model):
+class Folder(CounterCacheModel):
     name = models.CharField(max_length=100, db_index=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folders')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folders', db_index=False)
     parent_folder = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='child_folders')
+    num_files = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    counter_fields = ('num_files',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'parent_folder'], name='folder_user_parent_idx'),
+        ]
+
     def __str__(self):
         return f"name: {self.name}"
 
+    def ancestors(self):
+        """
+        Folders above this one, nearest first, in one query.
+        """
+        return Folder.objects.filter(
+            descendant_links__descendant=self, descendant_links__depth__gt=0
+        ).order_by('descendant_links__depth')
+
+    def descendants(self):
+        """
+        Folders anywhere below this one, in one query.
+        """
+        return Folder.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0)
+
+    def contains(self, folder):
+        """
+        Whether `folder` is this folder or one below it.
+        """
+        return FolderClosure.objects.filter(ancestor=self, descendant=folder).exists()
+
+
+class FolderClosure(models.Model):
+    """
+    One row per (ancestor, descendant) pair of the folder hierarchy, each
+    folder included as its own ancestor at depth 0. Maintained by the
+    signals on Folder; see brainbox.hierarchy.
+    """
+    ancestor = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='descendant_links', db_index=False)
+    descendant = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='ancestor_links', db_index=False)
+    depth = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_folder_closure')
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='folderclosure_descendant_idx'),
+        ]
+
 
-class File(models.Model):
+class FileQuerySet(models.QuerySet):
+    def summaries(self):
+        """
+        Files without their `content`, carrying only its first
+        CONTENT_PREVIEW_LENGTH characters as `content_preview`.
+        """
+        return self.defer('content').annotate(content_preview=Substr('content', 1, CONTENT_PREVIEW_LENGTH))
+
+
+class File(CounterCacheModel):
     name = models.CharField(max_length=100)
     content = models.TextField(blank=True, default='')
+    content_length = models.IntegerField(default=0, editable=False)
+    content_hash = models.CharField(max_length=64, default='', editable=False)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name='files')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_files')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_files', db_index=False)
     shared_users = models.ManyToManyField(User, through='SharedFile')
+    num_shared_users = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FileQuerySet.as_manager()
+
+    counter_fields = ('num_shared_users',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'folder'], name='file_user_folder_idx'),
+        ]
+
     def __str__(self):
         return f"name: {self.name}"
 
+    @staticmethod
+    def hash_content(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        if 'content' not in self.get_deferred_fields():
+            self.content_length = len(self.content)
+            self.content_hash = self.hash_content(self.content)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'content_length', 'content_hash'}
+        super().save(*args, **kwargs)
+
 
 class SharedFile(models.Model):
     class Permissions(models.TextChoices):
@@ -42,10 +158,71 @@ class SharedFile(models.Model):
         RW = ('RW', 'Read-Write')
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shared_files')
-    file = models.ForeignKey(File, on_delete=models.CASCADE)
+    file = models.ForeignKey(File, on_delete=models.CASCADE, db_index=False)
     permission = models.CharField(max_length=2, choices=Permissions.choices)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'file'], name='unique_shared_file')
         ]
+        indexes = [
+            models.Index(fields=['file', 'user'], name='sharedfile_file_user_idx'),
+        ]
+
+
+class UserStatistics(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    written_chars = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-written_chars', 'user'], name='userstats_written_chars_idx')
+        ]
+
+
+class FolderStatistics(models.Model):
+    folder = models.OneToOneField(Folder, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    num_shared_users = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-num_shared_users', 'folder'], name='folderstats_shared_users_idx')
+        ]
+
+
+class Job(models.Model):
+    """
+    Unit of background work for `manage.py run_worker`: the registered
+    `task` called with `arguments`. See brainbox.jobs.
+    """
+    class Status(models.TextChoices):
+        QUEUED = ('queued', 'Queued')
+        RUNNING = ('running', 'Running')
+        SUCCEEDED = ('succeeded', 'Succeeded')
+        FAILED = ('failed', 'Failed')
+
+    task = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    timeout = models.IntegerField(default=600)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    progress = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"job {self.pk}: {self.task} ({self.status})"
@@ -0,0 +1,318 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.functional import cached_property
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from brainbox import counting
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds, which would make
+    # a cursor on `created_at` land before rows it has already returned.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Keyset (seek) pagination over a stable ordering such as `('id',)` or
+    `('created_at', 'id')`. The cursor stores the ordering values of the
+    boundary row, so every page is fetched with an indexed range filter
+    instead of an OFFSET, and no COUNT(*) is run.
+
+    The ordering is taken from the view's `get_keyset_ordering()` (or its
+    `keyset_ordering` attribute) and must end with a unique field.
+    """
+    page_size = 25
+    page_size_query_param = 'per_page'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset._prefetch_related_lookups:
+            # Async iteration does not support prefetching.
+            return self.set_page(await sync_to_async(list)(queryset))
+        return self.set_page([row async for row in queryset])
+
+    def page_queryset(self, queryset, request, view):
+        """
+        The (unevaluated) slice of `queryset` holding the requested page
+        plus one row, which tells whether there is more.
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+
+        cursor = self.decode_cursor(request, queryset)
+        self.position, self.reverse = cursor if cursor is not None else (None, False)
+
+        ordering = [self._reverse(field) for field in self.ordering] if self.reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request, queryset):
+        """
+        `(position, reverse)` of the request's cursor, the position values
+        converted by their ordering fields, or None without a cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = data['p']
+            reverse = bool(data.get('r', False))
+            if not isinstance(position, list) or len(position) != len(self.ordering) or None in position:
+                raise ValueError
+            position = [
+                self._ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        data = {'p': position}
+        if reverse:
+            data['r'] = True
+        encoded = json.dumps(data, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(encoded.encode('utf-8')).decode('ascii')
+
+    def _link(self, instance, reverse):
+        position = [getattr(instance, field.lstrip('-')) for field in self.ordering]
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    @staticmethod
+    def _ordering_field(queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _seek_filter(ordering, position):
+        # (a, b, c) > (x, y, z) expanded as
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        seek = Q()
+        for i, field in enumerate(ordering):
+            attr = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition = Q(**{attr + lookup: position[i]})
+            for previous, value in zip(ordering[:i], position[:i]):
+                condition &= Q(**{previous.lstrip('-'): value})
+            seek |= condition
+        return seek
+
+
+class CountedPaginator(Paginator):
+    """
+    Django paginator whose total is produced by `counter` instead of
+    `object_list.count()`.
+    """
+    def __init__(self, object_list, per_page, counter, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.counter = counter
+
+    @cached_property
+    def count(self):
+        return self.counter()
+
+
+class Pagination(pagination.PageNumberPagination):
+    """
+    Page number pagination by default; `?pagination=cursor` (or any request
+    carrying a `cursor`) switches to keyset pagination so deep pages cost
+    the same as the first one.
+
+    The total count is produced by the strategy named in `?count=`:
+    `exact`, `cached` (per endpoint and filter set, invalidated by writes
+    to the listed model or to the view's `cache_models`) or `estimate`
+    (planner statistics, unfiltered listings only).
+    """
+    page_size = 25
+    page_size_query_param = 'per_page'
+    page_query_param = 'page'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset_class = KeysetPagination
+    non_filter_params = ('page', 'per_page', 'pagination', 'cursor', 'count', 'agg')
+
+    keyset = None
+    count_is_estimate = False
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.request = request
+        self.view = view
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        # Page numbers go through Django's Paginator, which is synchronous.
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+    def django_paginator_class(self, queryset, page_size):
+        # Called by PageNumberPagination.paginate_queryset in place of the
+        # Django paginator class, so the count can depend on the request.
+        return CountedPaginator(queryset, page_size, counter=lambda: self.get_count(queryset))
+
+    def get_count_strategy(self):
+        strategy = self.request.query_params.get(self.count_query_param)
+        if strategy in counting.STRATEGIES:
+            return strategy
+        return getattr(settings, 'BRAINBOX_COUNT_STRATEGY', counting.CACHED)
+
+    def get_count(self, queryset):
+        strategy = self.get_count_strategy()
+        if strategy == counting.ESTIMATE:
+            count = counting.estimated_count(queryset)
+            if count is not None:
+                self.count_is_estimate = True
+                return count
+            strategy = counting.CACHED
+
+        if strategy == counting.CACHED:
+            params = {
+                key: value for key, value in self.request.query_params.items()
+                if key not in self.non_filter_params
+            }
+            return counting.cached_count(
+                type(self.view).__name__, queryset, params, getattr(self.view, 'cache_models', ())
+            )
+
+        return counting.exact_count(queryset)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_estimate', self.count_is_estimate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean'}
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.extend([
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "Set to 'cursor' to use keyset pagination.",
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.keyset_class.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The keyset pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'How the total count is computed.',
+                'schema': {'type': 'string', 'enum': list(counting.STRATEGIES)},
+            },
+        ])
+        return parameters
@@ -0,0 +1,221 @@
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+# Upper bounds (ms) of the request duration histogram buckets; the last
+# bucket takes everything slower.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Statements kept per request and per route, slowest first.
+SLOWEST = 5
+
+# Profile of the request being handled, when profiling is on.
+_current = ContextVar('brainbox_profile', default=None)
+
+
+def profiling_enabled():
+    return getattr(settings, 'BRAINBOX_PROFILING', False)
+
+
+class Profile:
+    """
+    What one request spent on the database and on serialization. The
+    statements are timed by `execute_wrapper` below; their SQL is kept
+    without the parameters.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        tic = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - tic
+            self.queries += 1
+            self.sql_time += elapsed
+            heapq.heappush(self.slowest, (elapsed, sql))
+            if len(self.slowest) > SLOWEST:
+                heapq.heappop(self.slowest)
+
+    def slowest_statements(self):
+        return [(sql, elapsed) for elapsed, sql in sorted(self.slowest, reverse=True)]
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def serializing():
+    """
+    Count the block as serialization time of the current profile, once:
+    nested serializations are part of the outer one.
+    """
+    profile = _current.get()
+    if profile is None or profile.serializing:
+        yield
+        return
+    profile.serializing = True
+    tic = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serialize_time += time.perf_counter() - tic
+        profile.serializing = False
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def add_execute_wrapper(sender, connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def install_execute_wrapper():
+    """
+    Time the statements of every connection.
+
+    Connections are per thread, and async views query from worker threads,
+    so rather than wrapping the connections of the request's thread the
+    wrapper stays on all of them and finds the profile through a context
+    variable, which follows the request into those threads. Outside a
+    profiled request it only costs that lookup. Idempotent.
+    """
+    connection_created.connect(add_execute_wrapper, dispatch_uid='brainbox.profiling')
+    for connection in connections.all(initialized_only=True):
+        add_execute_wrapper(None, connection)
+
+
+def install():
+    """
+    Time the statements of every connection (see `install_execute_wrapper`)
+    and `BaseSerializer.data`, which every serialization (list, nested or
+    not) goes through. Idempotent.
+    """
+    install_execute_wrapper()
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'profiled', False):
+        return
+
+    def profiled_data(self):
+        with serializing():
+            return data.fget(self)
+
+    profiled_data.profiled = True
+    BaseSerializer.data = property(profiled_data)
+
+
+class RouteStats:
+    """
+    Aggregate of the profiled requests of one route: a duration histogram
+    over BUCKETS_MS, totals of the query counts and times, and the slowest
+    statements seen.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.serialize_ms = 0.0
+        self.slowest = []
+
+    def add(self, duration_ms, profile):
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if duration_ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.queries += profile.queries
+        self.sql_ms += profile.sql_time * 1000
+        self.serialize_ms += profile.serialize_time * 1000
+        for sql, elapsed in profile.slowest_statements():
+            heapq.heappush(self.slowest, (elapsed * 1000, sql))
+            if len(self.slowest) > SLOWEST:
+                heapq.heappop(self.slowest)
+
+    def percentile(self, q):
+        """
+        Upper bound (ms) of the bucket holding the `q` percentile, or the
+        maximum for the last bucket.
+        """
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3),
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'mean_queries': round(self.queries / self.count, 2),
+            'mean_sql_ms': round(self.sql_ms / self.count, 3),
+            'mean_serialize_ms': round(self.serialize_ms / self.count, 3),
+            'histogram': {
+                **{f'le_{bound}': count for bound, count in zip(BUCKETS_MS, self.buckets)},
+                'inf': self.buckets[-1],
+            },
+            'slowest_statements': [
+                {'sql': sql, 'ms': round(elapsed, 3)} for elapsed, sql in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+# Per-process statistics, keyed by (method, route).
+_routes = {}
+_lock = threading.Lock()
+
+
+def record(method, route, duration_ms, profile):
+    with _lock:
+        _routes.setdefault((method, route), RouteStats()).add(duration_ms, profile)
+
+
+def route_statistics():
+    """
+    `[{method, route, ...RouteStats.as_dict()}]`, busiest routes (by total
+    time) first.
+    """
+    with _lock:
+        items = sorted(_routes.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return [{'method': method, 'route': route, **stats.as_dict()} for (method, route), stats in items]
+
+
+def reset_route_statistics():
+    with _lock:
+        _routes.clear()
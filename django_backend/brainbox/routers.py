@@ -0,0 +1,71 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Set while the current request must read from the primary: it wrote, or
+# its client wrote recently enough that the replicas may still lag behind.
+_pinned = ContextVar('brainbox_pinned', default=False)
+# Set once anything in the current request was routed for writing.
+_wrote = ContextVar('brainbox_wrote', default=False)
+
+
+def routing(model):
+    """
+    `{'primary': alias, 'replicas': [aliases]}` for `model`: the
+    BRAINBOX_DATABASE_ROUTING defaults, updated with the entry for the
+    model's label (e.g. 'brainbox.file') under 'models'.
+    """
+    config = getattr(settings, 'BRAINBOX_DATABASE_ROUTING', {})
+    result = {'primary': config.get('primary', DEFAULT_DB_ALIAS), 'replicas': config.get('replicas', [])}
+    result.update(config.get('models', {}).get(model._meta.label_lower, {}))
+    return result
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """
+    Scope read-your-writes stickiness to a block (a request): reads go to
+    the primary from the start when `pinned`, otherwise from the first
+    write on. The yielded dict's 'wrote' tells afterwards whether anything
+    was routed for writing inside the block.
+    """
+    pinned = _pinned.set(pinned)
+    wrote = _wrote.set(False)
+    state = {}
+    try:
+        yield state
+    finally:
+        state['wrote'] = _wrote.get()
+        _wrote.reset(wrote)
+        _pinned.reset(pinned)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and spread reads across the replicas, except
+    for reads that must see this request's (or this client's) own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        config = routing(model)
+        if _pinned.get() or not config['replicas']:
+            return config['primary']
+        return random.choice(config['replicas'])
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        _pinned.set(True)
+        return routing(model)['primary']
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as their primary.
+        config = routing(obj1)
+        if {obj1._state.db, obj2._state.db} <= {config['primary'], *config['replicas']}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,187 @@
+import re
+
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr
+
+# (table, column) pairs filtered with `icontains` by the list endpoints.
+TRIGRAM_INDEXES = (
+    ('brainbox_user', 'username'),
+    ('brainbox_folder', 'name'),
+)
+
+FILE_TABLE = 'brainbox_file'
+FILE_SEARCH_INDEX = 'brainbox_file_fts'
+FILE_SEARCH_VECTOR = "to_tsvector('english', brainbox_file.name || ' ' || brainbox_file.content)"
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_TOKENS = 16
+
+
+def trigram_name(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def create_trigram_indexes(schema_editor):
+    """
+    Substring indexes backing `icontains`: an external-content FTS5 table
+    with the trigram tokenizer kept in sync by triggers on SQLite, a
+    pg_trgm GIN index on PostgreSQL. Idempotent, so migrations that rebuild
+    one of the tables (which drops its triggers on SQLite) can call it again.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRIGRAM_INDEXES:
+        name = trigram_name(table, column)
+        if vendor == 'sqlite':
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} "
+                f"USING fts5({column}, content='{table}', content_rowid='id', tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN '
+                f'INSERT INTO {name}(rowid, {column}) VALUES (new.id, new.{column}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN '
+                f"INSERT INTO {name}({name}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {column} ON {table} BEGIN '
+                f"INSERT INTO {name}({name}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+                f'INSERT INTO {name}(rowid, {column}) VALUES (new.id, new.{column}); END'
+            )
+            schema_editor.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+        elif vendor == 'postgresql':
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in TRIGRAM_INDEXES:
+        name = trigram_name(table, column)
+        if vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {name}')
+        elif vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def contains(model, field, value):
+    """
+    Case-insensitive substring filter on `field`, equivalent to
+    `field__icontains` but answered from the trigram index on SQLite.
+    PostgreSQL uses its trigram index for the plain `icontains` query.
+    """
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    column = model._meta.get_field(field).column
+    if (connection.vendor == 'sqlite' and (table, column) in TRIGRAM_INDEXES
+            and not any(char in value for char in '%_\\')):
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {trigram_name(table, column)} WHERE {column} LIKE %s', ('%' + value + '%',)
+        ))
+    return Q(**{field + '__icontains': value})
+
+
+def create_file_search_index(schema_editor):
+    """
+    Inverted index over file names and contents: an external-content FTS5
+    table kept in sync by triggers on SQLite, a GIN index on the tsvector
+    expression used by `search_files` on PostgreSQL. Idempotent.
+    """
+    vendor = schema_editor.connection.vendor
+    name = FILE_SEARCH_INDEX
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} "
+            f"USING fts5(name, content, content='{FILE_TABLE}', content_rowid='id', tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {FILE_TABLE} BEGIN '
+            f'INSERT INTO {name}(rowid, name, content) VALUES (new.id, new.name, new.content); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {FILE_TABLE} BEGIN '
+            f"INSERT INTO {name}({name}, rowid, name, content) VALUES ('delete', old.id, old.name, old.content); END"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF name, content ON {FILE_TABLE} BEGIN '
+            f"INSERT INTO {name}({name}, rowid, name, content) VALUES ('delete', old.id, old.name, old.content); "
+            f'INSERT INTO {name}(rowid, name, content) VALUES (new.id, new.name, new.content); END'
+        )
+        schema_editor.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {FILE_TABLE} "
+            f"USING gin (to_tsvector('english', name || ' ' || content))"
+        )
+
+
+def drop_file_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    name = FILE_SEARCH_INDEX
+    if vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {name}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def fts5_query(text):
+    """
+    Turn free text into an FTS5 query matching every word, quoting each one
+    so user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r'\w+', text)
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def search_files(queryset, text):
+    """
+    Filter a File queryset to the rows matching `text` and annotate them
+    with `rank` (higher is better) and a highlighted `snippet` of the
+    content, ordered by rank.
+    """
+    vendor = connections[queryset.db].vendor
+    name = FILE_SEARCH_INDEX
+
+    if vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {name} WHERE {name} MATCH %s', (query,)))
+        queryset = queryset.annotate(
+            rank=RawSQL(
+                f'SELECT -bm25({name}, 10.0, 1.0) FROM {name} WHERE {name} MATCH %s AND rowid = {FILE_TABLE}.id',
+                (query,), output_field=FloatField()
+            ),
+            snippet=RawSQL(
+                f"SELECT snippet({name}, 1, %s, %s, '…', %s) FROM {name} WHERE {name} MATCH %s AND rowid = {FILE_TABLE}.id",
+                (SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, query), output_field=TextField()
+            ),
+        )
+    elif vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        queryset = queryset.annotate(
+            matches=RawSQL(f'{FILE_SEARCH_VECTOR} @@ {tsquery}', (text,), output_field=BooleanField()),
+            rank=RawSQL(f'ts_rank({FILE_SEARCH_VECTOR}, {tsquery})', (text,), output_field=FloatField()),
+            snippet=RawSQL(
+                f"ts_headline('english', {FILE_TABLE}.content, {tsquery}, %s)",
+                (text, f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords={SNIPPET_TOKENS}, MinWords=5'),
+                output_field=TextField()
+            ),
+        ).filter(matches=True)
+    else:
+        queryset = queryset.filter(Q(name__icontains=text) | Q(content__icontains=text)).annotate(
+            rank=Value(0.0, output_field=FloatField()),
+            snippet=Substr('content', 1, 200),
+        )
+
+    return queryset.order_by('-rank', 'id')
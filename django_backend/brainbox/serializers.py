@@ -1,8 +1,14 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.generics import get_object_or_404
 
+from brainbox import bulk
 from brainbox.models import *
 
+BULK_BATCH_SIZE = 500
+BULK_MAX_ITEMS = 1000
+
 
 class DynamicFieldsModelSerializer(serializers.ModelSerializer):
     """
@@ -10,12 +16,16 @@ class DynamicFieldsModelSerializer(serializers.ModelSerializer):
     controls which fields should be displayed.
     """
     def __init__(self, *args, **kwargs):
-        kwargs.pop('fields', None)
+        fields = kwargs.pop('fields', None)
         exclude_fields = kwargs.pop('exclude_fields', None)
 
         # Instantiate the superclass normally
         super().__init__(*args, **kwargs)
 
+        if fields is not None:
+            for field in set(self.fields) - set(fields):
+                self.fields.pop(field)
+
         if exclude_fields is not None:
             for field in exclude_fields:
                 split = field.split('__')
@@ -60,8 +70,37 @@ class FolderSerializerList(serializers.ModelSerializer):
         fields = ['id', 'name', 'user', 'parent_folder', 'created_at', 'updated_at', 'num_files']
 
 
-class FileSerializerList(serializers.ModelSerializer):
+def include_content(context):
+    """
+    Whether the request asked for full file bodies, with `?include=content`
+    or by naming `content` in `?fields=`.
+    """
+    request = context.get('request')
+    if request is None:
+        return False
+    requested = request.query_params.get('include', '').split(',') + request.query_params.get('fields', '').split(',')
+    return 'content' in requested
+
+
+class FileSerializerList(DynamicFieldsModelSerializer):
+    """
+    Summary of a file: the body is write-only and replaced by its length,
+    hash and first characters unless the request opts in to `content`.
+    """
     num_shared_users = serializers.IntegerField(read_only=True)
+    content_preview = serializers.SerializerMethodField()
+
+    def get_content_preview(self, file):
+        preview = getattr(file, 'content_preview', None)
+        if preview is None:
+            preview = file.content[:CONTENT_PREVIEW_LENGTH]
+        return preview
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if include_content(self.context) and 'content' in self.fields:
+            data['content'] = instance.content
+        return data
 
     def validate(self, data):
         errors = {}
@@ -82,7 +121,8 @@ class FileSerializerList(serializers.ModelSerializer):
 
     class Meta:
         model = File
-        fields = ['id', 'name', 'content', 'folder', 'user', 'created_at', 'updated_at', 'num_shared_users']
+        fields = ['id', 'name', 'content', 'content_preview', 'content_length', 'content_hash', 'folder', 'user', 'created_at', 'updated_at', 'num_shared_users']
+        extra_kwargs = {'content': {'write_only': True}}
 
 
 class SharedFileSerializer(DynamicFieldsModelSerializer):
@@ -130,11 +170,15 @@ class FolderSerializerDetail(serializers.ModelSerializer):
     user = UserSerializerList(read_only=True)
     parent_folder = FolderSerializerList()
     files = FileSerializerList(many=True, read_only=True)
+    total_files = serializers.IntegerField(read_only=True)
+    total_chars = serializers.IntegerField(read_only=True)
 
     def validate_parent_folder(self, parent_folder):
         if parent_folder is not None:
             if parent_folder == self.instance:
                 raise serializers.ValidationError('Folder cannot be its own parent folder.')
+            if self.instance.contains(parent_folder):
+                raise serializers.ValidationError('Folder cannot be moved into one of its own subfolders.')
             user = self.instance.user
             if parent_folder.user != user:
                 raise serializers.ValidationError('Parent folder must be created by the same user.')
@@ -142,7 +186,7 @@ class FolderSerializerDetail(serializers.ModelSerializer):
 
     class Meta:
         model = Folder
-        fields = ['id', 'name', 'user', 'parent_folder', 'created_at', 'updated_at', 'files']
+        fields = ['id', 'name', 'user', 'parent_folder', 'created_at', 'updated_at', 'total_files', 'total_chars', 'files']
 
 
 class FileSerializerDetail(serializers.ModelSerializer):
@@ -162,40 +206,183 @@ class FileSerializerDetail(serializers.ModelSerializer):
         fields = ['id', 'name', 'content', 'folder', 'user', 'created_at', 'updated_at', 'shared_users']
 
 
+class FileSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = File
+        fields = ['id', 'name', 'folder', 'user', 'created_at', 'updated_at', 'num_shared_users', 'rank', 'snippet']
+
+
 class UsersByCharsWrittenSerializer(serializers.ModelSerializer):
-    written_chars = serializers.IntegerField()
+    id = serializers.IntegerField(source='user.id')
+    username = serializers.CharField(source='user.username')
+    email = serializers.EmailField(source='user.email')
+    password = serializers.CharField(source='user.password')
+    created_at = serializers.DateTimeField(source='user.created_at')
+    updated_at = serializers.DateTimeField(source='user.updated_at')
 
     class Meta:
-        model = User
+        model = UserStatistics
         fields = ['id', 'username', 'email', 'password', 'written_chars', 'created_at', 'updated_at']
 
 
 class FoldersByFilesSharedUsersSerializer(serializers.ModelSerializer):
-    num_shared_users = serializers.IntegerField()
+    id = serializers.IntegerField(source='folder.id')
+    name = serializers.CharField(source='folder.name')
+    user = serializers.IntegerField(source='folder.user_id')
+    parent_folder = serializers.IntegerField(source='folder.parent_folder_id', allow_null=True)
+    created_at = serializers.DateTimeField(source='folder.created_at')
+    updated_at = serializers.DateTimeField(source='folder.updated_at')
 
     class Meta:
-        model = Folder
+        model = FolderStatistics
         fields = ['id', 'name', 'user', 'parent_folder', 'num_shared_users', 'created_at', 'updated_at']
 
 
-# class FolderFilesSerializerList(serializers.ModelSerializer):
-#     id = serializers.IntegerField()
-#
-#     def validate_id(self, file_id):
-#         file = get_object_or_404(File, pk=file_id)
-#         folder = self.context['folder']
-#         if file.user != folder.user:
-#             raise serializers.ValidationError('File and folder must be created by the same user.')
-#         return file_id
-#
-#     def create(self, validated_data):
-#         file_id = validated_data['id']
-#         file = get_object_or_404(File, pk=file_id)
-#         file.folder = validated_data['folder']
-#         db = validated_data.get('using', None)
-#         file.save(using=db)
-#         return file
-#
-#     class Meta:
-#         model = File
-#         fields = ['id']
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    A ListSerializer whose items are checked together by `validate_batch`,
+    so cross-model checks cost one query per referenced model instead of
+    one per item. `validate_batch` returns one error dict per item.
+    """
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        errors = self.validate_batch(items)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def validate_batch(self, items):
+        return [{} for _ in items]
+
+
+class FileBulkListSerializer(BulkListSerializer):
+    def validate_batch(self, items):
+        user_ids = set(User.objects.filter(pk__in={item['user'] for item in items}).values_list('id', flat=True))
+        folder_users = dict(Folder.objects.filter(
+            pk__in={item['folder'] for item in items if item['folder'] is not None}
+        ).values_list('id', 'user_id'))
+
+        errors = []
+        for item in items:
+            item_errors = {}
+            if item['user'] not in user_ids:
+                item_errors['user'] = [f'Invalid pk "{item["user"]}" - object does not exist.']
+            if item['folder'] is not None:
+                if item['folder'] not in folder_users:
+                    item_errors['folder'] = [f'Invalid pk "{item["folder"]}" - object does not exist.']
+                elif folder_users[item['folder']] != item['user']:
+                    item_errors['folder'] = ['Folder must be created by the same user.']
+            errors.append(item_errors)
+        return errors
+
+    def create(self, validated_data):
+        files = []
+        for item in validated_data:
+            content = item.get('content', '')
+            files.append(File(
+                name=item['name'], content=content, user_id=item['user'], folder_id=item['folder'],
+                content_length=len(content), content_hash=File.hash_content(content),
+            ))
+        with transaction.atomic():
+            files = File.objects.bulk_create(files, batch_size=BULK_BATCH_SIZE)
+            bulk.files_created(files)
+        return files
+
+
+class FileBulkSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField()
+    folder = serializers.IntegerField(allow_null=True, required=False, default=None)
+
+    class Meta:
+        model = File
+        fields = ['name', 'content', 'folder', 'user']
+        list_serializer_class = FileBulkListSerializer
+
+
+class SharedFileBulkListSerializer(BulkListSerializer):
+    def validate_batch(self, items):
+        file = self.context['file']
+        user_ids = [item['user'] for item in items]
+        self.users = User.objects.in_bulk(user_ids)
+        already_shared = set(SharedFile.objects.filter(file=file, user__in=user_ids).values_list('user_id', flat=True))
+
+        errors = []
+        seen = set()
+        for item in items:
+            item_errors = {}
+            if item['user'] not in self.users:
+                item_errors['user'] = [f'Invalid pk "{item["user"]}" - object does not exist.']
+            elif item['user'] == file.user_id:
+                item_errors['user'] = ['User cannot be the owner of the file.']
+            elif item['user'] in already_shared or item['user'] in seen:
+                item_errors['user'] = ['File is already shared with this user.']
+            seen.add(item['user'])
+            errors.append(item_errors)
+        return errors
+
+    def create(self, validated_data):
+        file = self.context['file']
+        shares = [
+            SharedFile(user=self.users[item['user']], file=file, permission=item['permission'])
+            for item in validated_data
+        ]
+        with transaction.atomic():
+            shares = SharedFile.objects.bulk_create(shares, batch_size=BULK_BATCH_SIZE)
+            bulk.shares_created(file, shares)
+        return shares
+
+
+class SharedFileBulkSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField()
+
+    class Meta:
+        model = SharedFile
+        fields = ['user', 'permission']
+        list_serializer_class = SharedFileBulkListSerializer
+
+
+class FolderFilesListSerializer(BulkListSerializer):
+    def validate_batch(self, items):
+        folder = self.context['folder']
+        self.files = File.objects.only('id', 'user_id', 'folder_id', 'num_shared_users').in_bulk(
+            [item['id'] for item in items]
+        )
+
+        errors = []
+        for item in items:
+            item_errors = {}
+            file = self.files.get(item['id'])
+            if file is None:
+                item_errors['id'] = [f'Invalid pk "{item["id"]}" - object does not exist.']
+            elif file.user_id != folder.user_id:
+                item_errors['id'] = ['File and folder must be created by the same user.']
+            errors.append(item_errors)
+        return errors
+
+    def create(self, validated_data):
+        folder = self.context['folder']
+        files = list(self.files.values())
+        with transaction.atomic():
+            File.objects.filter(pk__in=self.files).update(folder=folder, updated_at=timezone.now())
+            bulk.files_moved(files, folder)
+        return files
+
+
+class FolderFilesSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = File
+        fields = ['id']
+        list_serializer_class = FolderFilesListSerializer
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'progress', 'result', 'error',
+                  'created_at', 'updated_at', 'started_at', 'finished_at']
+        read_only_fields = fields
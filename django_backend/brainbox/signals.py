@@ -0,0 +1,161 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from brainbox.caching import bump_model_version
+from brainbox.counters import adjust_counter
+from brainbox.database import configure_connection
+from brainbox.hierarchy import add_folder, move_folder
+from brainbox.models import User, Folder, File, SharedFile, UserStatistics, FolderStatistics
+from brainbox.statistics import add_written_chars, add_shared_users
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Folder)
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=SharedFile)
+@receiver(post_save, sender=UserStatistics)
+@receiver(post_save, sender=FolderStatistics)
+def invalidate_on_save(sender, instance, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Folder)
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=SharedFile)
+@receiver(post_delete, sender=UserStatistics)
+@receiver(post_delete, sender=FolderStatistics)
+def invalidate_on_delete(sender, instance, **kwargs):
+    bump_model_version(sender)
+
+
+# Statistics rollups
+
+@receiver(post_save, sender=User)
+def create_user_statistics(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStatistics.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Folder)
+def create_folder_statistics(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        FolderStatistics.objects.get_or_create(folder=instance)
+
+
+@receiver(pre_save, sender=File)
+def remember_file_state(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk is not None and not raw:
+        instance._previous_state = (
+            File.objects.filter(pk=instance.pk).values('user_id', 'folder_id', 'content_length').first()
+        )
+
+
+@receiver(post_save, sender=File)
+def update_file_statistics(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    length = instance.content_length
+    previous = getattr(instance, '_previous_state', None)
+    if created or previous is None:
+        add_written_chars(instance.user_id, length)
+        return
+
+    if previous['user_id'] == instance.user_id:
+        add_written_chars(instance.user_id, length - previous['content_length'])
+    else:
+        add_written_chars(previous['user_id'], -previous['content_length'])
+        add_written_chars(instance.user_id, length)
+
+    if previous['folder_id'] != instance.folder_id:
+        num_shared_users = SharedFile.objects.filter(file_id=instance.pk).count()
+        add_shared_users(previous['folder_id'], -num_shared_users)
+        add_shared_users(instance.folder_id, num_shared_users)
+
+
+@receiver(post_delete, sender=File)
+def remove_file_statistics(sender, instance, **kwargs):
+    # The file's SharedFile rows are deleted (and accounted for) first.
+    add_written_chars(instance.user_id, -instance.content_length)
+
+
+@receiver(post_save, sender=SharedFile)
+def add_shared_file_statistics(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_shared_users(File.objects.filter(pk=instance.file_id).values_list('folder_id', flat=True).first(), 1)
+
+
+@receiver(post_delete, sender=SharedFile)
+def remove_shared_file_statistics(sender, instance, **kwargs):
+    add_shared_users(File.objects.filter(pk=instance.file_id).values_list('folder_id', flat=True).first(), -1)
+
+
+# Counter columns
+
+@receiver(post_save, sender=File)
+def update_file_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    if created:
+        adjust_counter(User, 'num_personal_files', instance.user_id, 1)
+        adjust_counter(Folder, 'num_files', instance.folder_id, 1)
+        return
+
+    previous = getattr(instance, '_previous_state', None)
+    if previous is None:
+        return
+    if previous['user_id'] != instance.user_id:
+        adjust_counter(User, 'num_personal_files', previous['user_id'], -1)
+        adjust_counter(User, 'num_personal_files', instance.user_id, 1)
+    if previous['folder_id'] != instance.folder_id:
+        adjust_counter(Folder, 'num_files', previous['folder_id'], -1)
+        adjust_counter(Folder, 'num_files', instance.folder_id, 1)
+
+
+@receiver(post_delete, sender=File)
+def remove_file_counters(sender, instance, **kwargs):
+    adjust_counter(User, 'num_personal_files', instance.user_id, -1)
+    adjust_counter(Folder, 'num_files', instance.folder_id, -1)
+
+
+@receiver(post_save, sender=SharedFile)
+def add_shared_file_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_counter(File, 'num_shared_users', instance.file_id, 1)
+
+
+@receiver(post_delete, sender=SharedFile)
+def remove_shared_file_counter(sender, instance, **kwargs):
+    adjust_counter(File, 'num_shared_users', instance.file_id, -1)
+
+
+# Folder hierarchy
+
+@receiver(pre_save, sender=Folder)
+def remember_folder_state(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk is not None and not raw:
+        instance._previous_state = Folder.objects.filter(pk=instance.pk).values('parent_folder_id').first()
+
+
+@receiver(post_save, sender=Folder)
+def update_folder_hierarchy(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+
+    if created:
+        add_folder(instance.pk, instance.parent_folder_id, using)
+        return
+
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None and previous['parent_folder_id'] != instance.parent_folder_id:
+        move_folder(instance.pk, instance.parent_folder_id, using)
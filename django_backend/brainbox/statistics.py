@@ -0,0 +1,49 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from brainbox.caching import bump_model_version
+from brainbox.models import User, Folder, File, SharedFile, UserStatistics, FolderStatistics
+
+
+def add_written_chars(user_id, delta):
+    if user_id is not None and delta:
+        UserStatistics.objects.filter(user_id=user_id).update(written_chars=F('written_chars') + delta)
+
+
+def add_shared_users(folder_id, delta):
+    if folder_id is not None and delta:
+        FolderStatistics.objects.filter(folder_id=folder_id).update(num_shared_users=F('num_shared_users') + delta)
+
+
+def rebuild_statistics(using=None):
+    """
+    Recompute both rollup tables from scratch with two INSERT ... SELECT
+    statements, for use after bulk loads or to repair drift.
+    """
+    using = using or router.db_for_write(UserStatistics)
+    tables = {
+        'user': User._meta.db_table,
+        'folder': Folder._meta.db_table,
+        'file': File._meta.db_table,
+        'sharedfile': SharedFile._meta.db_table,
+        'userstatistics': UserStatistics._meta.db_table,
+        'folderstatistics': FolderStatistics._meta.db_table,
+    }
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM {userstatistics}'.format(**tables))
+        cursor.execute(
+            'INSERT INTO {userstatistics} (user_id, written_chars) '
+            'SELECT u.id, COALESCE(SUM(LENGTH(f.content)), 0) '
+            'FROM {user} u LEFT JOIN {file} f ON f.user_id = u.id '
+            'GROUP BY u.id'.format(**tables)
+        )
+        cursor.execute('DELETE FROM {folderstatistics}'.format(**tables))
+        cursor.execute(
+            'INSERT INTO {folderstatistics} (folder_id, num_shared_users) '
+            'SELECT d.id, COUNT(s.id) '
+            'FROM {folder} d LEFT JOIN {file} f ON f.folder_id = d.id '
+            'LEFT JOIN {sharedfile} s ON s.file_id = f.id '
+            'GROUP BY d.id'.format(**tables)
+        )
+    bump_model_version(UserStatistics)
+    bump_model_version(FolderStatistics)
@@ -0,0 +1,44 @@
+import time
+
+from brainbox.deletion import delete_folder, delete_user
+from brainbox.jobs import task
+from brainbox.models import User, Folder, File
+from brainbox.serializers import BULK_MAX_ITEMS, SharedFileBulkSerializer
+from brainbox.statistics import rebuild_statistics
+
+
+@task('share_file')
+def share_file(progress, file_id, shares):
+    file = File.objects.get(pk=file_id)
+    serializer = SharedFileBulkSerializer(data=shares, many=True, allow_empty=False, max_length=BULK_MAX_ITEMS, context={'file': file})
+    serializer.is_valid(raise_exception=True)
+    return {'created': len(serializer.save())}
+
+
+@task('delete_folder')
+def delete_folder_task(progress, folder_id):
+    folder = Folder.objects.filter(pk=folder_id).first()
+    # A retried job may find the folder already gone.
+    return delete_folder(folder, progress=progress) if folder else {}
+
+
+@task('delete_user')
+def delete_user_task(progress, user_id):
+    user = User.objects.filter(pk=user_id).first()
+    return delete_user(user, progress=progress) if user else {}
+
+
+@task('rebuild_statistics')
+def rebuild_statistics_task(progress, using=None):
+    tic = time.perf_counter()
+    rebuild_statistics(using)
+    progress('statistics', None, time.perf_counter() - tic)
+    return {}
+
+
+@task('load_bulk')
+def load_bulk(progress, **options):
+    from brainbox.management.commands.load_bulk import Command
+
+    Command().load(options, progress)
+    return {}
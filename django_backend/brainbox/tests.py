@@ -1,8 +1,34 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
 
+from brainbox import jobs, metrics, profiling, search
+from brainbox.counters import check_counters
+from brainbox.deletion import delete_folder, delete_user
+from brainbox.fake_data import data_gen
+from brainbox.hierarchy import rebuild_hierarchy
+from brainbox.management.commands.benchmark_api import APIBenchmark, cases, compare, dataset_sizes
+from brainbox.middleware import MetricsMiddleware, ReadYourWritesMiddleware
 from brainbox.models import *
+from brainbox.pagination import KeysetPagination
+from brainbox.routers import routing_scope
+from brainbox.statistics import rebuild_statistics
 
 
 class TestUsersByCharsWritten(TestCase):
@@ -34,19 +60,19 @@ class TestUsersByCharsWritten(TestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
-        self.assertEqual(response.data[0]['id'], self.user2.id)
-        self.assertEqual(response.data[0]['username'], self.user2.username)
-        self.assertEqual(response.data[0]['email'], self.user2.email)
-        self.assertEqual(response.data[0]['password'], self.user2.password)
-        self.assertEqual(response.data[0]['written_chars'], 3282)
+        self.assertEqual(response.data['results'][0]['id'], self.user2.id)
+        self.assertEqual(response.data['results'][0]['username'], self.user2.username)
+        self.assertEqual(response.data['results'][0]['email'], self.user2.email)
+        self.assertEqual(response.data['results'][0]['password'], self.user2.password)
+        self.assertEqual(response.data['results'][0]['written_chars'], 3282)
 
-        self.assertEqual(response.data[1]['id'], self.user1.id)
-        self.assertEqual(response.data[1]['username'], self.user1.username)
-        self.assertEqual(response.data[1]['email'], self.user1.email)
-        self.assertEqual(response.data[1]['password'], self.user1.password)
-        self.assertEqual(response.data[1]['written_chars'], 183)
+        self.assertEqual(response.data['results'][1]['id'], self.user1.id)
+        self.assertEqual(response.data['results'][1]['username'], self.user1.username)
+        self.assertEqual(response.data['results'][1]['email'], self.user1.email)
+        self.assertEqual(response.data['results'][1]['password'], self.user1.password)
+        self.assertEqual(response.data['results'][1]['written_chars'], 183)
 
 
 class TestFoldersByFilesSharedUsers(TestCase):
@@ -85,22 +111,1374 @@ class TestFoldersByFilesSharedUsers(TestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data['results']), 3)
+
+        self.assertEqual(response.data['results'][0]['id'], self.folder1.id)
+        self.assertEqual(response.data['results'][0]['name'], self.folder1.name)
+        self.assertEqual(response.data['results'][0]['user'], self.folder1.user.id)
+        self.assertEqual(response.data['results'][0]['parent_folder'], None)
+        self.assertEqual(response.data['results'][0]['num_shared_users'], 1)
+
+        self.assertEqual(response.data['results'][1]['id'], self.folder2.id)
+        self.assertEqual(response.data['results'][1]['name'], self.folder2.name)
+        self.assertEqual(response.data['results'][1]['user'], self.folder2.user.id)
+        self.assertEqual(response.data['results'][1]['parent_folder'], None)
+        self.assertEqual(response.data['results'][1]['num_shared_users'], 1)
+
+        self.assertEqual(response.data['results'][2]['id'], self.folder3.id)
+        self.assertEqual(response.data['results'][2]['name'], self.folder3.name)
+        self.assertEqual(response.data['results'][2]['user'], self.folder3.user.id)
+        self.assertEqual(response.data['results'][2]['parent_folder'], self.folder3.parent_folder.id)
+        self.assertEqual(response.data['results'][2]['num_shared_users'], 0)
+
+
+class TestKeysetPagination(TestCase):
+    def setUp(self) -> None:
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@gmail.com', password='123')
+            for i in range(5)
+        ]
+
+    def test_walk_forward_and_back(self):
+        response = self.client.get('/api/users/', {'pagination': 'cursor', 'per_page': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual([user['id'] for user in response.data['results']], [user.id for user in self.users[:2]])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([user['id'] for user in response.data['results']], [user.id for user in self.users[2:4]])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([user['id'] for user in response.data['results']], [self.users[4].id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([user['id'] for user in response.data['results']], [user.id for user in self.users[2:4]])
+
+    def test_statistics_ties_are_stable(self):
+        File.objects.create(name='a', content='abc', folder=None, user=self.users[3])
+
+        ids = []
+        response = self.client.get(reverse('users-by-chars-written'), {'pagination': 'cursor', 'per_page': 2})
+        while True:
+            ids.extend(user['id'] for user in response.data['results'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(ids, [self.users[3].id] + [user.id for user in self.users if user != self.users[3]])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/files/', {'cursor': 'garbage'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_year(self):
+        for year in ('abc', '0', '10000'):
+            with self.subTest(year=year):
+                response = self.client.get('/api/users/', {'year': year})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('year', response.data)
+
+    def test_cursor_values_of_the_wrong_type(self):
+        encode = KeysetPagination().encode_cursor
+        for position in (['abc'], [{'x': 1}], [None], [[1]]):
+            with self.subTest(position=position):
+                response = self.client.get('/api/files/', {'cursor': encode(position, False)})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/users/', {'year': 2020, 'cursor': encode(['yesterday', 1], False)})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/files/', {'cursor': encode(['1'], False)}).status_code, status.HTTP_200_OK)
+
+
+class TestPaginationCounts(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        for i in range(3):
+            User.objects.create(username=f'user{i}', email=f'user{i}@gmail.com', password='123')
+
+    def test_cached_count_is_invalidated_on_create_and_delete(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_is_estimate'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/', {'agg': 1})
+        self.assertEqual(response.data['count'], 3)
+
+        user = User.objects.create(username='user3', email='user3@gmail.com', password='123')
+        self.assertEqual(self.client.get('/api/users/').data['count'], 4)
+
+        user.delete()
+        self.assertEqual(self.client.get('/api/users/').data['count'], 3)
+
+    def test_cached_count_is_per_filter_set(self):
+        self.assertEqual(self.client.get('/api/users/').data['count'], 3)
+        self.assertEqual(self.client.get('/api/users/', {'username': 'user1'}).data['count'], 1)
+
+    def test_cached_count_follows_joined_models(self):
+        user = User.objects.get(username='user1')
+        Folder.objects.create(name='Games', user=user, parent_folder=None)
+        self.assertEqual(self.client.get('/api/folders/', {'username': 'user1'}).data['count'], 1)
+
+        user.username = 'renamed'
+        user.save()
+        self.assertEqual(self.client.get('/api/folders/', {'username': 'user1'}).data['count'], 0)
+        self.assertEqual(self.client.get('/api/folders/', {'username': 'renamed'}).data['count'], 1)
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        response = self.client.get('/api/users/', {'count': 'estimate'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertTrue(response.data['count_is_estimate'])
+
+        response = self.client.get('/api/users/', {'count': 'estimate', 'username': 'user1'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertFalse(response.data['count_is_estimate'])
+
+
+class TestStatisticsRollups(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder1 = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.folder2 = Folder.objects.create(name='Games', user=self.user1, parent_folder=self.folder1)
+        self.file = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder1, user=self.user1)
+        SharedFile.objects.create(user=self.user2, file=self.file, permission='R')
+
+    def assertRollups(self, written_chars, shared_users):
+        self.assertEqual(UserStatistics.objects.get(user=self.user1).written_chars, written_chars)
+        self.assertEqual(FolderStatistics.objects.get(folder=self.folder1).num_shared_users, shared_users[0])
+        self.assertEqual(FolderStatistics.objects.get(folder=self.folder2).num_shared_users, shared_users[1])
+
+    def test_maintained_by_signals(self):
+        self.assertRollups(11, (1, 0))
+
+        self.file.content = '- A Way Out\n- Unravel'
+        self.file.folder = self.folder2
+        self.file.save()
+        self.assertRollups(21, (0, 1))
+
+        SharedFile.objects.get(file=self.file).delete()
+        self.assertRollups(21, (0, 0))
+
+        self.file.delete()
+        self.assertRollups(0, (0, 0))
+
+    def test_rebuild_matches_signals(self):
+        self.file.content = 'edited'
+        self.file.save()
+        expected = list(UserStatistics.objects.order_by('user_id').values_list('user_id', 'written_chars'))
+
+        UserStatistics.objects.update(written_chars=0)
+        FolderStatistics.objects.update(num_shared_users=0)
+        call_command('rebuild_statistics', stdout=StringIO())
+
+        self.assertEqual(list(UserStatistics.objects.order_by('user_id').values_list('user_id', 'written_chars')), expected)
+        self.assertRollups(6, (1, 0))
+
+
+class TestCounterColumns(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder1 = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.folder2 = Folder.objects.create(name='Games', user=self.user1, parent_folder=None)
+
+    def assertCounters(self, file_id, personal_files, files, shared_users):
+        self.assertEqual(User.objects.get(pk=self.user1.pk).num_personal_files, personal_files)
+        self.assertEqual(Folder.objects.get(pk=self.folder1.pk).num_files, files[0])
+        self.assertEqual(Folder.objects.get(pk=self.folder2.pk).num_files, files[1])
+        if file_id is not None:
+            self.assertEqual(File.objects.get(pk=file_id).num_shared_users, shared_users)
+
+    def test_maintained_through_the_api(self):
+        response = self.client.post('/api/files/', {'name': 'Wishlist', 'content': '', 'folder': self.folder1.id, 'user': self.user1.id}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        file_id = response.data['id']
+        self.assertCounters(file_id, 1, (1, 0), 0)
+
+        response = self.client.post(f'/api/file/{file_id}/shared-users/', {'user': self.user2.id, 'permission': 'R'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertCounters(file_id, 1, (1, 0), 1)
+
+        response = self.client.patch(f'/api/file/{file_id}/', {'folder': self.folder2.id}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounters(file_id, 1, (0, 1), 1)
+
+        response = self.client.get('/api/files/')
+        self.assertEqual(response.data['results'][0]['num_shared_users'], 1)
+
+        self.client.delete(f'/api/file/{file_id}/shared-user/{self.user2.id}/')
+        self.assertCounters(file_id, 1, (0, 1), 0)
+
+        self.client.delete(f'/api/file/{file_id}/')
+        self.assertCounters(None, 0, (0, 0), None)
+
+    def test_check_and_repair(self):
+        File.objects.create(name='Wishlist', content='', folder=self.folder1, user=self.user1)
+        Folder.objects.filter(pk=self.folder1.pk).update(num_files=7)
+
+        self.assertEqual(check_counters()['Folder.num_files'], 1)
+        check_counters(repair=True)
+
+        self.assertEqual(check_counters(), {'User.num_personal_files': 0, 'Folder.num_files': 0, 'File.num_shared_users': 0})
+        self.assertCounters(None, 1, (1, 0), None)
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.folder = Folder.objects.create(name='Personal stuff', user=self.user, parent_folder=None)
+        self.file = File.objects.create(name='Wishlist', content='', folder=self.folder, user=self.user)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.query_plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_composite_indexes(self):
+        self.assertUsesIndex(File.objects.filter(user=self.user, folder=self.folder), 'file_user_folder_idx')
+        self.assertUsesIndex(File.objects.filter(folder=self.folder), 'brainbox_file_folder_id')
+        self.assertUsesIndex(Folder.objects.filter(user=self.user, parent_folder=None), 'folder_user_parent_idx')
+        self.assertUsesIndex(User.objects.filter(created_at__year__gte=2020).order_by('created_at'), 'user_created_at_idx')
+        self.assertUsesIndex(SharedFile.objects.filter(file=self.file), 'sharedfile_file_user_idx')
+
+    def test_contains_filters_use_trigram_index(self):
+        self.assertIn('brainbox_user_username_trgm VIRTUAL TABLE INDEX', self.query_plan(User.objects.filter(search.contains(User, 'username', 'athe'))))
+        self.assertIn('brainbox_folder_name_trgm VIRTUAL TABLE INDEX', self.query_plan(Folder.objects.filter(search.contains(Folder, 'name', 'stuff'))))
+
+        response = self.client.get('/api/users/', {'username': 'ATHE'})
+        self.assertEqual([user['id'] for user in response.data['results']], [self.user.id])
+        response = self.client.get('/api/folders/', {'name': 'STUFF'})
+        self.assertEqual([folder['id'] for folder in response.data['results']], [self.folder.id])
+
+
+class TestFileSearch(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.recipe = File.objects.create(name='Banana bread', content='Mash the bananas and fold them into the flour.', folder=None, user=self.user)
+        self.notes = File.objects.create(name='Notes', content='Buy bananas, eggs and flour.', folder=None, user=self.user)
+        self.wishlist = File.objects.create(name='Wishlist', content='- The Long Dark\n- A Way Out', folder=None, user=self.user)
+
+    def search(self, q):
+        return self.client.get(reverse('files-search'), {'q': q})
+
+    def test_ranking_and_snippets(self):
+        response = self.search('banana')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([file['id'] for file in response.data['results']], [self.recipe.id, self.notes.id])
+        self.assertIn('<mark>bananas</mark>', response.data['results'][1]['snippet'])
+        self.assertNotIn('content', response.data['results'][0])
+
+    def test_content_is_not_loaded(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.search('banana')
+        self.assertFalse(any('"brainbox_file"."content"' in query['sql'].split(' FROM ')[0] for query in queries))
+
+    def test_index_follows_updates_and_deletes(self):
+        self.wishlist.content = 'Banana split'
+        self.wishlist.save()
+        self.recipe.delete()
+
+        response = self.search('banana')
+        self.assertEqual({file['id'] for file in response.data['results']}, {self.notes.id, self.wishlist.id})
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"flour AND (eggs').data['count'], 1)
+        self.assertEqual(self.search('').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestFileSummaries(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.folder = Folder.objects.create(name='Personal stuff', user=self.user, parent_folder=None)
+        self.file = File.objects.create(name='Notes', content='x' * 500, folder=self.folder, user=self.user)
+
+    def test_list_renders_summary(self):
+        file = self.client.get('/api/files/').data['results'][0]
+
+        self.assertNotIn('content', file)
+        self.assertEqual(file['content_preview'], 'x' * CONTENT_PREVIEW_LENGTH)
+        self.assertEqual(file['content_length'], 500)
+        self.assertEqual(file['content_hash'], File.hash_content('x' * 500))
+        self.assertIn('content', File.objects.summaries().get().get_deferred_fields())
+
+    def test_nested_files_render_summary(self):
+        file = self.client.get(f'/api/folder/{self.folder.id}/').data['files'][0]
+
+        self.assertNotIn('content', file)
+        self.assertEqual(file['content_length'], 500)
+
+    def test_fields_do_not_narrow_nested_files(self):
+        for i in range(3):
+            File.objects.create(name=f'Notes {i}', content='x', folder=self.folder, user=self.user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/folder/{self.folder.id}/')
+        cache.clear()
+        with self.assertNumQueries(len(queries)):
+            files = self.client.get(f'/api/folder/{self.folder.id}/', {'fields': 'name'}).data['files']
+        self.assertEqual(files[0]['content_length'], 500)
+
+    def test_opt_in_to_content(self):
+        file = self.client.get('/api/files/', {'include': 'content'}).data['results'][0]
+        self.assertEqual(file['content'], 'x' * 500)
+
+        file = self.client.get('/api/files/', {'fields': 'id,name,content'}).data['results'][0]
+        self.assertEqual(set(file), {'id', 'name', 'content'})
+
+    def test_summary_follows_edits(self):
+        self.file.content = 'short'
+        self.file.save()
+
+        file = self.client.get('/api/files/').data['results'][0]
+        self.assertEqual(file['content_length'], 5)
+        self.assertEqual(file['content_hash'], File.hash_content('short'))
+
+
+class TestDetailQueryCounts(TestCase):
+    """
+    Detail endpoints must run the same number of queries whatever the
+    number of children they render: the validator query plus the rendering.
+    """
+    def setUp(self) -> None:
+        self.owner = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.parent = Folder.objects.create(name='Personal stuff', user=self.owner, parent_folder=None)
+        self.folder = Folder.objects.create(name='Games', user=self.owner, parent_folder=self.parent)
+        self.file = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder, user=self.owner)
+        self.num_children = 0
+
+    def add_children(self, count):
+        for _ in range(count):
+            self.num_children += 1
+            i = self.num_children
+            other = User.objects.create(username=f'user{i}', email=f'user{i}@gmail.com', password='123')
+            Folder.objects.create(name=f'Folder {i}', user=self.owner, parent_folder=self.folder)
+            File.objects.create(name=f'File {i}', content='', folder=self.folder, user=self.owner)
+            SharedFile.objects.create(user=other, file=self.file, permission='R')
+            SharedFile.objects.create(user=self.owner, file=File.objects.create(name=f'Shared {i}', content='', folder=None, user=other), permission='RW')
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, method, url, expected, data=None):
+        self.add_children(1)
+        self.assertEqual(self.count_queries(method, url, data), expected)
+        self.add_children(5)
+        self.assertEqual(self.count_queries(method, url, data), expected)
+
+    def test_user_detail(self):
+        self.assertConstantQueries('get', f'/api/user/{self.owner.id}/', 5)
+
+    def test_folder_detail(self):
+        self.assertConstantQueries('get', f'/api/folder/{self.folder.id}/', 3)
+
+    def test_file_detail(self):
+        self.assertConstantQueries('get', f'/api/file/{self.file.id}/', 3)
+
+    def test_file_update(self):
+        data = {'name': 'Wishlist', 'content': '- A Way Out', 'folder': self.folder.id}
+        self.add_children(1)
+        expected = self.count_queries('put', f'/api/file/{self.file.id}/', data)
+        self.add_children(5)
+        self.assertEqual(self.count_queries('put', f'/api/file/{self.file.id}/', data), expected)
+
+
+class TestBulkEndpoints(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder1 = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.folder2 = Folder.objects.create(name='Cooking', user=self.user2, parent_folder=None)
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def assertBookkeepingConsistent(self):
+        self.assertEqual(set(check_counters().values()), {0})
+        rollups = (
+            list(UserStatistics.objects.order_by('pk').values_list('pk', 'written_chars')),
+            list(FolderStatistics.objects.order_by('pk').values_list('pk', 'num_shared_users')),
+        )
+        call_command('rebuild_statistics', stdout=StringIO())
+        self.assertEqual(rollups, (
+            list(UserStatistics.objects.order_by('pk').values_list('pk', 'written_chars')),
+            list(FolderStatistics.objects.order_by('pk').values_list('pk', 'num_shared_users')),
+        ))
+
+    def files(self, count, folder=None, user=None):
+        return [
+            {'name': f'File {i}', 'content': 'x' * i, 'folder': folder.id if folder else None, 'user': (user or self.user1).id}
+            for i in range(count)
+        ]
+
+    def test_create_files(self):
+        response = self.post('/api/files/bulk/', self.files(3, folder=self.folder1))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([file['content_length'] for file in response.data], [0, 1, 2])
+        self.assertEqual(File.objects.filter(folder=self.folder1).count(), 3)
+        self.assertBookkeepingConsistent()
+
+    def test_create_files_without_content(self):
+        response = self.post('/api/files/bulk/', [{'name': 'Empty', 'user': self.user1.id}])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(File.objects.get().content, '')
+        self.assertEqual(response.data[0]['content_length'], 0)
+        self.assertBookkeepingConsistent()
+
+    def test_create_files_rejects_whole_batch(self):
+        data = self.files(2, folder=self.folder1) + self.files(1, folder=self.folder2)
+        response = self.post('/api/files/bulk/', data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[:2], [{}, {}])
+        self.assertEqual(response.data[2]['folder'], ['Folder must be created by the same user.'])
+        self.assertFalse(File.objects.exists())
+
+    def test_create_files_query_count_does_not_grow(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post('/api/files/bulk/', self.files(2, folder=self.folder1))
+        with CaptureQueriesContext(connection) as large:
+            self.post('/api/files/bulk/', self.files(20, folder=self.folder1))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_share_file(self):
+        file = File.objects.create(name='Wishlist', content='', folder=self.folder1, user=self.user1)
+        others = [User.objects.create(username=f'user{i}', email=f'user{i}@gmail.com', password='123') for i in range(3)]
+        data = [{'user': user.id, 'permission': 'R'} for user in others]
+
+        response = self.post(f'/api/file/{file.id}/shared-users/bulk/', data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([share['user']['id'] for share in response.data], [user.id for user in others])
+        self.assertEqual(File.objects.get(pk=file.pk).num_shared_users, 3)
+        self.assertBookkeepingConsistent()
+
+        response = self.post(f'/api/file/{file.id}/shared-users/bulk/', [{'user': self.user1.id, 'permission': 'R'}, data[0]])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0]['user'], ['User cannot be the owner of the file.'])
+        self.assertEqual(response.data[1]['user'], ['File is already shared with this user.'])
+
+    def test_move_files_into_folder(self):
+        files = [File.objects.create(name=f'File {i}', content='', folder=None, user=self.user1) for i in range(3)]
+        SharedFile.objects.create(user=self.user2, file=files[0], permission='R')
+
+        response = self.post(f'/api/folder/{self.folder1.id}/files/', [{'id': file.id} for file in files])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({file['folder'] for file in response.data}, {self.folder1.id})
+        self.assertEqual(Folder.objects.get(pk=self.folder1.pk).num_files, 3)
+        self.assertEqual(FolderStatistics.objects.get(pk=self.folder1.pk).num_shared_users, 1)
+        self.assertBookkeepingConsistent()
+
+        response = self.post(f'/api/folder/{self.folder2.id}/files/', [{'id': files[0].id}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0]['id'], ['File and folder must be created by the same user.'])
+
+
+class TestBulkLoad(TransactionTestCase):
+    def load(self, *args):
+        call_command('load_bulk', *args, stdout=StringIO())
+
+    def test_load_generated(self):
+        self.load('--generate', '--users', '50', '--folders', '60', '--files', '80', '--shares-per-file', '3',
+                  '--chunk-size', '20', '--workers', '1', '--batch-size', '7', '--transaction-size', '30')
+        self.assertEqual(
+            (User.objects.count(), Folder.objects.count(), File.objects.count(), SharedFile.objects.count()),
+            (50, 60, 80, 240)
+        )
+        self.assertEqual(set(check_counters().values()), {0})
+        self.assertEqual(UserStatistics.objects.count(), 50)
+        self.assertEqual(
+            sum(UserStatistics.objects.values_list('written_chars', flat=True)),
+            sum(File.objects.values_list('content_length', flat=True))
+        )
+
+        # The search indexes are rebuilt and their triggers are back in place.
+        file = File.objects.first()
+        word = file.content.split()[0].strip('.')
+        self.assertIn(file, search.search_files(File.objects.all(), word))
+        user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.assertEqual(list(User.objects.filter(search.contains(User, 'username', 'athe1'))), [user])
+
+    def test_load_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'user.csv'), 'w', newline='') as f:
+                f.write('id,username,email,password,num_personal_files,created_at,updated_at\n'
+                        '7,"o\'brien","ob@gmail.com",123,1,2023-01-01 00:00:00,2023-01-01 00:00:00\n')
+            with open(os.path.join(directory, 'folder.csv'), 'w', newline='') as f:
+                f.write('id,name,user_id,parent_folder_id,num_files,created_at,updated_at\n'
+                        '3,Recipes,7,\\N,0,2023-01-01 00:00:00,2023-01-01 00:00:00\n')
+            self.load('--csv', directory, '--truncate')
+
+        self.assertEqual(User.objects.get().username, "o'brien")
+        self.assertIsNone(Folder.objects.get().parent_folder)
+        # Counters missing from the source are repaired after the load.
+        self.assertEqual(User.objects.get().num_personal_files, 0)
+        self.assertTrue(UserStatistics.objects.filter(user_id=7).exists())
+
+    def test_load_manifest(self):
+        dataset = ['--users', '30', '--folders', '30', '--files', '40', '--shares-per-file', '2', '--chunk-size', '15']
+
+        def snapshot():
+            return [list(model.objects.order_by('pk').values_list()) for model in (User, Folder, File, SharedFile)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            with redirect_stdout(StringIO()):
+                data_gen.main(dataset + ['--format', 'csv', '--workers', '1', '--output-dir', directory])
+            self.load('--manifest', directory)
+        loaded = snapshot()
+
+        # The CSV parts round-trip to exactly what the generator streams.
+        self.load('--generate', '--truncate', '--workers', '1', *dataset)
+        self.assertEqual(loaded, snapshot())
+        self.assertEqual(SharedFile.objects.count(), 80)
+
+
+class TestDataGen(SimpleTestCase):
+    def test_same_rows_whatever_the_workers(self):
+        dataset = data_gen.Dataset(20, 30, 50, 2, chunk_size=8, seed=3)
+        for table in data_gen.TABLES:
+            with self.subTest(table=table):
+                rows = list(data_gen.iter_rows(dataset, table, workers=1))
+                self.assertEqual(len(rows), dataset.count(table))
+                self.assertEqual(list(data_gen.iter_rows(dataset, table, workers=2)), rows)
+
+    def test_chunks_are_bounded_and_self_contained(self):
+        dataset = data_gen.Dataset(20, 30, 50, 2, chunk_size=8)
+        self.assertEqual(dataset.num_chunks, 7)
+        folders = {}
+        for chunk in range(dataset.num_chunks):
+            users = dataset.id_range(dataset.num_users, chunk)
+            for table in ('user', 'folder', 'file'):
+                self.assertLessEqual(len(list(dataset.rows(table, chunk))), dataset.chunk_size)
+            for folder_id, _, user_id, *_ in dataset.rows('folder', chunk):
+                self.assertIn(user_id, users)
+                folders[folder_id] = user_id
+            for _, _, _, _, _, user_id, folder_id, *_ in dataset.rows('file', chunk):
+                self.assertIn(user_id, users)
+                if folder_id is not None:
+                    self.assertEqual(folders[folder_id], user_id)
+
+    def test_fewer_users_than_chunks(self):
+        dataset = data_gen.Dataset(5, 10, 100, 2, chunk_size=10)
+        self.assertEqual(dataset.num_chunks, 5)
+        for table in data_gen.TABLES:
+            self.assertEqual(len(list(data_gen.iter_rows(dataset, table, workers=1))), dataset.count(table))
+        with self.assertRaises(ValueError):
+            data_gen.Dataset(0, 10, 100, 0)
 
-        self.assertEqual(response.data[0]['id'], self.folder1.id)
-        self.assertEqual(response.data[0]['name'], self.folder1.name)
-        self.assertEqual(response.data[0]['user'], self.folder1.user.id)
-        self.assertEqual(response.data[0]['parent_folder'], None)
-        self.assertEqual(response.data[0]['num_shared_users'], 1)
 
-        self.assertEqual(response.data[1]['id'], self.folder2.id)
-        self.assertEqual(response.data[1]['name'], self.folder2.name)
-        self.assertEqual(response.data[1]['user'], self.folder2.user.id)
-        self.assertEqual(response.data[1]['parent_folder'], None)
-        self.assertEqual(response.data[1]['num_shared_users'], 1)
+@override_settings(BRAINBOX_DATABASE_ROUTING={
+    'primary': 'default',
+    'replicas': ['main'],
+    'models': {'brainbox.sharedfile': {'replicas': []}},
+})
+class TestDatabaseRouting(SimpleTestCase):
+    def test_reads_go_to_replicas_until_a_write(self):
+        with routing_scope() as scope:
+            self.assertEqual(router.db_for_read(File), 'main')
+            self.assertEqual(router.db_for_write(File), 'default')
+            self.assertEqual(router.db_for_read(File), 'default')
+        self.assertTrue(scope['wrote'])
 
-        self.assertEqual(response.data[2]['id'], self.folder3.id)
-        self.assertEqual(response.data[2]['name'], self.folder3.name)
-        self.assertEqual(response.data[2]['user'], self.folder3.user.id)
-        self.assertEqual(response.data[2]['parent_folder'], self.folder3.parent_folder.id)
-        self.assertEqual(response.data[2]['num_shared_users'], 0)
+        with routing_scope() as scope:
+            self.assertEqual(router.db_for_read(User), 'main')
+        self.assertFalse(scope['wrote'])
+
+    def test_per_model_routing(self):
+        with routing_scope():
+            self.assertEqual(router.db_for_read(SharedFile), 'default')
+
+    def test_client_reads_its_own_writes(self):
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(File))
+            if request.method == 'POST':
+                router.db_for_write(File)
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(view)
+        factory = RequestFactory()
+
+        response = middleware(factory.get('/api/files/'))
+        self.assertNotIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+        response = middleware(factory.post('/api/files/'))
+        self.assertIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+
+        request = factory.get('/api/files/')
+        request.COOKIES[ReadYourWritesMiddleware.cookie_name] = '1'
+        middleware(request)
+        self.assertEqual(reads, ['main', 'default', 'default'])
+
+
+class TestSqliteProfile(TestCase):
+    def test_defaults_outside_production(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 2)  # FULL
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+    def test_pragmas_applied_to_new_connections(self):
+        with override_settings(BRAINBOX_SQLITE_PRAGMAS={'synchronous': 'normal', 'busy_timeout': 5000}):
+            new = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                with new.cursor() as cursor:
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 5000)
+            finally:
+                new.close()
+
+    def test_benchmark(self):
+        stdout = StringIO()
+        call_command('benchmark_sqlite', '--seconds', '0.1', '--rows', '100', stdout=stdout)
+        self.assertIn('tuned:', stdout.getvalue())
+
+
+class TestResponseCache(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+
+    def test_cached_until_a_dependency_changes(self):
+        response = self.client.get('/api/users/?per_page=5&page=1')
+        self.assertEqual(response.data['results'][0]['num_personal_files'], 0)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/users/?page=1&per_page=5')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        # Creating a file changes the user's counter through an UPDATE, not a save.
+        File.objects.create(name='Wishlist', content='', folder=None, user=self.user)
+        response = self.client.get('/api/users/?per_page=5&page=1')
+        self.assertNotEqual(response['ETag'], cached['ETag'])
+        self.assertEqual(response.json()['results'][0]['num_personal_files'], 1)
+
+    def test_conditional_requests(self):
+        response = self.client.get(f'/api/user/{self.user.id}/')
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(f'/api/user/{self.user.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        not_modified = self.client.get(f'/api/user/{self.user.id}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(f'/api/user/{self.user.id}/', {'username': 'mathe14'}, content_type='application/json')
+        response = self.client.get(f'/api/user/{self.user.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['username'], 'mathe14')
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/files/search/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('ETag', self.client.get('/api/files/search/'))
+
+
+class TestDetailValidators(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.other = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder = Folder.objects.create(name='Games', user=self.user, parent_folder=None)
+        self.file = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder, user=self.user)
+
+    def assertChangesETag(self, url, change):
+        etag = self.client.get(url)['ETag']
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unrelated_writes_keep_the_etag(self):
+        url = f'/api/folder/{self.folder.id}/'
+        etag = self.client.get(url)['ETag']
+        File.objects.create(name='Other', content='', folder=None, user=self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_nested_changes_change_the_etag(self):
+        share = SharedFile.objects.create(user=self.other, file=self.file, permission='R')
+        self.assertChangesETag(f'/api/file/{self.file.id}/', lambda: SharedFile.objects.filter(pk=share.pk).update(permission='RW', updated_at=timezone.now()))
+        self.assertChangesETag(f'/api/file/{self.file.id}/', lambda: File.objects.create(name='Other', content='', folder=None, user=self.other))
+        self.assertChangesETag(f'/api/user/{self.other.id}/', lambda: File.objects.filter(pk=self.file.pk).update(name='Renamed', updated_at=timezone.now()))
+        self.assertChangesETag(f'/api/folder/{self.folder.id}/', lambda: File.objects.get(pk=self.file.pk).delete())
+
+    def test_deleted_children_change_last_modified(self):
+        SharedFile.objects.create(user=self.other, file=self.file, permission='R')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (User, Folder, File, SharedFile):
+            model.objects.update(updated_at=an_hour_ago)
+        url = f'/api/file/{self.file.id}/'
+        with mock.patch('brainbox.caching.time.time', return_value=time.time() - 60):
+            last_modified = self.client.get(url)['Last-Modified']
+        self.client.delete(f'/api/file/{self.file.id}/shared-user/{self.other.id}/')
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['shared_users'], [])
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_counter_changes_change_the_etag(self):
+        music = Folder.objects.create(name='Music', user=self.user, parent_folder=None)
+        updated_at = {folder.pk: folder.updated_at for folder in Folder.objects.all()}
+        self.assertChangesETag(f'/api/file/{self.file.id}/', lambda: File.objects.create(name='Other', content='', folder=self.folder, user=self.user))
+        self.assertChangesETag(f'/api/user/{self.user.id}/', lambda: self.client.patch(
+            f'/api/file/{self.file.id}/', {'folder': music.id}, content_type='application/json'
+        ))
+
+        # Counters are not edits of their row.
+        self.assertEqual({folder.pk: folder.updated_at for folder in Folder.objects.all()}, updated_at)
+        self.assertEqual(User.objects.get(pk=self.user.pk).updated_at, self.user.updated_at)
+
+    def test_if_match(self):
+        url = f'/api/file/{self.file.id}/'
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, {'name': 'Renamed'}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The client's copy is now stale.
+        response = self.client.patch(url, {'name': 'Again'}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(File.objects.get(pk=self.file.pk).name, 'Renamed')
+
+        # Updates answer with the ETag a GET now returns.
+        etag = self.client.patch(url, {'name': 'Again'}, content_type='application/json')['ETag']
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+
+class TestFolderTree(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.root = Folder.objects.create(name='Personal stuff', user=self.user, parent_folder=None)
+        self.games = Folder.objects.create(name='Games', user=self.user, parent_folder=self.root)
+        self.saves = Folder.objects.create(name='Saves', user=self.user, parent_folder=self.games)
+        self.music = Folder.objects.create(name='Music', user=self.user, parent_folder=self.root)
+        self.other_root = Folder.objects.create(name='Work', user=self.user, parent_folder=None)
+        self.wishlist = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.games, user=self.user)
+        self.save = File.objects.create(name='Save 1', content='x' * 500, folder=self.saves, user=self.user)
+        self.notes = File.objects.create(name='Notes', content='', folder=None, user=self.user)
+
+    def get_tree(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(b''.join(response.streaming_content))
+
+    def names(self, node):
+        return [node['name'], [self.names(child) for child in node['children']]]
+
+    def test_folder_tree(self):
+        with self.assertNumQueries(2):
+            tree = self.get_tree(f'/api/folder/{self.root.id}/tree/')
+        self.assertEqual(self.names(tree), ['Personal stuff', [['Games', [['Saves', []]]], ['Music', []]]])
+        self.assertEqual(tree['children'][0]['children'][0]['depth'], 2)
+        self.assertNotIn('files', tree)
+
+    def test_depth_limit(self):
+        tree = self.get_tree(f'/api/folder/{self.root.id}/tree/', depth=1)
+        self.assertEqual(self.names(tree), ['Personal stuff', [['Games', []], ['Music', []]]])
+        self.assertEqual(self.client.get(f'/api/folder/{self.root.id}/tree/', {'depth': -1}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'/api/folder/{self.root.id}/tree/', {'depth': 'all'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_files(self):
+        with self.assertNumQueries(3):
+            tree = self.get_tree(f'/api/folder/{self.root.id}/tree/', include='files')
+        games = tree['children'][0]
+        self.assertEqual(tree['files'], [])
+        self.assertEqual([file['id'] for file in games['files']], [self.wishlist.id])
+        save = games['children'][0]['files'][0]
+        self.assertEqual(save['content_preview'], 'x' * CONTENT_PREVIEW_LENGTH)
+        self.assertNotIn('content', save)
+
+    def test_user_tree(self):
+        tree = self.get_tree(f'/api/user/{self.user.id}/tree/', include='files')
+        self.assertEqual(tree['id'], self.user.id)
+        self.assertEqual([file['id'] for file in tree['files']], [self.notes.id])
+        self.assertEqual([folder['name'] for folder in tree['folders']], ['Personal stuff', 'Work'])
+        self.assertEqual(self.client.get('/api/user/0/tree/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cycles_stop_at_the_depth_limit(self):
+        Folder.objects.filter(pk=self.root.pk).update(parent_folder=self.saves)
+        tree = self.get_tree(f'/api/folder/{self.root.id}/tree/', depth=4)
+        self.assertEqual(tree['children'][0]['children'][0]['children'][0]['name'], 'Personal stuff')
+
+
+class TestFolderHierarchy(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.root = Folder.objects.create(name='Personal stuff', user=self.user, parent_folder=None)
+        self.games = Folder.objects.create(name='Games', user=self.user, parent_folder=self.root)
+        self.saves = Folder.objects.create(name='Saves', user=self.user, parent_folder=self.games)
+        self.work = Folder.objects.create(name='Work', user=self.user, parent_folder=None)
+        File.objects.create(name='Wishlist', content='- A Way Out', folder=self.games, user=self.user)
+        File.objects.create(name='Save 1', content='x' * 500, folder=self.saves, user=self.user)
+
+    def links(self):
+        return set(FolderClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_ancestors_and_descendants(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.saves.ancestors()), [self.games, self.root])
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.root.descendants()), {self.games, self.saves})
+        self.assertEqual(list(self.work.descendants()), [])
+
+    def test_move(self):
+        response = self.client.patch(f'/api/folder/{self.games.id}/', {'parent_folder': self.work.id}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.saves.ancestors()), [self.games, self.work])
+        self.assertEqual(list(self.root.descendants()), [])
+
+        self.client.patch(f'/api/folder/{self.games.id}/', {'parent_folder': None}, content_type='application/json')
+        self.assertEqual(list(self.saves.ancestors()), [self.games])
+
+        maintained = self.links()
+        rebuild_hierarchy()
+        self.assertEqual(self.links(), maintained)
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.root, self.saves):
+            response = self.client.patch(f'/api/folder/{self.root.id}/', {'parent_folder': parent.id}, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(Folder.objects.get(pk=self.root.pk).parent_folder_id)
+
+    def test_delete(self):
+        self.games.delete()
+        self.assertEqual(self.links(), {(self.root.id, self.root.id, 0), (self.work.id, self.work.id, 0)})
+
+    def test_subtree_totals(self):
+        data = self.client.get(f'/api/folder/{self.root.id}/').json()
+        self.assertEqual((data['total_files'], data['total_chars']), (2, 511))
+        data = self.client.get(f'/api/folder/{self.work.id}/').json()
+        self.assertEqual((data['total_files'], data['total_chars']), (0, 0))
+
+    def test_rebuild_detaches_cycles(self):
+        Folder.objects.filter(pk=self.root.pk).update(parent_folder=self.saves)
+        rebuild_hierarchy()
+        self.assertEqual(list(self.saves.ancestors()), [])
+        self.assertEqual(list(self.work.ancestors()), [])
+        self.assertIn((self.work.id, self.work.id, 0), self.links())
+
+
+class TestCascadingDelete(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.root = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.games = Folder.objects.create(name='Games', user=self.user1, parent_folder=self.root)
+        self.saves = Folder.objects.create(name='Saves', user=self.user1, parent_folder=self.games)
+        self.work = Folder.objects.create(name='Work', user=self.user1, parent_folder=None)
+        self.other = Folder.objects.create(name='Music', user=self.user2, parent_folder=None)
+        for i, folder in enumerate([self.root, self.games, self.saves, self.saves, self.work, None]):
+            file = File.objects.create(name=f'File {i}', content='x' * i, folder=folder, user=self.user1)
+            SharedFile.objects.create(user=self.user2, file=file, permission='R')
+        self.shared = File.objects.create(name='Playlist', content='Unravel', folder=self.other, user=self.user2)
+        SharedFile.objects.create(user=self.user1, file=self.shared, permission='RW')
+
+    def statistics(self):
+        return (
+            list(UserStatistics.objects.order_by('user_id').values_list('user_id', 'written_chars')),
+            list(FolderStatistics.objects.order_by('folder_id').values_list('folder_id', 'num_shared_users')),
+            set(FolderClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')),
+        )
+
+    def assertConsistent(self):
+        self.assertEqual(check_counters(), {'User.num_personal_files': 0, 'Folder.num_files': 0, 'File.num_shared_users': 0})
+        maintained = self.statistics()
+        rebuild_statistics()
+        rebuild_hierarchy()
+        self.assertEqual(self.statistics(), maintained)
+
+    def test_delete_folder(self):
+        response = self.client.delete(f'/api/folder/{self.games.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(set(Folder.objects.values_list('name', flat=True)), {'Personal stuff', 'Work', 'Music'})
+        self.assertEqual(File.objects.filter(user=self.user1).count(), 3)
+        self.assertEqual(SharedFile.objects.count(), 4)
+        self.assertConsistent()
+
+    def test_delete_user(self):
+        response = self.client.delete(f'/api/user/{self.user1.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(User.objects.filter(pk=self.user1.pk).exists())
+        self.assertEqual(list(Folder.objects.all()), [self.other])
+        self.assertEqual(list(File.objects.all()), [self.shared])
+        self.assertFalse(SharedFile.objects.exists())
+        self.assertConsistent()
+
+    def test_delete_file(self):
+        def count_queries(shares):
+            file = File.objects.create(name='Tmp', content='x', folder=self.games, user=self.user1)
+            for user in shares:
+                SharedFile.objects.create(user=user, file=file, permission='R')
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.delete(f'/api/file/{file.id}/')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            self.assertFalse(File.objects.filter(pk=file.pk).exists())
+            return len(context.captured_queries)
+
+        third = User.objects.create(username='kiki', email='kiki@gmail.com', password='123')
+        self.assertEqual(count_queries([self.user2]), count_queries([self.user2, third]))
+        self.assertConsistent()
+
+    def test_batches_and_progress(self):
+        steps = []
+        report = delete_user(self.user1, batch_size=1, progress=lambda step, rows, seconds: steps.append((step, rows)))
+        self.assertEqual(report, {'shares': 1, 'files': 6, 'folders': 4, 'users': 1})
+        self.assertEqual([rows for step, rows in steps if step == 'files'], [1, 2, 3, 4, 5, 6])
+        self.assertConsistent()
+
+    def test_queries_do_not_grow_with_the_subtree(self):
+        def count_queries():
+            folder = Folder.objects.create(name='Tmp', user=self.user1, parent_folder=None)
+            for i in range(File.objects.count()):
+                File.objects.create(name=f'Tmp {i}', content='', folder=folder, user=self.user1)
+            with CaptureQueriesContext(connection) as context:
+                delete_folder(folder)
+            return len(context.captured_queries)
+
+        self.assertEqual(count_queries(), count_queries())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('delete_tree', folder=self.root.id, stdout=out)
+        self.assertIn('folders: 3 rows', out.getvalue())
+        self.assertEqual(set(Folder.objects.values_list('name', flat=True)), {'Work', 'Music'})
+        self.assertConsistent()
+
+
+@override_settings(BRAINBOX_JOB_RETRY_DELAY=0)
+class TestJobs(TestCase):
+    def setUp(self) -> None:
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.file = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder, user=self.user1)
+
+    def run_worker(self):
+        call_command('run_worker', processes=0, burst=True, stdout=StringIO())
+
+    def test_delete_in_background(self):
+        response = self.client.delete(f'/api/folder/{self.folder.id}/', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertTrue(Folder.objects.filter(pk=self.folder.pk).exists())
+
+        self.run_worker()
+        self.assertFalse(Folder.objects.filter(pk=self.folder.pk).exists())
+        job = self.client.get(response['Location']).json()
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result'], {'files': 1, 'folders': 1})
+        self.assertEqual(job['progress']['step'], 'folders')
+
+    def test_bulk_shares_in_background(self):
+        data = [{'user': self.user2.id, 'permission': 'R'}]
+        response = self.client.post(f'/api/file/{self.file.id}/shared-users/bulk/', data, content_type='application/json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.run_worker()
+        self.assertEqual(File.objects.get(pk=self.file.pk).num_shared_users, 1)
+        self.assertEqual(Job.objects.get().result, {'created': 1})
+
+        # Invalid requests are still answered inline.
+        response = self.client.post(f'/api/file/{self.file.id}/shared-users/bulk/', [{'user': 0}], content_type='application/json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_statistics_rebuild(self):
+        UserStatistics.objects.update(written_chars=0)
+        response = self.client.post('/api/statistics/rebuild/')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.run_worker()
+        self.assertEqual(UserStatistics.objects.get(user=self.user1).written_chars, 11)
+
+    def test_retries(self):
+        jobs.TASKS['tests.fail'] = lambda progress: 1 / 0
+        self.addCleanup(jobs.TASKS.pop, 'tests.fail')
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+        self.run_worker()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        self.assertIn('ZeroDivisionError', job.error)
+
+    def test_background_load_is_not_retried(self):
+        call_command('load_bulk', '--generate', '--background', '--timeout', '7200', stdout=StringIO())
+        job = Job.objects.get(task='load_bulk')
+        self.assertEqual((job.max_attempts, job.timeout), (1, 7200))
+
+    def test_expired_leases_are_retried(self):
+        job = jobs.enqueue('rebuild_statistics')
+        self.assertEqual(jobs.claim('lost').pk, job.pk)
+        self.assertIsNone(jobs.claim('other'))
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        jobs.expire_leases()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertIn('lost', job.error)
+
+
+class TestJobTimeouts(TransactionTestCase):
+    def test_overrunning_job_is_killed(self):
+        jobs.TASKS['tests.sleep'] = lambda progress: time.sleep(30)
+        self.addCleanup(jobs.TASKS.pop, 'tests.sleep')
+        job = jobs.enqueue('tests.sleep', max_attempts=1, timeout=1)
+
+        tic = time.monotonic()
+        # Forks the job, with the command's signal handlers installed.
+        call_command('run_worker', processes=1, burst=True, poll_interval=0.1, stdout=StringIO())
+        self.assertLess(time.monotonic() - tic, 4)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIn('Timed out', job.error)
+
+
+class TestAsyncEndpoints(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user1 = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.user2 = User.objects.create(username='soia26602', email='soi02soia@gmail.com', password='12345678')
+        self.folder = Folder.objects.create(name='Personal stuff', user=self.user1, parent_folder=None)
+        self.file = File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder, user=self.user1)
+        SharedFile.objects.create(user=self.user2, file=self.file, permission='R')
+        call_command('rebuild_statistics', stdout=StringIO())
+
+    def assertSameResponses(self, path):
+        cache.clear()
+        expected = self.client.get(f'/api/{path}')
+        cache.clear()
+        response = self.client.get(f'/api/async/{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        # Pagination links point back at the async endpoint.
+        self.assertEqual(response.content.decode().replace('/api/async/', '/api/'), expected.content.decode())
+
+    def test_same_responses_as_the_sync_endpoints(self):
+        for path in (
+            'users/', 'users/?pagination=cursor&per_page=1', f'user/{self.user1.id}/',
+            'folders/?count=exact', f'folder/{self.folder.id}/',
+            'files/?pagination=cursor', 'files/search/?q=Wishlist', f'file/{self.file.id}/',
+            'statistics/users-by-chars-written/?pagination=cursor', 'statistics/folders-by-shared-users/',
+        ):
+            with self.subTest(path=path):
+                self.assertSameResponses(path)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/api/async/user/0/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/async/files/search/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/async/users/', {'cursor': 'garbage'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_client(self):
+        url = f'/api/async/file/{self.file.id}/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['shared_users'][0]['user']['id'], self.user2.id)
+
+        response = await self.async_client.get(url, IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        await sync_to_async(File.objects.filter(pk=self.file.pk).update)(name='Renamed', updated_at=timezone.now())
+        response = await self.async_client.get('/api/async/files/?pagination=cursor')
+        self.assertEqual(response.json()['results'][0]['name'], 'Renamed')
+
+
+@override_settings(BRAINBOX_PROFILING=True, BRAINBOX_SLOW_REQUEST_MS=10_000)
+class TestProfiling(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        profiling.reset_route_statistics()
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        self.folder = Folder.objects.create(name='Personal stuff', user=self.user, parent_folder=None)
+        File.objects.create(name='Wishlist', content='- A Way Out', folder=self.folder, user=self.user)
+
+    def timings(self, response):
+        return {
+            name: dict(part.split('=', 1) for part in params)
+            for name, *params in (metric.strip().split(';') for metric in response['Server-Timing'].split(','))
+        }
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/folder/{self.folder.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timings = self.timings(response)
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        self.assertGreater(float(timings['serialize']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+        # Served from the response cache: nothing is serialized.
+        timings = self.timings(self.client.get(f'/api/folder/{self.folder.id}/'))
+        self.assertEqual(float(timings['serialize']['dur']), 0)
+
+    def test_route_statistics(self):
+        for folder_id in (self.folder.id, self.folder.id, 0):
+            self.client.get(f'/api/folder/{folder_id}/')
+        self.client.get('/api/users/')
+
+        routes = {(route['method'], route['route']): route for route in self.client.get('/debug/perf/').json()['routes']}
+        folder = routes['GET', '/api/folder/<int:pk>/']
+        self.assertEqual(folder['count'], 3)
+        self.assertEqual(sum(folder['histogram'].values()), 3)
+        self.assertLessEqual(folder['p50_ms'], folder['max_ms'])
+        self.assertGreater(folder['mean_queries'], 0)
+        self.assertTrue(folder['slowest_statements'][0]['sql'].startswith('SELECT'))
+        self.assertNotIn('Personal stuff', json.dumps(folder))
+        self.assertEqual(routes['GET', '/api/users/']['count'], 1)
+
+        self.assertEqual(self.client.delete('/debug/perf/').status_code, status.HTTP_204_NO_CONTENT)
+        routes = self.client.get('/debug/perf/').json()['routes']
+        self.assertEqual([(route['method'], route['route']) for route in routes], [('DELETE', '/debug/perf/')])
+
+    def test_slow_requests_are_logged(self):
+        with override_settings(BRAINBOX_SLOW_REQUEST_MS=0), self.assertLogs('brainbox.profiling', 'WARNING') as logs:
+            self.client.get('/api/users/')
+        self.assertIn('Slow request: GET /api/users/ 200', logs.output[0])
+
+    async def test_async_requests(self):
+        # The test database connection predates the middleware, which a
+        # server's connections do not.
+        await sync_to_async(profiling.install)()
+        response = await self.async_client.get('/api/async/users/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.timings(response)['db']['desc'], '"0 queries"')
+
+    @override_settings(BRAINBOX_PROFILING=False)
+    def test_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/users/'))
+        self.assertEqual(self.client.get('/debug/perf/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        metrics.REGISTRY.reset()
+        self.user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+
+    def samples(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        return dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+
+    def test_requests(self):
+        for _ in range(2):
+            self.client.get(f'/api/user/{self.user.id}/')
+        self.client.get('/api/user/0/')
+        self.client.get(f'/api/user/{self.user.id}/', HTTP_IF_NONE_MATCH=self.client.get(f'/api/user/{self.user.id}/')['ETag'])
+
+        samples = self.samples()
+        route = 'method="GET",route="/api/user/<int:pk>/"'
+        self.assertEqual(samples[f'brainbox_http_requests_total{{{route},status="200"}}'], '3')
+        self.assertEqual(samples[f'brainbox_http_requests_total{{{route},status="404"}}'], '1')
+        self.assertEqual(samples[f'brainbox_http_requests_total{{{route},status="304"}}'], '1')
+        self.assertEqual(samples[f'brainbox_http_request_duration_seconds_bucket{{{route},le="+Inf"}}'], '5')
+        self.assertEqual(samples[f'brainbox_http_request_duration_seconds_count{{{route}}}'], '5')
+        self.assertEqual(samples[f'brainbox_http_response_size_bytes_bucket{{{route},le="+Inf"}}'], '5')
+        self.assertNotEqual(samples[f'brainbox_db_queries_bucket{{{route},le="0"}}'], '5')
+
+        route = 'route="/api/user/<int:pk>/"'
+        self.assertEqual(samples[f'brainbox_response_cache_requests_total{{{route},result="miss"}}'], '1')
+        self.assertEqual(samples[f'brainbox_response_cache_requests_total{{{route},result="hit"}}'], '2')
+        self.assertEqual(samples[f'brainbox_response_cache_requests_total{{{route},result="not_modified"}}'], '1')
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(BRAINBOX_METRICS_DIR=directory):
+            # Another worker's file.
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump({'brainbox_http_requests_total': [[['GET', '/api/users/', '200'], 4]]}, f)
+            self.client.get('/api/users/')
+            samples = self.samples()
+        self.assertEqual(samples['brainbox_http_requests_total{method="GET",route="/api/users/",status="200"}'], '5')
+
+    def test_serializers_are_not_patched(self):
+        with mock.patch.object(profiling, 'install') as install:
+            MetricsMiddleware(lambda request: HttpResponse())
+        install.assert_not_called()
+
+    @override_settings(BRAINBOX_METRICS=False)
+    def test_disabled(self):
+        self.client.get('/api/users/')
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(metrics.REGISTRY.collect()['brainbox_http_requests_total'], {})
+        self.assertEqual(metrics.REGISTRY.collect()['brainbox_response_cache_requests_total'], {})
+
+
+class TestAPIBenchmark(TransactionTestCase):
+    def test_every_case_succeeds(self):
+        sizes = dataset_sizes(200)
+        call_command('load_bulk', generate=True, workers=1, stdout=StringIO(), **sizes)
+
+        results = APIBenchmark(cases(sizes), requests=2, warmup=0).run()
+        self.assertIn('files deep cursor page', results)
+        self.assertIn('share file in bulk', results)
+        self.assertIn('delete user', results)
+        for name, result in results.items():
+            with self.subTest(case=name):
+                self.assertLess(result['status'], 400)
+                self.assertGreater(result['max_queries'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # The writes are rolled back.
+        self.assertEqual(SharedFile.objects.count(), sizes['files'] * sizes['shares_per_file'])
+        self.assertEqual((User.objects.count(), Folder.objects.count(), File.objects.count()),
+                         (sizes['users'], sizes['folders'], sizes['files']))
+        self.assertEqual(Job.objects.count(), 1)
+
+        self.assertEqual(compare(results, results, 0.2), [])
+        slower = {name: {**result, 'p50_ms': result['p50_ms'] * 2 + 1, 'max_queries': result['max_queries'] + 1}
+                  for name, result in results.items()}
+        regressions = compare(results, slower, 0.2)
+        self.assertEqual(len(regressions), 2 * len(results))
+        self.assertIn(('user detail', f"queries {results['user detail']['max_queries']} -> {slower['user detail']['max_queries']}"), regressions)
+
+
+class TestQueryCounts(TestCase):
+    """
+    The queries of every route must not grow with the rows it renders, and
+    must match brainbox/query_counts.json. Run with
+    BRAINBOX_UPDATE_QUERY_COUNTS=1 to rewrite the baseline after an
+    intended change, and review its diff.
+
+    Left out on purpose: PUT, which runs the same code as PATCH; the schema
+    views, `debug/perf/` and `metrics`, which do not touch the database.
+    """
+    baseline_path = os.path.join(os.path.dirname(__file__), 'query_counts.json')
+    child_counts = (1, 4)
+    queued = {'HTTP_PREFER': 'respond-async'}
+
+    def seed(self, children):
+        """
+        An owner with `children` folders under a root folder, `children`
+        files in each, every file shared with `children` users.
+        """
+        users = [
+            User.objects.create(username=f'user{children}_{i}', email=f'user{children}_{i}@gmail.com', password='123')
+            for i in range(children + 1)
+        ]
+        owner, others = users[0], users[1:]
+        root = Folder.objects.create(name=f'root{children}', user=owner, parent_folder=None)
+        files = [File.objects.create(name=f'Wishlist {children}', content='- A Way Out', folder=root, user=owner)]
+        for i in range(children):
+            folder = Folder.objects.create(name=f'folder{children}_{i}', user=owner, parent_folder=root)
+            files += [
+                File.objects.create(name=f'file{children}_{i}_{j}', content='x' * (j + 1), folder=folder, user=owner)
+                for j in range(children)
+            ]
+        for file in files:
+            for user in others:
+                SharedFile.objects.create(user=user, file=file, permission='R')
+        stranger = User.objects.create(username=f'stranger{children}', email=f'stranger{children}@gmail.com', password='123')
+        call_command('rebuild_statistics', stdout=StringIO())
+        return {
+            'owner': owner, 'shared_with': others[0], 'stranger': stranger,
+            'root': root, 'folder': folder, 'file': files[0], 'job': jobs.enqueue('rebuild_statistics'),
+        }
+
+    def cases(self, owner, shared_with, stranger, root, folder, file, job):
+        """
+        `(name, method, path, data[, headers])` of every route and method.
+        """
+        reads = [
+            ('users', '/api/users/'),
+            ('users cursor', '/api/users/?pagination=cursor'),
+            ('user', f'/api/user/{owner.id}/'),
+            ('folders', '/api/folders/'),
+            ('folders cursor', '/api/folders/?pagination=cursor'),
+            ('folder', f'/api/folder/{root.id}/'),
+            ('files', '/api/files/'),
+            ('files cursor', '/api/files/?pagination=cursor'),
+            ('files search', '/api/files/search/?q=Wishlist'),
+            ('file', f'/api/file/{file.id}/'),
+            ('users by chars written', '/api/statistics/users-by-chars-written/'),
+            ('folders by shared users', '/api/statistics/folders-by-shared-users/'),
+        ]
+        return [
+            *((name, 'GET', path, None) for name, path in reads),
+            # The async twins of the same read endpoints.
+            *((f'async {name}', 'GET', path.replace('/api/', '/api/async/', 1), None) for name, path in reads if 'cursor' not in name),
+            ('user tree', 'GET', f'/api/user/{owner.id}/tree/?include=files', None),
+            ('folder tree', 'GET', f'/api/folder/{root.id}/tree/?include=files', None),
+            ('job', 'GET', f'/api/jobs/{job.id}/', None),
+            ('create user', 'POST', '/api/users/', {'username': 'new', 'email': 'new@gmail.com', 'password': '123'}),
+            ('create folder', 'POST', '/api/folders/', {'name': 'New', 'user': owner.id, 'parent_folder': root.id}),
+            ('create file', 'POST', '/api/files/', {'name': 'New', 'content': 'x', 'folder': root.id, 'user': owner.id}),
+            ('create files in bulk', 'POST', '/api/files/bulk/', [{'name': 'New', 'content': 'x', 'folder': root.id, 'user': owner.id}]),
+            ('move files', 'POST', f'/api/folder/{folder.id}/files/', [{'id': file.id}]),
+            ('share file', 'POST', f'/api/file/{file.id}/shared-users/', {'user': stranger.id, 'permission': 'R'}),
+            ('share with user', 'POST', f'/api/user/{stranger.id}/shared-files/', {'file': file.id, 'permission': 'R'}),
+            ('share in bulk', 'POST', f'/api/file/{file.id}/shared-users/bulk/', [{'user': stranger.id, 'permission': 'R'}]),
+            ('share in bulk queued', 'POST', f'/api/file/{file.id}/shared-users/bulk/', [{'user': stranger.id, 'permission': 'R'}], self.queued),
+            ('rebuild statistics', 'POST', '/api/statistics/rebuild/', None),
+            ('update user', 'PATCH', f'/api/user/{owner.id}/', {'username': 'renamed'}),
+            ('update folder', 'PATCH', f'/api/folder/{root.id}/', {'name': 'Renamed'}),
+            ('update file', 'PATCH', f'/api/file/{file.id}/', {'name': 'Renamed'}),
+            ('update share', 'PATCH', f'/api/file/{file.id}/shared-user/{shared_with.id}/', {'permission': 'RW'}),
+            ('update shared file', 'PATCH', f'/api/user/{shared_with.id}/shared-file/{file.id}/', {'permission': 'RW'}),
+            ('delete user', 'DELETE', f'/api/user/{owner.id}/', None),
+            ('delete user queued', 'DELETE', f'/api/user/{owner.id}/', None, self.queued),
+            ('delete folder', 'DELETE', f'/api/folder/{root.id}/', None),
+            ('delete folder queued', 'DELETE', f'/api/folder/{root.id}/', None, self.queued),
+            ('delete file', 'DELETE', f'/api/file/{file.id}/', None),
+            ('delete share', 'DELETE', f'/api/file/{file.id}/shared-user/{shared_with.id}/', None),
+            ('delete shared file', 'DELETE', f'/api/user/{shared_with.id}/shared-file/{file.id}/', None),
+        ]
+
+    def count_queries(self, method, path, data, headers=None):
+        cache.clear()
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(
+                method, path, json.dumps(data) if data is not None else '', 'application/json', **(headers or {})
+            )
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 400, f'{method} {path}: {content[:200]}')
+        return len(queries)
+
+    def test_query_counts(self):
+        counts = {}
+        for children in self.child_counts:
+            for name, method, path, data, *headers in self.cases(**self.seed(children)):
+                counts.setdefault(name, {})[children] = self.count_queries(method, path, data, *headers)
+
+        growing = {name: by_children for name, by_children in counts.items() if len(set(by_children.values())) > 1}
+        self.assertEqual(growing, {}, 'Queries growing with the number of children.')
+
+        counts = {name: by_children[self.child_counts[0]] for name, by_children in counts.items()}
+        if os.environ.get('BRAINBOX_UPDATE_QUERY_COUNTS'):
+            with open(self.baseline_path, 'w') as f:
+                json.dump(counts, f, indent=2)
+                f.write('\n')
+        with open(self.baseline_path) as f:
+            baseline = json.load(f)
+        changed = {name: f'{baseline.get(name)} -> {count}' for name, count in counts.items() if baseline.get(name) != count}
+        self.assertEqual(changed, {}, f'Query counts differ from {self.baseline_path}.')
+
+
+class TestLoadTest(LiveServerTestCase):
+    def test_sync_and_async_targets(self):
+        user = User.objects.create(username='mathe13', email='matheandrei13.me@gmail.com', password='123')
+        out = StringIO()
+        call_command(
+            'load_test', '--target', f'wsgi={self.live_server_url}/api/', '--target', f'asgi={self.live_server_url}/api/async/',
+            '--path', 'users/?pagination=cursor', '--path', f'user/{user.id}/', concurrency=2, seconds=0.5, slow_clients=1,
+            stdout=out,
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        for line in lines[1:]:
+            self.assertIn('req/s', line)
+            self.assertTrue(line.endswith(' 0 errors'), line)
@@ -0,0 +1,114 @@
+import json
+
+from django.db import connections, router
+from rest_framework.utils.encoders import JSONEncoder
+
+from brainbox.models import CONTENT_PREVIEW_LENGTH, File, Folder
+from brainbox.serializers import FileSerializerList, FolderSerializerList
+
+
+def folder_roots(folder_id):
+    return 'id = %s', [folder_id]
+
+
+def user_roots(user_id):
+    return 'user_id = %s AND parent_folder_id IS NULL', [user_id]
+
+
+def _tree_cte(connection, roots, max_depth):
+    """
+    `WITH RECURSIVE tree(id, depth, tree_key)` over the folders below the
+    `roots` condition, down to `max_depth` (which also stops cycles).
+    Ordering by `tree_key`, the zero-padded ids from the root, walks the
+    tree depth first.
+    """
+    condition, params = roots
+    if connection.vendor == 'sqlite':
+        pad = "printf('%%020d', {})"
+    else:
+        pad = "LPAD(CAST({} AS VARCHAR(20)), 20, '0')"
+    table = Folder._meta.db_table
+    sql = (
+        f'WITH RECURSIVE tree(id, depth, tree_key) AS ('
+        f'SELECT id, 0, {pad.format("id")} FROM {table} WHERE {condition} '
+        f'UNION ALL '
+        f"SELECT f.id, t.depth + 1, t.tree_key || '/' || {pad.format('f.id')} "
+        f'FROM {table} f JOIN tree t ON f.parent_folder_id = t.id WHERE t.depth < %s'
+        f') '
+    )
+    return sql, params + [max_depth]
+
+
+def subtree_folders(roots, max_depth):
+    """
+    Folders of the subtrees below `roots` in depth-first order, annotated
+    with their `depth` (0 for the roots), streamed with a single query.
+    """
+    using = router.db_for_read(Folder)
+    cte, params = _tree_cte(connections[using], roots, max_depth)
+    sql = f'{cte}SELECT f.*, t.depth FROM tree t JOIN {Folder._meta.db_table} f ON f.id = t.id ORDER BY t.tree_key'
+    return Folder.objects.db_manager(using).raw(sql, params).iterator()
+
+
+def subtree_files(roots, max_depth):
+    """
+    Summaries of the files in the folders returned by `subtree_folders`,
+    in the same order, without their content.
+    """
+    using = router.db_for_read(File)
+    cte, params = _tree_cte(connections[using], roots, max_depth)
+    columns = ', '.join(
+        f'f.{field.column}' for field in File._meta.concrete_fields if field.name != 'content'
+    )
+    sql = (
+        f'{cte}SELECT {columns}, SUBSTR(f.content, 1, {CONTENT_PREVIEW_LENGTH}) AS content_preview '
+        f'FROM tree t JOIN {File._meta.db_table} f ON f.folder_id = t.id ORDER BY t.tree_key, f.id'
+    )
+    return File.objects.db_manager(using).raw(sql, params).iterator()
+
+
+def dumps(data):
+    return json.dumps(data, cls=JSONEncoder)
+
+
+def stream_files(files):
+    for index, file in enumerate(files):
+        yield (',' if index else '') + dumps(FileSerializerList(file).data)
+
+
+def stream_folders(folders, files=None):
+    """
+    JSON text chunks of the root nodes of a subtree, separated by commas.
+    `folders` come depth first with their `depth`; each node gets its
+    `children` and, when `files` (in the same order) are given, its `files`.
+    """
+    files = iter(files) if files is not None else None
+    pending_file = next(files, None) if files is not None else None
+    open_depths = []
+    need_comma = False
+
+    for folder in folders:
+        while open_depths and open_depths[-1] >= folder.depth:
+            open_depths.pop()
+            yield ']}'
+            need_comma = True
+        if need_comma:
+            yield ','
+
+        data = FolderSerializerList(folder).data
+        data['depth'] = folder.depth
+        yield dumps(data)[:-1]
+        if files is not None:
+            yield ',"files":['
+            count = 0
+            while pending_file is not None and pending_file.folder_id == folder.id:
+                yield (',' if count else '') + dumps(FileSerializerList(pending_file).data)
+                count += 1
+                pending_file = next(files, None)
+            yield ']'
+        yield ',"children":['
+        open_depths.append(folder.depth)
+        need_comma = False
+
+    for _ in open_depths:
+        yield ']}'
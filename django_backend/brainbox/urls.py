@@ -2,6 +2,7 @@ from django.urls import path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 from brainbox import views
+from brainbox.async_views import AsyncReadEndpoint
 
 urlpatterns = [
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -10,17 +11,35 @@ urlpatterns = [
 
     path('users/', views.UsersEndpoint.as_view()),
     path('user/<int:pk>/', views.UserEndpoint.as_view()),
+    path('user/<int:pk>/tree/', views.UserTreeEndpoint.as_view()),
     path('user/<int:pk>/shared-files/', views.UserSharedFilesEndpoint.as_view()),
     path('user/<int:user_id>/shared-file/<int:file_id>/', views.SharedFileEndpoint.as_view()),
     path('folders/', views.FoldersEndpoint.as_view()),
     path('folder/<int:pk>/', views.FolderEndpoint.as_view()),
+    path('folder/<int:pk>/tree/', views.FolderTreeEndpoint.as_view()),
+    path('folder/<int:pk>/files/', views.FolderFilesEndpoint.as_view()),
     path('files/', views.FilesEndpoint.as_view()),
+    path('files/search/', views.FileSearchEndpoint.as_view(), name='files-search'),
+    path('files/bulk/', views.FilesBulkEndpoint.as_view()),
     path('file/<int:pk>/', views.FileEndpoint.as_view()),
     path('file/<int:pk>/shared-users/', views.FileSharedFilesEndpoint.as_view()),
+    path('file/<int:pk>/shared-users/bulk/', views.FileSharedFilesBulkEndpoint.as_view()),
     path('file/<int:file_id>/shared-user/<int:user_id>/', views.SharedFileEndpoint.as_view()),
 
     path('statistics/users-by-chars-written/', views.UsersByCharsWritten.as_view(), name='users-by-chars-written'),
     path('statistics/folders-by-shared-users/', views.FoldersByFilesSharedUsers.as_view(), name='folders-by-shared-users'),
+    path('statistics/rebuild/', views.StatisticsRebuildEndpoint.as_view(), name='statistics-rebuild'),
 
-    # path('folder/<int:pk>/files/', views.FolderFilesEndpoint.as_view()),
+    path('jobs/<int:pk>/', views.JobEndpoint.as_view(), name='job'),
+
+    # Async twins of the read endpoints, for ASGI servers.
+    path('async/users/', AsyncReadEndpoint.as_view(endpoint=views.UsersEndpoint)),
+    path('async/user/<int:pk>/', AsyncReadEndpoint.as_view(endpoint=views.UserEndpoint)),
+    path('async/folders/', AsyncReadEndpoint.as_view(endpoint=views.FoldersEndpoint)),
+    path('async/folder/<int:pk>/', AsyncReadEndpoint.as_view(endpoint=views.FolderEndpoint)),
+    path('async/files/', AsyncReadEndpoint.as_view(endpoint=views.FilesEndpoint)),
+    path('async/files/search/', AsyncReadEndpoint.as_view(endpoint=views.FileSearchEndpoint)),
+    path('async/file/<int:pk>/', AsyncReadEndpoint.as_view(endpoint=views.FileEndpoint)),
+    path('async/statistics/users-by-chars-written/', AsyncReadEndpoint.as_view(endpoint=views.UsersByCharsWritten)),
+    path('async/statistics/folders-by-shared-users/', AsyncReadEndpoint.as_view(endpoint=views.FoldersByFilesSharedUsers)),
 ]
@@ -1,18 +1,176 @@
-from django.db.models import Sum, Count, OuterRef, Subquery
-from django.db.models.functions import Length, Coalesce
-from rest_framework import generics, mixins, views, status, pagination
+import hashlib
+import time
+from datetime import MAXYEAR, MINYEAR
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework import generics, mixins, views, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
+from brainbox import metrics, profiling, search, trees
+from brainbox.caching import get_response_cache, models_version, response_cache_key, version_since
+from brainbox.conditional import checksum, latest, validator_last_modified, validator_version
+from brainbox.counters import actual_count
+from brainbox.deletion import delete_file, delete_folder, delete_user
+from brainbox.hierarchy import subtree_totals
+from brainbox.jobs import enqueue
+from brainbox.pagination import Pagination
 from brainbox.serializers import *
 
 
-class Pagination(pagination.PageNumberPagination):
-    page_size = 25
-    page_size_query_param = 'per_page'
-    page_query_param = 'page'
+def file_queryset(request):
+    """
+    Files as rendered by FileSerializerList: without their body unless the
+    request opted in with `?include=content`.
+    """
+    context = {'request': request}
+    return File.objects.all() if include_content(context) else File.objects.summaries()
 
 
-class UsersEndpoint(generics.ListCreateAPIView):
+def respond_async(request):
+    """
+    Whether the client asked for the work to be queued rather than done
+    inline, with `Prefer: respond-async` (RFC 7240).
+    """
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def accepted(job):
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': reverse('job', args=[job.pk])})
+
+
+class FieldSelectionMixin:
+    """
+    Lets GET requests pick the rendered fields with `?fields=a,b,c`.
+    """
+    def get_serializer(self, *args, **kwargs):
+        fields = self.request.query_params.get('fields')
+        if fields and self.request.method == 'GET':
+            kwargs['fields'] = fields.split(',')
+        return super().get_serializer(*args, **kwargs)
+
+
+class RefetchOnUpdateMixin:
+    """
+    Re-reads the updated object through `get_queryset()`, so the response
+    is rendered from the same prefetched relations as a GET.
+    """
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+
+class CachedResponseMixin:
+    """
+    Serves GET requests from the response cache. The key covers the path,
+    the query parameters, the rendered format and the version of the data
+    the response is rendered from: by default the versions of
+    `cache_models`, every model the response reads, so a write to any of
+    them makes the entry unreachable. The ETag is derived from the key
+    alone: a matching If-None-Match is answered with a 304 before any
+    rendering.
+    """
+    cache_models = ()
+
+    def get_data_version(self):
+        """
+        `(version, last_modified)` of the data behind the response, where
+        `last_modified` is a timestamp or None when unknown. A None version
+        skips the cache.
+        """
+        return models_version(self.cache_models), None
+
+    def get_etag(self, request, version):
+        key = response_cache_key(request, version, request.accepted_renderer.format)
+        return key, quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        version, self.last_modified = self.get_data_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+        self.cache_key, self.etag = self.get_etag(request, version)
+        not_modified = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if not_modified is not None:
+            metrics.observe_cache(request, 'not_modified')
+            return not_modified
+
+        entry = get_response_cache().get(self.cache_key)
+        metrics.observe_cache(request, 'miss' if entry is None else 'hit')
+        if entry is None:
+            return super().get(request, *args, **kwargs)
+
+        content, content_type, last_modified = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(request, etag=self.etag, last_modified=last_modified, response=response)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK and hasattr(self, 'cache_key'):
+            last_modified = self.last_modified or int(time.time())
+            response.render()
+            response['ETag'] = self.etag
+            response['Last-Modified'] = http_date(last_modified)
+            get_response_cache().set(
+                self.cache_key, (response.content, response['Content-Type'], last_modified),
+                timeout=getattr(settings, 'BRAINBOX_RESPONSE_CACHE_TTL', 300)
+            )
+        return response
+
+
+class DetailValidatorMixin(CachedResponseMixin):
+    """
+    Versions a detail response by its object alone, in one query: the
+    `updated_at` and counters of the object and of the rows nested in it
+    (`validator_fields`), plus the count, latest `updated_at` and counter
+    checksums of each nested collection (`get_validator_annotations()`).
+    Last-Modified is when that version was first seen, so deleted children
+    and counter changes move it along with the ETag.
+
+    PUT and PATCH honour If-Match and If-Unmodified-Since with a 412 when
+    the object changed since the client read it.
+    """
+    validator_fields = ('updated_at',)
+
+    def get_validator_annotations(self):
+        return {}
+
+    def get_data_version(self):
+        model = self.get_serializer_class().Meta.model
+        annotations = self.get_validator_annotations()
+        values = model.objects.filter(pk=self.kwargs['pk']).annotate(**annotations).values_list(
+            *self.validator_fields, *annotations
+        ).first()
+        if values is None:
+            return None, None
+        version = validator_version(values)
+        name = f"{model._meta.label_lower}:{self.kwargs['pk']}"
+        return version, version_since(name, version, floor=validator_last_modified(values))
+
+    def update(self, request, *args, **kwargs):
+        version, last_modified = self.get_data_version()
+        if version is not None:
+            _, etag = self.get_etag(request, version)
+            failed = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if failed is not None:
+                return failed
+
+        response = super().update(request, *args, **kwargs)
+        version, last_modified = self.get_data_version()
+        if response.status_code == status.HTTP_200_OK and version is not None:
+            _, response['ETag'] = self.get_etag(request, version)
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class UsersEndpoint(CachedResponseMixin, generics.ListCreateAPIView):
+    cache_models = (User, File)
     serializer_class = UserSerializerList
     pagination_class = Pagination
 
@@ -21,35 +179,58 @@ class UsersEndpoint(generics.ListCreateAPIView):
 
         username = self.request.query_params.get('username')
         year = self.request.query_params.get('year')
-        agg = self.request.query_params.get('agg')
-
-        if agg:
-            queryset = User.objects.annotate(
-                num_personal_files=Coalesce(Subquery(
-                    File.objects.filter(user=OuterRef('pk')).values('user').annotate(count=Count('id')).values('count')
-                ), 0)
-            )
 
-        filters = {}
         if username:
-            filters['username__icontains'] = username
+            queryset = queryset.filter(search.contains(User, 'username', username))
         if year:
-            filters['created_at__year__gte'] = year
-
-        if filters:
-            queryset = queryset.objects.filter(**filters)
-            if year:
-                queryset = queryset.order_by('created_at')
+            try:
+                year = int(year)
+            except ValueError:
+                year = 0
+            if not MINYEAR <= year <= MAXYEAR:
+                raise ValidationError({'year': [f'Expected a year between {MINYEAR} and {MAXYEAR}.']})
+            queryset = queryset.filter(created_at__year__gte=year).order_by('created_at')
 
         return queryset
 
+    def get_keyset_ordering(self):
+        if self.request.query_params.get('year'):
+            return 'created_at', 'id'
+        return 'id',
+
 
-class UserEndpoint(generics.RetrieveUpdateDestroyAPIView):
-    queryset = User.objects.all()
+class UserEndpoint(DetailValidatorMixin, RefetchOnUpdateMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializerDetail
 
+    def get_validator_annotations(self):
+        return {
+            'folders_count': actual_count(Folder, 'user'),
+            'folders_updated_at': latest(Folder, 'user'),
+            'shared_files_count': actual_count(SharedFile, 'user'),
+            'shared_files_updated_at': latest(SharedFile, 'user'),
+            'files_updated_at': latest(SharedFile, 'user', 'file__updated_at'),
+            'folders_num_files': checksum(Folder, 'user', 'num_files'),
+            'files_num_shared_users': checksum(SharedFile, 'user', 'file__num_shared_users'),
+        }
+
+    def get_queryset(self):
+        return User.objects.prefetch_related(
+            'folders',
+            Prefetch('shared_files', queryset=SharedFile.objects.order_by('id')),
+            Prefetch('shared_files__file', queryset=file_queryset(self.request)),
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        if respond_async(request):
+            return accepted(enqueue('delete_user', user_id=self.get_object().pk))
+        return super().destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        delete_user(instance)
 
-class FoldersEndpoint(generics.ListCreateAPIView):
+
+class FoldersEndpoint(CachedResponseMixin, generics.ListCreateAPIView):
+    cache_models = (Folder, User, File)
     serializer_class = FolderSerializerList
     pagination_class = Pagination
 
@@ -58,31 +239,38 @@ class FoldersEndpoint(generics.ListCreateAPIView):
 
         username = self.request.query_params.get('username')
         name = self.request.query_params.get('name')
-        agg = self.request.query_params.get('agg')
-
-        if agg:
-            queryset = Folder.objects.annotate(
-                num_files=Coalesce(Subquery(
-                    File.objects.filter(folder=OuterRef('pk')).values('folder').annotate(count=Count('id')).values(
-                        'count')
-                ), 0)
-            )
 
         filters = {}
         if username:
             filters['user__username'] = username
-        if name:
-            filters['name__icontains'] = name
 
+        if name:
+            queryset = queryset.filter(search.contains(Folder, 'name', name))
         if filters:
-            queryset = queryset.objects.filter(**filters)
+            queryset = queryset.filter(**filters)
 
         return queryset
 
 
-class FolderEndpoint(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Folder.objects.all()
+class FolderEndpoint(DetailValidatorMixin, RefetchOnUpdateMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = FolderSerializerDetail
+    validator_fields = (
+        'updated_at', 'user__updated_at', 'user__num_personal_files',
+        'parent_folder__updated_at', 'parent_folder__num_files',
+    )
+
+    def get_validator_annotations(self):
+        return {
+            'files_count': actual_count(File, 'folder'),
+            'files_updated_at': latest(File, 'folder'),
+            'files_num_shared_users': checksum(File, 'folder', 'num_shared_users'),
+            **subtree_totals(),
+        }
+
+    def get_queryset(self):
+        return Folder.objects.select_related('user', 'parent_folder').annotate(**subtree_totals()).prefetch_related(
+            Prefetch('files', queryset=file_queryset(self.request))
+        )
 
     def get_serializer(self, *args, **kwargs):
         serializer_class = self.get_serializer_class()
@@ -92,30 +280,63 @@ class FolderEndpoint(generics.RetrieveUpdateDestroyAPIView):
             serializer.fields['parent_folder'] = serializers.PrimaryKeyRelatedField(allow_null=True, queryset=Folder.objects.all(), required=False)
         return serializer
 
+    def destroy(self, request, *args, **kwargs):
+        if respond_async(request):
+            return accepted(enqueue('delete_folder', folder_id=self.get_object().pk))
+        return super().destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        delete_folder(instance)
+
 
-class FilesEndpoint(generics.ListCreateAPIView):
+class FilesEndpoint(CachedResponseMixin, FieldSelectionMixin, generics.ListCreateAPIView):
+    cache_models = (File, SharedFile)
     serializer_class = FileSerializerList
     pagination_class = Pagination
 
     def get_queryset(self):
-        queryset = File.objects.all()
+        # Only here does `?fields=` narrow the rendered fields (see
+        # FieldSelectionMixin); nested file lists render every column.
+        queryset = file_queryset(self.request)
+        fields = self.request.query_params.get('fields')
+        if fields:
+            columns = {field.name for field in File._meta.concrete_fields}
+            queryset = queryset.only('id', *(field for field in fields.split(',') if field in columns))
+        return queryset
 
-        agg = self.request.query_params.get('agg')
 
-        if agg:
-            queryset = File.objects.annotate(
-                num_shared_users=Coalesce(Subquery(
-                    SharedFile.objects.filter(file=OuterRef('pk')).values('file').annotate(count=Count('id')).values(
-                        'count')
-                ), 0)
-            )
+class FileSearchEndpoint(CachedResponseMixin, generics.ListAPIView):
+    cache_models = (File, SharedFile)
+    serializer_class = FileSearchSerializer
+    pagination_class = Pagination
+    keyset_ordering = ('-rank', 'id')
 
-        return queryset
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': ['This query parameter is required.']})
+        return search.search_files(File.objects.defer('content'), text)
 
 
-class FileEndpoint(generics.RetrieveUpdateDestroyAPIView):
-    queryset = File.objects.all()
+class FileEndpoint(DetailValidatorMixin, RefetchOnUpdateMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = FileSerializerDetail
+    validator_fields = (
+        'updated_at', 'user__updated_at', 'user__num_personal_files',
+        'folder__updated_at', 'folder__num_files',
+    )
+
+    def get_validator_annotations(self):
+        return {
+            'shared_users_count': actual_count(SharedFile, 'file'),
+            'shared_users_updated_at': latest(SharedFile, 'file'),
+            'users_updated_at': latest(SharedFile, 'file', 'user__updated_at'),
+            'users_num_personal_files': checksum(SharedFile, 'file', 'user__num_personal_files'),
+        }
+
+    def get_queryset(self):
+        return File.objects.select_related('user', 'folder').prefetch_related(
+            Prefetch('sharedfile_set', queryset=SharedFile.objects.select_related('user').order_by('id'))
+        )
 
     def get_serializer(self, *args, **kwargs):
         serializer_class = self.get_serializer_class()
@@ -125,6 +346,29 @@ class FileEndpoint(generics.RetrieveUpdateDestroyAPIView):
             serializer.fields['folder'] = serializers.PrimaryKeyRelatedField(allow_null=True, queryset=Folder.objects.all(), required=False)
         return serializer
 
+    def perform_destroy(self, instance):
+        delete_file(instance)
+
+
+class FilesBulkEndpoint(views.APIView):
+    def post(self, request):
+        serializer = FileBulkSerializer(data=request.data, many=True, allow_empty=False, max_length=BULK_MAX_ITEMS)
+        if serializer.is_valid():
+            files = serializer.save()
+            return Response(FileSerializerList(files, many=True).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class FolderFilesEndpoint(views.APIView):
+    def post(self, request, pk):
+        folder = get_object_or_404(Folder, id=pk)
+        serializer = FolderFilesSerializer(data=request.data, many=True, allow_empty=False, max_length=BULK_MAX_ITEMS, context={'folder': folder})
+        if serializer.is_valid():
+            files = serializer.save()
+            files = File.objects.summaries().filter(pk__in=[file.pk for file in files]).order_by('id')
+            return Response(FileSerializerList(files, many=True).data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 
 class UserSharedFilesEndpoint(views.APIView):
     def post(self, request, pk):
@@ -150,6 +394,18 @@ class FileSharedFilesEndpoint(views.APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class FileSharedFilesBulkEndpoint(views.APIView):
+    def post(self, request, pk):
+        file = get_object_or_404(File, id=pk)
+        serializer = SharedFileBulkSerializer(data=request.data, many=True, allow_empty=False, max_length=BULK_MAX_ITEMS, context={'file': file})
+        if serializer.is_valid():
+            if respond_async(request):
+                return accepted(enqueue('share_file', file_id=file.pk, shares=request.data))
+            shares = serializer.save()
+            return Response(SharedFileSerializer(shares, many=True, exclude_fields=['file']).data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class SharedFileEndpoint(mixins.UpdateModelMixin, mixins.DestroyModelMixin, generics.GenericAPIView):
     queryset = SharedFile.objects.all()
     serializer_class = SharedFileSerializer
@@ -173,30 +429,114 @@ class SharedFileEndpoint(mixins.UpdateModelMixin, mixins.DestroyModelMixin, gene
         return self.destroy(request, *args, **kwargs)
 
 
-class UsersByCharsWritten(generics.ListAPIView):
+class TreeMixin:
+    """
+    Stream a folder subtree as nested JSON, fetched with one recursive query
+    (plus one for the files with `?include=files`), down to `?depth=` levels
+    below its roots, at most BRAINBOX_TREE_MAX_DEPTH.
+    """
+
+    def get_depth(self):
+        max_depth = getattr(settings, 'BRAINBOX_TREE_MAX_DEPTH', 32)
+        depth = self.request.query_params.get('depth')
+        if depth is None:
+            return max_depth
+        try:
+            depth = int(depth)
+        except ValueError:
+            depth = -1
+        if not 0 <= depth <= max_depth:
+            raise ValidationError({'depth': [f'Expected an integer between 0 and {max_depth}.']})
+        return depth
+
+    def include_files(self):
+        return 'files' in self.request.query_params.get('include', '').split(',')
+
+    def stream_folders(self, roots):
+        depth = self.get_depth()
+        files = trees.subtree_files(roots, depth) if self.include_files() else None
+        return trees.stream_folders(trees.subtree_folders(roots, depth), files)
+
+
+class FolderTreeEndpoint(TreeMixin, views.APIView):
+    def get(self, request, pk):
+        get_object_or_404(Folder, id=pk)
+        return StreamingHttpResponse(self.stream_folders(trees.folder_roots(pk)), content_type='application/json')
+
+
+class UserTreeEndpoint(TreeMixin, views.APIView):
+    def get(self, request, pk):
+        user = get_object_or_404(User, id=pk)
+        folders = self.stream_folders(trees.user_roots(user.pk))
+        return StreamingHttpResponse(self.stream_user(user, folders), content_type='application/json')
+
+    def stream_user(self, user, folders):
+        yield trees.dumps(UserSerializerList(user).data)[:-1]
+        if self.include_files():
+            yield ',"files":['
+            yield from trees.stream_files(File.objects.summaries().filter(user=user, folder=None).order_by('id').iterator())
+            yield ']'
+        yield ',"folders":['
+        yield from folders
+        yield ']}'
+
+
+class UsersByCharsWritten(CachedResponseMixin, generics.ListAPIView):
+    cache_models = (UserStatistics, User, File)
     serializer_class = UsersByCharsWrittenSerializer
     pagination_class = Pagination
+    keyset_ordering = ('-written_chars', 'user_id')
 
     def get_queryset(self):
-        queryset = User.objects.annotate(written_chars=Sum(Length('personal_files__content'))).order_by('-written_chars')
+        queryset = UserStatistics.objects.select_related('user').order_by('-written_chars', 'user_id')
         return queryset
 
 
-class FoldersByFilesSharedUsers(generics.ListAPIView):
+class FoldersByFilesSharedUsers(CachedResponseMixin, generics.ListAPIView):
+    cache_models = (FolderStatistics, Folder, File, SharedFile)
     serializer_class = FoldersByFilesSharedUsersSerializer
     pagination_class = Pagination
+    keyset_ordering = ('-num_shared_users', 'folder_id')
 
     def get_queryset(self):
-        queryset = Folder.objects.annotate(num_shared_users=Count('files__shared_users')).order_by('-num_shared_users')
+        queryset = FolderStatistics.objects.select_related('folder').order_by('-num_shared_users', 'folder_id')
         return queryset
 
 
-# class FolderFilesEndpoint(views.APIView):
-#     def post(self, request, pk):
-#         serializer = FolderFilesSerializerList(data=request.data, many=True)
-#         folder = get_object_or_404(Folder, id=pk)
-#         serializer.context['folder'] = folder
-#         if serializer.is_valid():
-#             serializer.save(folder=folder, using='')
-#             return Response(serializer.data, status=status.HTTP_201_CREATED)
-#         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class StatisticsRebuildEndpoint(views.APIView):
+    def post(self, request):
+        return accepted(enqueue('rebuild_statistics'))
+
+
+class JobEndpoint(generics.RetrieveAPIView):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+
+class PerfEndpoint(views.APIView):
+    """
+    Per-route statistics of the requests this process served since it
+    started (or since a DELETE), when BRAINBOX_PROFILING is on.
+    """
+    def initial(self, request, *args, **kwargs):
+        if not profiling.profiling_enabled():
+            raise NotFound
+        super().initial(request, *args, **kwargs)
+
+    def get(self, request):
+        return Response({'routes': profiling.route_statistics()})
+
+    def delete(self, request):
+        profiling.reset_route_statistics()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MetricsEndpoint(views.APIView):
+    """
+    The metrics of all server processes, in the Prometheus text exposition
+    format.
+    """
+    def get(self, request):
+        if not metrics.metrics_enabled():
+            raise NotFound
+        return HttpResponse(metrics.REGISTRY.exposition(), content_type=metrics.CONTENT_TYPE)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,7 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'brainbox.middleware.ProfilingMiddleware',
+    'brainbox.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'brainbox.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,17 +85,53 @@ WSGI_APPLICATION = 'django_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Production profile, on with BRAINBOX_PRODUCTION=1 in the environment:
+# persistent connections and the tuned SQLite pragmas below. Development
+# and tests keep Django's defaults.
+BRAINBOX_PRODUCTION = os.environ.get('BRAINBOX_PRODUCTION') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600 if BRAINBOX_PRODUCTION else 0,
+        'CONN_HEALTH_CHECKS': BRAINBOX_PRODUCTION,
     },
     'main': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'maindb.sqlite3',
+        'CONN_MAX_AGE': 600 if BRAINBOX_PRODUCTION else 0,
+        'CONN_HEALTH_CHECKS': BRAINBOX_PRODUCTION,
+        'TEST': {'MIRROR': 'default'},
     }
 }
 
+# Pragmas of the production profile; compare with `manage.py
+# benchmark_sqlite`.
+BRAINBOX_SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB
+    'busy_timeout': 5000,  # ms
+    'temp_store': 'memory',
+}
+# Applied to every new SQLite connection (see brainbox.database).
+BRAINBOX_SQLITE_PRAGMAS = BRAINBOX_SQLITE_PRODUCTION_PRAGMAS if BRAINBOX_PRODUCTION else {}
+
+DATABASE_ROUTERS = ['brainbox.routers.PrimaryReplicaRouter']
+
+# Writes go to 'primary' and reads to one of the 'replicas', per model when
+# listed under 'models' by label (e.g. 'brainbox.file': {'replicas': []}).
+# Only list 'main' once it is kept in sync with 'default' by replication.
+BRAINBOX_DATABASE_ROUTING = {
+    'primary': 'default',
+    'replicas': [],
+    'models': {},
+}
+# Seconds a client's reads stay on the primary after it wrote.
+BRAINBOX_REPLICA_LAG = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -137,3 +177,47 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Total counts of paginated listings: 'exact', 'cached' or 'estimate'
+# (clients may override it per request with ?count=).
+BRAINBOX_COUNT_STRATEGY = 'cached'
+BRAINBOX_COUNT_CACHE_TTL = 300
+
+# CACHES alias holding rendered GET responses (defaults to BRAINBOX_CACHE).
+# Any backend works, e.g. FileBasedCache or RedisCache; with several server
+# processes both caches must be shared, since they hold the model versions
+# that invalidate the entries.
+BRAINBOX_RESPONSE_CACHE = 'default'
+BRAINBOX_RESPONSE_CACHE_TTL = 300
+
+# Deepest level of a /tree/ response; it also bounds the walk of any cycle
+# in the folder hierarchy.
+BRAINBOX_TREE_MAX_DEPTH = 32
+
+# Background jobs (manage.py run_worker): seconds before a running job is
+# killed, attempts before it is marked failed, and the delay before the
+# first retry, doubled for every further one.
+BRAINBOX_JOB_TIMEOUT = 600
+BRAINBOX_JOB_MAX_ATTEMPTS = 3
+BRAINBOX_JOB_RETRY_DELAY = 10
+
+# Request profiling (brainbox.middleware.ProfilingMiddleware): Server-Timing
+# headers, logging of requests slower than BRAINBOX_SLOW_REQUEST_MS and
+# per-route statistics at /debug/perf/. Off unless enabled here.
+BRAINBOX_PROFILING = False
+BRAINBOX_SLOW_REQUEST_MS = 500
+
+# Prometheus metrics (brainbox.middleware.MetricsMiddleware) at /metrics.
+# With several server processes, e.g. gunicorn workers, point
+# BRAINBOX_METRICS_DIR at a directory they share and clear it on (re)start:
+# each process writes its samples there at most every
+# BRAINBOX_METRICS_FLUSH_INTERVAL seconds, and /metrics adds them up.
+BRAINBOX_METRICS = True
+BRAINBOX_METRICS_DIR = None
+BRAINBOX_METRICS_FLUSH_INTERVAL = 1
@@ -17,8 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from brainbox.views import MetricsEndpoint, PerfEndpoint
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls')),
     path('api/', include('brainbox.urls')),
+    path('debug/perf/', PerfEndpoint.as_view()),
+    path('metrics', MetricsEndpoint.as_view()),
 ]
@@ -6,6 +6,9 @@ export interface File {
     id: number;
     name: string;
     content: string;
+    content_preview?: string;
+    content_length?: number;
+    content_hash?: string;
     user: number | User;
     folder: number | Folder;
     created_at: string;